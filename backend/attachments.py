@@ -0,0 +1,311 @@
+# backend/attachments.py
+#
+# Size budget for the drawings attached to sales emails.
+# Before a lead's email is built, its uploaded drawings are prepared in a
+# process pool, so image work never competes with the API process for the GIL.
+# The inquiry PDFs are rendered in the same pool (render_pdf), for the same reason.
+# The pool is started by the first lead that needs it (or warm_pool()), with
+# DRAWING_PREP_WORKERS processes of ~75 MB each. 0 runs the work in the calling
+# thread instead, for hosts where memory matters more than /chat latency.
+# Raster images are downscaled to DRAWING_MAX_PIXELS on the long edge and
+# re-encoded (kept only when that actually saves bytes), and each gets a small
+# preview for the inquiry PDF. Multi-page TIFF and GIF scans are only previewed
+# (first page), so no page is lost. They and other formats (PDF, CAD) are
+# attached as uploaded.
+# Prepared images and previews are kept in PREPARED_DIR under the upload's
+# SHA-256 and the settings, so a retried job or a digest that carries the
+# same drawing reuses them instead of running Pillow again. They are attached
+# by path, so their base64 encoding is cached by utils.attachment_cache.
+# The directory only holds derived files and can be deleted at any time;
+# compaction.py deletes those not touched for COMPACT_AFTER_DAYS.
+# Attachments are then fitted into ATTACHMENT_BUDGET_MB of base64 payload;
+# drawings that don't fit are replaced by a signed download link
+# (/drawings/<name>) when PUBLIC_BASE_URL and DRAWING_LINK_SECRET are set.
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple, Optional, Tuple
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+ATTACHMENT_BUDGET_BYTES = int(float(os.getenv("ATTACHMENT_BUDGET_MB", "10")) * 1024 * 1024) # encoded, per email
+DRAWING_MAX_PIXELS = int(os.getenv("DRAWING_MAX_PIXELS", "2400"))
+DRAWING_JPEG_QUALITY = int(os.getenv("DRAWING_JPEG_QUALITY", "85"))
+PREVIEW_PIXELS = 600
+DRAWING_PREP_WORKERS = int(os.getenv("DRAWING_PREP_WORKERS", "1"))
+DRAWING_PREP_TIMEOUT = float(os.getenv("DRAWING_PREP_TIMEOUT", "60")) # seconds per drawing
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "120")) # seconds per PDF
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+DRAWING_LINK_SECRET = os.getenv("DRAWING_LINK_SECRET", "")
+DRAWING_LINK_DAYS = float(os.getenv("DRAWING_LINK_DAYS", "30"))
+
+PREPARED_DIR = os.path.join("uploads", "prepared") # a subdirectory, so compaction doesn't pack it with the uploads
+PREPARED_VERSION = 2 # bump when _prepare's output changes, so stale cached files aren't reused
+
+RASTER_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif", ".tif", ".tiff"}
+LOSSY_EXTENSIONS = {".jpg", ".jpeg", ".webp"}
+
+
+class PreparedDrawing(NamedTuple):
+    path: str # the stored upload
+    filename: str # name to attach it under
+    file: Optional[str] # re-encoded image to attach instead, or None to attach the upload as is
+    size: int # bytes that would be attached
+    preview: Optional[str] = None # PNG or JPEG file for the inquiry PDF
+    preview_size: Optional[Tuple[int, int]] = None
+
+
+def encoded_size(size):
+    return (size + 2) // 3 * 4 # base64
+
+
+# --- PREPARATION (runs in the pool) ---
+def _as_uploaded(path):
+    return PreparedDrawing(path, os.path.basename(path), None, os.path.getsize(path))
+
+def _prepare(path, out_dir, key):
+    """Write the re-encoded drawing and its preview to out_dir; returns their metadata (also kept as <key>.json)."""
+    name, ext = os.path.splitext(os.path.basename(path))
+    size = os.path.getsize(path)
+    from PIL import Image, ImageOps
+    os.makedirs(out_dir, exist_ok=True)
+    with Image.open(path) as image:
+        # Multi-page TIFF / GIF scans would be cut down to their first page: only preview those
+        multi_frame = getattr(image, "n_frames", 1) > 1
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((DRAWING_MAX_PIXELS, DRAWING_MAX_PIXELS))
+        # Drawings that arrived lossless (line art, CAD exports) or with transparency stay PNG;
+        # photos and scans that were JPEG/WebP already are re-encoded as JPEG
+        lossless = ext.lower() not in LOSSY_EXTENSIONS or image.mode in ("1", "P", "LA", "RGBA")
+        suffix = ".png" if lossless else ".jpg"
+        file, preview_file = key + suffix, key + "-preview" + suffix
+        if lossless and not multi_frame:
+            image.save(os.path.join(out_dir, file), "PNG") # optimize=True is ~8x slower for ~2% smaller files
+        elif not multi_frame:
+            image.convert("RGB").save(os.path.join(out_dir, file), "JPEG", quality=DRAWING_JPEG_QUALITY, optimize=True)
+
+        preview = image.copy()
+        preview.thumbnail((PREVIEW_PIXELS, PREVIEW_PIXELS))
+        if lossless:
+            preview = preview.convert("RGBA" if "A" in preview.mode or preview.mode == "P" else "RGB")
+            preview.save(os.path.join(out_dir, preview_file), "PNG")
+        else:
+            preview.convert("RGB").save(os.path.join(out_dir, preview_file), "JPEG", quality=80)
+
+    prepared_size = None if multi_frame else os.path.getsize(os.path.join(out_dir, file))
+    if prepared_size is None or prepared_size >= size: # Already compact (or multi-page): attach the upload itself
+        if prepared_size is not None:
+            os.remove(os.path.join(out_dir, file))
+        meta = {"filename": name + ext, "file": None, "size": size}
+    else:
+        meta = {"filename": name + suffix, "file": file, "size": prepared_size}
+    meta.update(preview=preview_file, preview_size=preview.size)
+    # Written last and atomically: a <key>.json means the files it names are complete
+    tmp = os.path.join(out_dir, f"{key}.json.{os.getpid()}.part")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(out_dir, key + ".json"))
+    return meta
+
+
+def _prepared_key(path):
+    from utils import content_hash
+    return f"{content_hash(path)}-{DRAWING_MAX_PIXELS}q{DRAWING_JPEG_QUALITY}v{PREPARED_VERSION}"
+
+def _from_meta(path, meta):
+    file = meta["file"] and os.path.join(PREPARED_DIR, meta["file"])
+    return PreparedDrawing(path, meta["filename"], file, meta["size"], os.path.join(PREPARED_DIR, meta["preview"]),
+                           tuple(meta["preview_size"]))
+
+def _cached(path, key):
+    try:
+        with open(os.path.join(PREPARED_DIR, key + ".json")) as f:
+            drawing = _from_meta(path, json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None
+    # Someone may have cleared part of the directory
+    if not os.path.isfile(drawing.preview) or (drawing.file and not os.path.isfile(drawing.file)):
+        return None
+    return drawing
+
+def _render_pdf(name, args, kwargs, profile):
+    import pdf_writer
+    from profiling import profile_requested
+    # Profiling switched on in the API process (admin toggle, X-Profile) doesn't reach this one on its own
+    token = profile_requested.set(profile)
+    try:
+        return getattr(pdf_writer, name)(*args, **kwargs)
+    finally:
+        profile_requested.reset(token) # this may be a lead worker thread, see _InlinePool
+
+def _noop():
+    pass
+
+
+# --- POOL ---
+_pool = None
+_pool_lock = threading.Lock()
+
+def _init_worker():
+    # Fonts are parsed once per worker, not on its first PDF
+    try:
+        import pdf_writer
+        pdf_writer.load_fonts()
+    except Exception as e:
+        print(f"[!] Pool worker could not preload fonts: {e}")
+
+class _InlinePool:
+    """Stands in for the pool when DRAWING_PREP_WORKERS is 0: runs each call in the caller's thread."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None and DRAWING_PREP_WORKERS <= 0:
+            _pool = _InlinePool()
+        elif _pool is None:
+            # spawn: forking a process that runs worker threads can copy held locks into the child
+            _pool = ProcessPoolExecutor(max_workers=DRAWING_PREP_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker)
+        return _pool
+
+def _discard_broken(pool):
+    # A worker that died (OOM on a huge image) breaks the whole pool; start a fresh one next time
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def warm_pool():
+    """Start the pool's workers (and so their font loading) ahead of the first lead."""
+    pool = _get_pool()
+    for future in [pool.submit(_noop) for _ in range(DRAWING_PREP_WORKERS)]:
+        future.result()
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def prepare_drawings(paths):
+    """Prepare each drawing in the process pool. A drawing that fails or times out is attached as uploaded."""
+    # Only raster images that haven't been prepared before go to the pool, so leads with
+    # PDF/CAD drawings never start it.
+    # Absolute paths: the pool's processes keep the working directory they were started in
+    # Prepared files are written to an absolute directory for the same reason
+    pool = None
+    jobs = []
+    for path in paths:
+        if os.path.splitext(path)[1].lower() not in RASTER_EXTENSIONS:
+            jobs.append((path, _as_uploaded(path)))
+            continue
+        key = _prepared_key(path)
+        cached = _cached(path, key)
+        if cached is not None:
+            jobs.append((path, cached))
+            continue
+        pool = pool or _get_pool()
+        jobs.append((path, pool.submit(_prepare, os.path.abspath(path), os.path.abspath(PREPARED_DIR), key)))
+    prepared = []
+    for path, job in jobs:
+        if isinstance(job, PreparedDrawing):
+            prepared.append(job)
+            continue
+        try:
+            prepared.append(_from_meta(path, job.result(timeout=DRAWING_PREP_TIMEOUT)))
+        except Exception as e:
+            print(f"[!] Could not prepare drawing {path}: {e!r}")
+            if isinstance(e, BrokenProcessPool):
+                _discard_broken(pool)
+            prepared.append(_as_uploaded(path))
+    return prepared
+
+def render_pdf(name, *args, profile=False, **kwargs):
+    """Call pdf_writer.<name>(*args, **kwargs) in the pool and return its bytes.
+
+    profile=True captures the render even if the pool's own sample rate doesn't pick it.
+    """
+    pool = _get_pool()
+    try:
+        return pool.submit(_render_pdf, name, args, kwargs, profile).result(timeout=PDF_RENDER_TIMEOUT)
+    except BrokenProcessPool:
+        _discard_broken(pool)
+        raise
+
+
+# --- BUDGET ---
+def fit_budget(drawings, reserved=0, budget=ATTACHMENT_BUDGET_BYTES):
+    """Split drawings into (attach, link) so the encoded attachments stay within budget.
+
+    reserved is what the email already carries (the inquiry PDF). Drawings are
+    taken in order; each one that would overflow the budget is linked instead.
+    """
+    used = encoded_size(reserved)
+    attach, link = [], []
+    for drawing in drawings:
+        cost = encoded_size(drawing.size)
+        if used + cost <= budget:
+            attach.append(drawing)
+            used += cost
+        else:
+            link.append(drawing)
+    return attach, link
+
+def preview_of(drawing):
+    """The (image file, size) preview pdf_writer takes, or None."""
+    return (os.path.abspath(drawing.preview), drawing.preview_size) if drawing and drawing.preview else None
+
+def renamed(drawing, original_name):
+    """drawing, attached under the customer's own filename (keeping the extension of what is attached)."""
+    if not original_name:
+        return drawing
+    stem = os.path.splitext(os.path.basename(original_name.replace("\\", "/")))[0].strip(". ")
+    return drawing._replace(filename=stem + os.path.splitext(drawing.filename)[1]) if stem else drawing
+
+def as_attachments(drawings):
+    """attachment_paths for build_message: (filename, file) pairs, re-encoded or as uploaded."""
+    return [(d.filename, d.file or d.path) for d in drawings]
+
+
+# --- DOWNLOAD LINKS ---
+def _signature(name, expires):
+    return hmac.new(DRAWING_LINK_SECRET.encode(), f"{name}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+def drawing_link(name):
+    """A signed, expiring download URL for a stored drawing, or None when links aren't configured."""
+    if not (PUBLIC_BASE_URL and DRAWING_LINK_SECRET):
+        return None
+    expires = int(time.time() + DRAWING_LINK_DAYS * 86400)
+    return f"{PUBLIC_BASE_URL}/drawings/{name}?expires={expires}&signature={_signature(name, expires)}"
+
+def verify_drawing_link(name, expires, signature):
+    if not DRAWING_LINK_SECRET or expires < time.time():
+        return False
+    return hmac.compare_digest(_signature(name, expires), signature)
+
+def linked_drawings_note(drawings):
+    """Email body lines for the drawings that were too large to attach."""
+    lines = []
+    for drawing in drawings:
+        name = os.path.basename(drawing.path)
+        link = drawing_link(name)
+        lines.append(f"- {drawing.filename}: {link}" if link else f"- {drawing.filename} (stored on the server as uploads/{name})")
+    return "Drawings too large to attach:\n" + "\n".join(lines)
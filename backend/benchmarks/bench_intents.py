@@ -0,0 +1,66 @@
+# backend/benchmarks/bench_intents.py
+#
+# Accuracy and speed of the intent matcher on the labelled corpus of
+# get_drawing / post_engagement answers in test_intents.py, next to the old
+# substring scan.
+#
+#   cd backend && python benchmarks/bench_intents.py [rounds]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from intents import INTENTS
+from test_intents import DRAWING_CORPUS, ENGAGEMENT_CORPUS, drawing_intent, engagement_intent
+
+OLD_NEGATIVES = [
+    "no drawing", "no", "na", "n/a", "not available", "none", "nope",
+    "don't have", "dont have", "skip", "no draw", "not yet",
+    "i dont have", "i don't have", "without", "later"
+]
+
+
+# The previous per-stage checks: substring scans over the raw input
+def old_drawing(text):
+    cleaned = text.lower().strip().replace(".", "").replace(",", "")
+    return "no_drawing" if any(p in cleaned for p in OLD_NEGATIVES) else None
+
+def old_engagement(text):
+    if "New" in text or "Inquiry" in text:
+        return "new_inquiry"
+    if "No" in text or "Good" in text:
+        return "decline"
+    return None
+
+
+def misses(drawing, engagement):
+    return [
+        (text, expected, got)
+        for corpus, match in ((DRAWING_CORPUS, drawing), (ENGAGEMENT_CORPUS, engagement))
+        for text, expected in corpus
+        if (got := match(text)) != expected
+    ]
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    corpus = DRAWING_CORPUS + ENGAGEMENT_CORPUS
+    texts = [text for text, _ in corpus]
+    for name, drawing, engagement in (("substring", old_drawing, old_engagement), ("compiled", drawing_intent, engagement_intent)):
+        wrong = misses(drawing, engagement)
+        print(f"{name:10s} accuracy {1 - len(wrong) / len(corpus):6.1%}  ({len(wrong)} wrong)")
+        for text, expected, got in wrong:
+            print(f"    {text!r}: expected {expected}, got {got}")
+
+    for name, scan in (
+        ("substring", old_drawing),
+        ("compiled", INTENTS.find),
+    ):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text in texts:
+                scan(text)
+        elapsed = time.perf_counter() - start
+        print(f"{name:10s} {elapsed / (rounds * len(texts)) * 1e6:6.2f} us/answer")
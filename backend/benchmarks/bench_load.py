@@ -0,0 +1,187 @@
+# backend/benchmarks/bench_load.py
+#
+# End-to-end load benchmark: drives complete /chat conversations (DM and RA
+# branches, drawing upload and dimensions paths, __GO_BACK__ jumps) against the
+# ASGI app in-process, with Mailjet replaced by a local stub so it runs offline.
+# Reports throughput and p50/p95/p99 latency per stage, and can compare a run
+# against a saved baseline to flag regressions.
+#
+#   cd backend && python benchmarks/bench_load.py --conversations 200 --concurrency 20
+#   python benchmarks/bench_load.py --save baseline.json
+#   python benchmarks/bench_load.py --baseline baseline.json   # exit 1 on regression
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+# Keep every file the app writes (queue db, uploads, archives) out of the tree
+WORK_DIR = tempfile.mkdtemp(prefix="bench_load_")
+os.chdir(WORK_DIR)
+os.environ.update({
+    "LEAD_QUEUE_DB": os.path.join(WORK_DIR, "lead_jobs.db"),
+    "LEAD_RETRY_BASE_SECONDS": "0.1",
+    "ARCHIVE_INQUIRIES": "0",
+    "RATE_LIMITS_ENABLED": "0", # every simulated visitor shares one address
+    "MAILJET_API_KEY": "bench",
+    "MAILJET_SECRET_KEY": "bench",
+    "EMAIL_ADDRESS": "bench@example.com",
+})
+
+import httpx
+import main
+import utils
+
+# (user input, or ("upload", filename) for a drawing upload)
+SCENARIOS = {
+    "dm_upload": ["Alice", "DM Thermoformer", "ESD Trays", "Clear, ESD", "PET", "0.5mm", "2D Drawing",
+                  ("upload", "tray.pdf"), "1000", "Within 1 month", "Yes", "Chennai", "5000 monthly",
+                  "Acme", "12 Main Road", "+91 98765 43210", "alice@acme.com", "No, I’m good"],
+    "ra_dimensions": ["Bob", "RA Vacform Industries", "Robot Covers", "Outdoor Resistant", "ASA", "4.0mm",
+                      "No drawing", "600 x 400 x 200", "50", "2-3 months", "No", "Pune", "200 yearly",
+                      "Botworks", "Plot 7", "+91 91234 56789", "bob@botworks.in", "No, I’m good"],
+    "dm_go_back": ["Carol", "DM Thermoformer", "Food Packaging", main.BACK_COMMAND, "Medical Packaging",
+                   "Food Contact Safe", main.BACK_COMMAND, "Clear", "PP", "0.8mm", "Not yet", "200 x 100 x 30",
+                   main.BACK_COMMAND, "200 x 100 x 40", "20000", "Planning stage", "No", "Delhi", "100000 yearly",
+                   "MedPack", "Sector 5", "+91 90000 00000", "carol@medpack.in", "Create New Inquiry"],
+}
+
+
+class StubMailjet:
+    """Stands in for the Mailjet session: accepts every message after a fixed delay."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+
+    def post(self, url, auth, json, timeout):
+        self.calls += 1
+        time.sleep(self.delay)
+        response = httpx.Response(200, json={"Messages": [{"Status": "success"} for _ in json["Messages"]]})
+        response.text  # noqa: B018 - materialize body like requests does
+        return response
+
+
+async def run_conversation(client, number, steps, latencies):
+    stage, user_details = "get_name", {'stage_history': []}
+    # A distinct name per conversation, so the duplicate-submission guard doesn't fold leads together
+    steps = [f"{steps[0]} {number}", *steps[1:]]
+    for step in steps:
+        if isinstance(step, tuple):
+            start = time.perf_counter()
+            response = await client.post("/upload_drawing", files={"resume": (step[1], os.urandom(64 * 1024))})
+            latencies.setdefault("upload_drawing", []).append(time.perf_counter() - start)
+            response.raise_for_status()
+            step = f"Uploaded: {response.json()['filename']}"
+
+        start = time.perf_counter()
+        response = await client.post("/chat", json={"stage": stage, "user_details": user_details, "user_input": step})
+        latencies.setdefault(stage, []).append(time.perf_counter() - start)
+        response.raise_for_status()
+        data = response.json()
+        stage, user_details = data["next_stage"], data["user_details"]
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(int(p * len(sorted_values)), len(sorted_values) - 1)]
+
+
+async def bench(conversations, concurrency):
+    latencies = {}
+    names = list(SCENARIOS)
+    queue = asyncio.Queue()
+    for i in range(conversations):
+        queue.put_nowait((i, names[i % len(names)]))
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            while not queue.empty():
+                number, name = queue.get_nowait()
+                await run_conversation(client, number, SCENARIOS[name], latencies)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return elapsed, latencies
+
+
+def summarize(elapsed, latencies):
+    requests = sum(len(v) for v in latencies.values())
+    stages = {}
+    for stage, values in latencies.items():
+        values = sorted(values)
+        stages[stage] = {
+            "count": len(values),
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+        }
+    return {"requests": requests, "seconds": elapsed, "requests_per_s": requests / elapsed, "stages": stages}
+
+
+def regressions(result, baseline, tolerance):
+    found = []
+    if result["requests_per_s"] < baseline["requests_per_s"] * (1 - tolerance):
+        found.append(f"throughput {result['requests_per_s']:.0f} req/s vs baseline {baseline['requests_per_s']:.0f}")
+    for stage, stats in result["stages"].items():
+        before = baseline["stages"].get(stage)
+        if before and stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            found.append(f"{stage} p95 {stats['p95_ms']:.2f} ms vs baseline {before['p95_ms']:.2f} ms")
+    return found
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversations", type=int, default=150)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--mail-delay", type=float, default=0.05, help="stub Mailjet latency in seconds")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a saved JSON result")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline")
+    args = parser.parse_args()
+
+    stub = StubMailjet(args.mail_delay)
+    utils._session = stub
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.lead_queue.start()
+        elapsed, latencies = asyncio.run(bench(args.conversations, args.concurrency))
+        # Let the workers drain the submitted leads
+        while main.lead_queue.stats()["pending"] or main.lead_queue.stats()["running"]:
+            time.sleep(0.05)
+        main.lead_queue.stop()
+    result = summarize(elapsed, latencies)
+    result["lead_jobs"] = main.lead_queue.stats()
+
+    print(f"{result['requests']} requests in {elapsed:.2f}s at concurrency {args.concurrency}: "
+          f"{result['requests_per_s']:.0f} req/s")
+    print(f"{'stage':24s} {'count':>6s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s}")
+    for stage, stats in result["stages"].items():
+        print(f"{stage:24s} {stats['count']:6d} {stats['p50_ms']:8.2f} {stats['p95_ms']:8.2f} {stats['p99_ms']:8.2f}")
+    jobs = result["lead_jobs"]
+    print(f"lead jobs: {jobs['done']} done, {jobs['dead']} dead, {stub.calls} Mailjet calls, "
+          f"p50 {jobs['latency_seconds']['p50']}s p95 {jobs['latency_seconds']['p95']}s")
+
+    if args.save:
+        with open(os.path.join(BACKEND_DIR, args.save) if not os.path.isabs(args.save) else args.save, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        path = args.baseline if os.path.isabs(args.baseline) else os.path.join(BACKEND_DIR, args.baseline)
+        with open(path) as f:
+            found = regressions(result, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION: {line}")
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,53 @@
+# backend/benchmarks/bench_pdf.py
+#
+# Throughput and peak memory of create_sales_pdf.
+#
+#   cd backend && python benchmarks/bench_pdf.py [renders]
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pdf_writer import create_sales_pdf
+
+LEAD = {
+    "contact_person": "Alice", "company": "Acme Packaging Pvt Ltd", "company_address": "12 Main Road, Chennai",
+    "email": "alice@acme.com", "phone": "+91 98765 43210", "division": "DM Thermoformer",
+    "product_type": "ESD Trays", "properties": "Clear, ESD, Anti-static", "material": "PET",
+    "thickness": "0.5mm", "drawing_available": "2D Drawing", "dimensions": "N/A", "quantity": "1000",
+    "timeline": "Within 1 month", "delivery_location": "Chennai", "sample_needed": "Yes",
+    "forecast": "5000 monthly",
+}
+
+
+def render(count, path):
+    for i in range(count):
+        create_sales_pdf(dict(LEAD, company=f"Acme {i}"), path)
+
+
+if __name__ == "__main__":
+    renders = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        path = os.path.join(tmp, "inquiry.pdf")
+        start = time.perf_counter()
+        render(1, path)
+        first = time.perf_counter() - start
+
+        start = time.perf_counter()
+        render(renders, path)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        render(3, path)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    print(f"first render: {first * 1000:.0f} ms")
+    print(f"steady state: {renders / elapsed:.1f} renders/s ({elapsed / renders * 1000:.0f} ms/render)")
+    print(f"peak traced memory per render: {peak / 1e6:.1f} MB")
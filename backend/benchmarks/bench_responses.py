@@ -0,0 +1,89 @@
+# backend/benchmarks/bench_responses.py
+#
+# Micro-benchmark for /chat response serialization.
+# Replays the bench_stages conversations once, keeps every ChatResponse, then
+# times turning them into a response body two ways: FastAPI's response_model
+# path (validate into ChatResponse, serialize_response with exclude_none, JSON
+# dump, with bot_messages as the plain lists stages used to return) and the
+# pre-encoded fragment splice in responses.py.
+#
+#   cd backend && python benchmarks/bench_responses.py [rounds]
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("LEAD_QUEUE_DB", ":memory:")  # never leave benchmark leads behind
+
+from fastapi.routing import serialize_response
+
+from bench_stages import CONVERSATIONS
+from main import ChatResponse, app, chat_turn
+from responses import encode_chat_response, fragments
+
+CHAT_FIELD = next(route.response_field for route in app.routes if getattr(route, "path", None) == "/chat")
+
+
+def collect_responses():
+    responses = []
+    for inputs in CONVERSATIONS.values():
+        stage, user_details = "get_name", {'stage_history': []}
+        for user_input in inputs:
+            result = chat_turn(stage, user_input, user_details)
+            responses.append(ChatResponse.model_construct(
+                next_stage=result.next_stage,
+                bot_messages=result.bot_messages,
+                user_details=result.user_details,
+                ui_elements=result.ui_elements
+            ))
+            stage, user_details = result.next_stage, result.user_details
+    return responses
+
+
+def as_lists(responses):
+    return [r.model_copy(update={"bot_messages": list(r.bot_messages)}) for r in responses]
+
+
+async def response_model_bodies(responses):
+    # What FastAPI does for `return response` on a response_model route, then JSONResponse.render
+    return [json.dumps(await serialize_response(field=CHAT_FIELD, response_content=r, exclude_none=True),
+                       ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+            for r in responses]
+
+
+def spliced_bodies(responses):
+    return [encode_chat_response(r) for r in responses]
+
+
+def best_of(fn, rounds, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / rounds
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with contextlib.redirect_stdout(io.StringIO()):
+        responses = collect_responses()
+
+    # Same JSON either way (key order and spacing aside)
+    plain = as_lists(responses)
+    for before, after in zip(asyncio.run(response_model_bodies(plain)), spliced_bodies(responses)):
+        assert json.loads(before) == json.loads(after), (before, after)
+
+    turns = len(responses)
+    loop = asyncio.new_event_loop()
+    baseline = best_of(lambda: loop.run_until_complete(response_model_bodies(plain)), rounds) / turns
+    spliced = best_of(lambda: spliced_bodies(responses), rounds) / turns
+    print(f"response_model + json.dumps: {baseline * 1e6:8.2f} us/turn")
+    print(f"pre-encoded fragments:       {spliced * 1e6:8.2f} us/turn  ({baseline / spliced:.1f}x)")
+    print(f"fragment cache: {fragments.stats()}")
@@ -0,0 +1,60 @@
+# backend/benchmarks/bench_sessions.py
+#
+# Compares the legacy /chat mode (full user_details both ways) with session
+# mode (session id + input in, delta out): bytes on the wire and time per turn.
+#
+#   cd backend && python benchmarks/bench_sessions.py [rounds]
+
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("LEAD_QUEUE_DB", ":memory:")  # never leave benchmark leads behind
+os.environ.setdefault("RATE_LIMITS_ENABLED", "0")  # every turn comes from one test client
+
+from fastapi.testclient import TestClient
+from bench_stages import CONVERSATIONS
+import main
+
+
+def legacy(client, inputs):
+    sent = received = 0
+    stage, user_details = "get_name", {'stage_history': []}
+    for user_input in inputs:
+        body = json.dumps({"stage": stage, "user_details": user_details, "user_input": user_input})
+        response = client.post("/chat", content=body, headers={"content-type": "application/json"})
+        sent, received = sent + len(body), received + len(response.content)
+        data = response.json()
+        stage, user_details = data["next_stage"], data["user_details"]
+    return sent, received
+
+
+def session(client, inputs):
+    sent = received = 0
+    session_id = ""
+    for user_input in inputs:
+        body = json.dumps({"session_id": session_id, "user_input": user_input})
+        response = client.post("/chat", content=body, headers={"content-type": "application/json"})
+        sent, received = sent + len(body), received + len(response.content)
+        session_id = response.json()["session_id"]
+    return sent, received
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    client = TestClient(main.app)
+    turns = sum(len(inputs) for inputs in CONVERSATIONS.values())
+    for mode in (legacy, session):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                totals = [mode(client, inputs) for inputs in CONVERSATIONS.values()]
+            elapsed = time.perf_counter() - start
+        sent = sum(t[0] for t in totals) / turns
+        received = sum(t[1] for t in totals) / turns
+        print(f"{mode.__name__:8s} {sent:7.0f} B sent/turn  {received:7.0f} B received/turn  "
+              f"{elapsed / (rounds * turns) * 1e6:8.1f} us/turn")
@@ -0,0 +1,151 @@
+# backend/benchmarks/bench_stages.py
+#
+# Micro-benchmark for the /chat stage dispatch.
+# Drives a full DM and RA conversation (no HTTP) through the baseline if/elif
+# handler and through chat_turn on the compiled STAGE_GRAPH, and reports the
+# average cost per turn of each, twice: up to the ChatResponse the handler
+# returns (a validated model for the baseline, model_construct for the stage
+# graph), and up to the JSON body. For the body, the baseline is given a plain
+# model_dump + json.dumps, which is cheaper than FastAPI's response_model path
+# it really went through (see bench_responses.py), so its numbers flatter it.
+# The baseline is handle_chat as it is in the repo's root commit (or --baseline
+# <rev>), checked out into a temporary git worktree. It runs in a child process,
+# as its modules share names with today's (main, utils, ...). It is called with
+# a model_construct-ed ChatRequest, so FastAPI's request validation isn't counted.
+#
+#   cd backend && python benchmarks/bench_stages.py [rounds] [--baseline <rev>]
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+MEASURE_BASELINE = "--measure-baseline" # set in the child, which runs in the baseline's backend/
+
+sys.path.insert(0, os.getcwd() if MEASURE_BASELINE in sys.argv else BACKEND_DIR)
+os.environ.setdefault("LEAD_QUEUE_DB", ":memory:")  # never leave benchmark leads behind
+
+CONVERSATIONS = {
+    "DM": ["Alice", "DM Thermoformer", "ESD Trays", "Clear, ESD", "PET", "0.5mm", "2D Drawing",
+           "Uploaded: tray.pdf", "1000", "Within 1 month", "Yes", "Chennai", "5000 monthly",
+           "Acme", "12 Main Road", "+91 98765 43210", "alice@acme.com", "No, I’m good"],
+    "RA": ["Bob", "RA Vacform Industries", "Robot Covers", "Outdoor Resistant, UV Resistant", "ASA",
+           "4.0mm", "No drawing", "600 x 400 x 200", "50", "2-3 months", "No", "Pune", "200 yearly",
+           "Botworks", "Plot 7", "+91 91234 56789", "bob@botworks.in", "No, I’m good"],
+}
+MEASURES = (("to ChatResponse", False), ("to JSON body", True))
+
+
+def baseline_implementation():
+    from fastapi import BackgroundTasks
+    from main import ChatRequest, handle_chat
+
+    def turn(stage, user_input, user_details):
+        request = ChatRequest.model_construct(stage=stage, user_input=user_input, user_details=user_details)
+        coroutine = handle_chat(request, BackgroundTasks()) # the lead task is only recorded, never run
+        try:
+            coroutine.send(None)
+        except StopIteration as done: # it never awaits, so it finishes on the first step
+            return done.value
+        raise RuntimeError("The baseline handle_chat awaited; drive it with an event loop instead")
+
+    return turn, legacy_body
+
+
+def stage_graph_implementation():
+    from main import ChatResponse, chat_turn
+    from responses import encode_chat_response
+
+    def turn(stage, user_input, user_details):
+        result = chat_turn(stage, user_input, user_details)
+        return ChatResponse.model_construct(
+            next_stage=result.next_stage,
+            bot_messages=result.bot_messages,
+            user_details=result.user_details,
+            ui_elements=result.ui_elements
+        )
+
+    return turn, encode_chat_response
+
+
+def legacy_body(response):
+    return json.dumps(response.model_dump(exclude_none=True), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def run_conversation(turn, inputs, encode=None):
+    stage, user_details = "get_name", {'stage_history': []}
+    for user_input in inputs:
+        response = turn(stage, user_input, user_details)
+        if encode is not None:
+            encode(response)
+        stage, user_details = response.next_stage, response.user_details
+
+
+def bench(turn, rounds, encode=None, repeat=5):
+    results = {}
+    for name, inputs in CONVERSATIONS.items():
+        with contextlib.redirect_stdout(io.StringIO()):  # the baseline prints DEBUG lines
+            run_conversation(turn, inputs, encode)  # warm-up
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    run_conversation(turn, inputs, encode)
+                best = min(best, time.perf_counter() - start)
+        results[name] = best / (rounds * len(inputs))
+    return results
+
+
+def measure(implementation, rounds):
+    turn, encode = implementation
+    return {title: bench(turn, rounds, encode if with_body else None) for title, with_body in MEASURES}
+
+
+def git(*args):
+    return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout
+
+
+def measure_baseline(revision, rounds):
+    revision = revision or git("rev-list", "--max-parents=0", "HEAD").split()[0]
+    work_dir = tempfile.mkdtemp(prefix="bench_stages_")
+    tree = os.path.join(work_dir, "baseline")
+    git("worktree", "add", "--detach", tree, revision)
+    try:
+        # cwd is the baseline's backend/, where its main expects to run (uploads/, fonts/)
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), str(rounds), MEASURE_BASELINE],
+                                cwd=os.path.join(tree, "backend"), capture_output=True, text=True)
+    finally:
+        git("worktree", "remove", "--force", tree)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if result.returncode != 0:
+        sys.exit(f"[!] Baseline {revision[:12]} failed:\n{result.stderr}")
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rounds", type=int, nargs="?", default=1000)
+    parser.add_argument("--baseline", help="git revision holding the if/elif handler (default: the root commit)")
+    parser.add_argument(MEASURE_BASELINE, action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure_baseline:
+        print(json.dumps(measure(baseline_implementation(), args.rounds)))
+        sys.exit()
+
+    results = {"if/elif (baseline)": measure_baseline(args.baseline, args.rounds),
+               "stage graph": measure(stage_graph_implementation(), args.rounds)}
+    baseline = results["if/elif (baseline)"]
+    for title, _ in MEASURES:
+        print(title)
+        for label, measured in results.items():
+            for name, per_turn in measured[title].items():
+                speedup = f"  ({baseline[title][name] / per_turn:.1f}x)" if measured is not baseline else ""
+                print(f"  {label:<20} {name}: {per_turn * 1e6:8.2f} us/turn  ({1 / per_turn:,.0f} turns/s){speedup}")
@@ -0,0 +1,93 @@
+# backend/benchmarks/bench_startup.py
+#
+# Cold-start benchmark: what a sleeping host pays before its first visitor
+# gets an answer. Runs `python -X importtime -c "import main"` to list the
+# slowest imports, then times fresh interpreters from launch to the first
+# /chat response (in-process through httpx's ASGITransport, no server).
+#
+#   cd backend && python benchmarks/bench_startup.py --runs 5
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+FIRST_CHAT = """
+import asyncio, time
+import httpx
+import main
+
+async def first_chat():
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/chat", json={"stage": "get_name", "user_details": {}, "user_input": "Alice"})
+        response.raise_for_status()
+
+asyncio.run(first_chat())
+print("FIRST_CHAT_AT", time.time())
+"""
+
+
+def child_env(work_dir):
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": BACKEND_DIR,
+        "LEAD_QUEUE_DB": os.path.join(work_dir, "lead_jobs.db"),
+        # ASGITransport waits for background tasks before returning the response, so
+        # the post-response warm-up would be counted; a real server sends it first.
+        "WARM_UP_AFTER_FIRST_CHAT": "0",
+    })
+    return env
+
+
+def import_times(work_dir, top):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=work_dir, env=child_env(work_dir), capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match:
+            rows.append((int(match.group(2)), len(match.group(3)) // 2, match.group(4)))
+    total = next(us for us, _, name in rows if name == "main")
+    # Direct imports of main (depth 1) show which top-level dependency costs what
+    direct = sorted((r for r in rows if r[1] == 1), reverse=True)[:top]
+    return total, direct
+
+
+def time_to_first_chat(work_dir):
+    start = time.time()
+    result = subprocess.run([sys.executable, "-c", FIRST_CHAT], cwd=work_dir, env=child_env(work_dir),
+                            capture_output=True, text=True, check=True)
+    stamp = float(re.search(r"FIRST_CHAT_AT ([\d.]+)", result.stdout).group(1))
+    return stamp - start
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest direct imports of main to list")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    # One untimed run so .pyc files exist, like a host that has started before
+    time_to_first_chat(work_dir)
+
+    total, direct = import_times(work_dir, args.top)
+    print(f"import main: {total / 1000:.0f} ms cumulative")
+    for cumulative, _, name in direct:
+        print(f"  {name:24s} {cumulative / 1000:8.1f} ms")
+
+    samples = [time_to_first_chat(work_dir) for _ in range(args.runs)]
+    print(f"launch -> first /chat response over {args.runs} runs: "
+          f"median {statistics.median(samples) * 1000:.0f} ms, min {min(samples) * 1000:.0f} ms, "
+          f"max {max(samples) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,287 @@
+# backend/compaction.py
+#
+# Retention and compaction for the file directories that grow with every lead
+# (inquiries/, proposals/, uploads/).
+# Files older than COMPACT_AFTER_DAYS are packed into zip shards under
+# ARCHIVE_DIR and removed from their directory. A side index (SQLite) records,
+# for each packed file, its shard and the byte offset of its zip entry, so a
+# single file is read back with one index lookup and one seek, without
+# scanning shards or their central directories. Shards whose newest file is
+# older than RETENTION_DAYS are deleted with their index rows.
+# Derived files that can be rebuilt (prepared drawings in attachments.PREPARED_DIR)
+# aren't worth archiving: they are deleted at the same age as their uploads are packed.
+#
+#   python compaction.py                  # compact everything older than COMPACT_AFTER_DAYS
+#   python compaction.py --days 7 --prune # also apply the retention policy
+
+import argparse
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+
+from attachments import PREPARED_DIR
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+COMPACT_DIRS = ("inquiries", "proposals", "uploads")
+DERIVED_DIRS = (PREPARED_DIR,)
+COMPACT_AFTER_DAYS = float(os.getenv("COMPACT_AFTER_DAYS", "30"))
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "0")) # 0 keeps shards forever
+SHARD_MAX_BYTES = int(float(os.getenv("SHARD_MAX_MB", "256")) * 1024 * 1024)
+COMPACT_INTERVAL_HOURS = float(os.getenv("COMPACT_INTERVAL_HOURS", "0")) # 0: run this script from cron instead
+STORED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".zip", ".gz", ".7z", ".rar"} # already compressed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    name TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    newest_mtime REAL NOT NULL,
+    files INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    shard TEXT NOT NULL,
+    header_offset INTEGER NOT NULL,  -- offset of the zip local file header
+    compress_type INTEGER NOT NULL,
+    compressed_size INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    PRIMARY KEY (directory, name)
+);
+CREATE INDEX IF NOT EXISTS files_shard ON files (shard);
+CREATE INDEX IF NOT EXISTS shards_newest ON shards (newest_mtime);
+"""
+
+LOCAL_HEADER = struct.Struct("<4s5H3L2H") # zip local file header, 30 bytes
+
+
+class ArchiveIndex:
+    def __init__(self, archive_dir=ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(self.archive_dir, "index.db"),
+                                       check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    # --- COMPACTION ---
+    def compact(self, directory, older_than_days=COMPACT_AFTER_DAYS, max_bytes=SHARD_MAX_BYTES):
+        """Pack files in directory not modified for older_than_days into shards. Returns files packed."""
+        if not os.path.isdir(directory):
+            return 0
+        cutoff = time.time() - older_than_days * 86400
+        candidates = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.endswith(".part"):
+                    continue
+                stat = entry.stat()
+                if stat.st_mtime < cutoff:
+                    candidates.append((stat.st_mtime, entry.name, stat.st_size))
+        candidates.sort()
+
+        packed, batch, batch_bytes = 0, [], 0
+        for candidate in candidates:
+            if self._already_packed(directory, *candidate):
+                # Packed by an earlier run that stopped before removing the original
+                os.remove(os.path.join(directory, candidate[1]))
+                continue
+            batch.append(candidate)
+            batch_bytes += candidate[2]
+            if batch_bytes >= max_bytes:
+                packed += self._write_shard(directory, batch)
+                batch, batch_bytes = [], 0
+        if batch:
+            packed += self._write_shard(directory, batch)
+        return packed
+
+    def _already_packed(self, directory, mtime, name, size):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT size, mtime FROM files WHERE directory = ? AND name = ?", (directory, name)
+            ).fetchone()
+        return row is not None and row == (size, mtime)
+
+    def _write_shard(self, directory, batch):
+        shard = f"{os.path.basename(os.path.normpath(directory))}-{time.strftime('%Y%m%d')}-{uuid.uuid4().hex[:8]}.zip"
+        shard_path = os.path.join(self.archive_dir, shard)
+        tmp_path = shard_path + ".part"
+        with zipfile.ZipFile(tmp_path, "w") as zf:
+            for mtime, name, _ in batch:
+                ext = os.path.splitext(name)[1].lower()
+                compression = zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                zf.write(os.path.join(directory, name), arcname=name, compress_type=compression)
+            entries = zf.infolist()
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, shard_path)
+
+        mtimes = {name: mtime for mtime, name, _ in batch}
+        rows = [(directory, info.filename, shard, info.header_offset, info.compress_type,
+                 info.compress_size, info.file_size, mtimes[info.filename]) for info in entries]
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN")
+            db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            db.execute("INSERT INTO shards VALUES (?, ?, ?, ?, ?, ?)",
+                       (shard, directory, time.time(), max(mtimes.values()), len(rows),
+                        os.path.getsize(shard_path)))
+            db.execute("COMMIT")
+
+        # Originals go only once the shard and its index rows are durable
+        for _, name, _ in batch:
+            os.remove(os.path.join(directory, name))
+        print(f"[*] Compacted {len(batch)} file(s) from {directory} into {shard}")
+        return len(batch)
+
+    # --- RETENTION ---
+    def prune(self, retention_days=RETENTION_DAYS):
+        """Delete shards whose newest file is older than retention_days. Returns shards removed."""
+        if retention_days <= 0:
+            return 0
+        cutoff = time.time() - retention_days * 86400
+        with self._lock:
+            db = self._connect()
+            expired = [row[0] for row in db.execute("SELECT name FROM shards WHERE newest_mtime < ?", (cutoff,))]
+            for shard in expired:
+                db.execute("BEGIN")
+                db.execute("DELETE FROM files WHERE shard = ?", (shard,))
+                db.execute("DELETE FROM shards WHERE name = ?", (shard,))
+                db.execute("COMMIT")
+                try:
+                    os.remove(os.path.join(self.archive_dir, shard))
+                except FileNotFoundError:
+                    pass
+        if expired:
+            print(f"[*] Pruned {len(expired)} expired shard(s)")
+        return len(expired)
+
+    # --- READS ---
+    def read(self, directory, name):
+        """Bytes of a packed file, or None if it isn't in the archive."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT shard, header_offset, compress_type, compressed_size FROM files "
+                "WHERE directory = ? AND name = ?", (directory, name)
+            ).fetchone()
+        if row is None:
+            return None
+        shard, offset, compress_type, compressed_size = row
+        with open(os.path.join(self.archive_dir, shard), "rb") as f:
+            f.seek(offset)
+            header = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+            name_length, extra_length = header[-2], header[-1]
+            f.seek(name_length + extra_length, os.SEEK_CUR)
+            data = f.read(compressed_size)
+        if compress_type == zipfile.ZIP_DEFLATED:
+            return zlib.decompress(data, -zlib.MAX_WBITS)
+        return data
+
+    def restore(self, directory, name):
+        """Put a packed file back in directory (e.g. a drawing needed by a retried lead). Returns its path or None.
+
+        The copy keeps its packed mtime, so the next compaction sees it is archived and drops it instead of
+        packing it again.
+        """
+        data = self.read(directory, name)
+        if data is None:
+            return None
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT mtime FROM files WHERE directory = ? AND name = ?", (directory, name)
+            ).fetchone()
+        path = os.path.join(directory, name)
+        os.makedirs(directory, exist_ok=True)
+        # Readers never see a half-written file; the .part name is skipped by compact
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            if row is not None: # else pruned meanwhile: a fresh mtime is right, it is no longer archived
+                os.utime(tmp_path, (time.time(), row[0]))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return path
+
+    def stats(self):
+        with self._lock:
+            shards, files, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(files), 0), COALESCE(SUM(bytes), 0) FROM shards"
+            ).fetchone()
+        return {"shards": shards, "files": files, "bytes": size}
+
+
+archive_index = ArchiveIndex()
+
+
+def drop_derived(directory, older_than_days=COMPACT_AFTER_DAYS):
+    """Delete files in directory not modified for older_than_days. Returns files removed."""
+    if not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - older_than_days * 86400
+    dropped = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                    dropped += 1
+                except FileNotFoundError:
+                    pass
+    if dropped:
+        print(f"[*] Dropped {dropped} derived file(s) from {directory}")
+    return dropped
+
+def compact_all(older_than_days=COMPACT_AFTER_DAYS, retention_days=RETENTION_DAYS, directories=COMPACT_DIRS,
+                derived_directories=DERIVED_DIRS):
+    packed = sum(archive_index.compact(directory, older_than_days) for directory in directories)
+    dropped = sum(drop_derived(directory, older_than_days) for directory in derived_directories)
+    pruned = archive_index.prune(retention_days)
+    return {"packed": packed, "dropped": dropped, "pruned": pruned}
+
+_stop_compactor = threading.Event()
+
+def start_compactor(interval_hours=COMPACT_INTERVAL_HOURS):
+    """Run compact_all() every interval_hours in a daemon thread (no-op when 0)."""
+    if interval_hours <= 0:
+        return
+
+    def loop():
+        while not _stop_compactor.wait(interval_hours * 3600):
+            try:
+                compact_all()
+            except Exception as e:
+                print(f"[!] Compaction failed: {e}")
+
+    _stop_compactor.clear()
+    threading.Thread(target=loop, name="compactor", daemon=True).start()
+
+def stop_compactor():
+    _stop_compactor.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack old inquiry/proposal/upload files into archive shards.")
+    parser.add_argument("--days", type=float, default=COMPACT_AFTER_DAYS, help="compact files older than this")
+    parser.add_argument("--prune", action="store_true", help="also delete shards older than --retention-days")
+    parser.add_argument("--retention-days", type=float, default=RETENTION_DAYS)
+    args = parser.parse_args()
+    result = compact_all(args.days, args.retention_days if args.prune else 0)
+    print(f"Packed {result['packed']} file(s), dropped {result['dropped']} derived file(s), "
+          f"pruned {result['pruned']} shard(s). Archive: {archive_index.stats()}")
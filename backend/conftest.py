@@ -0,0 +1,16 @@
+# backend/conftest.py
+#
+# Settings for the test run, applied before any module reads its environment:
+# every SQLite store stays in memory and nothing runs in the background.
+
+import os
+
+for name, value in {
+    "LEAD_QUEUE_DB": ":memory:",
+    "LEAD_INDEX_DB": ":memory:",
+    "SALES_DIGEST_DB": ":memory:",
+    "ARCHIVE_INQUIRIES": "0",
+    "WARM_UP_AFTER_FIRST_CHAT": "0",
+    "RATE_LIMITS_ENABLED": "0",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,105 @@
+# backend/contacts.py
+#
+# Phone and email validation for the contact stages.
+# Phones are parsed with phonenumbers and normalized to E.164. A number given
+# without a country code is read in the delivery country (taken from the
+# delivery location answer), falling back to DEFAULT_PHONE_REGION. Emails are
+# checked and normalized with email_validator without DNS lookups, so
+# validation stays offline and fast. Both libraries are imported on first use
+# (warm_up() does it in the background), and phonenumbers loads each region's
+# metadata only when a number from that region is seen. Results are memoized:
+# retries, duplicate submissions and batch re-checks see the same values again.
+
+from functools import lru_cache
+from typing import NamedTuple, Optional
+import os
+import re
+
+DEFAULT_PHONE_REGION = os.getenv("DEFAULT_PHONE_REGION", "IN")
+CONTACT_CACHE_SIZE = int(os.getenv("CONTACT_CACHE_SIZE", "4096"))
+
+# Country names customers are likely to type as a delivery location -> region code
+COUNTRY_REGIONS = {
+    "india": "IN", "bharat": "IN",
+    "usa": "US", "united states": "US", "america": "US", # not "us": "deliver to us in Pune"
+    "uk": "GB", "united kingdom": "GB", "england": "GB", "britain": "GB", "scotland": "GB",
+    "uae": "AE", "united arab emirates": "AE", "dubai": "AE", "abu dhabi": "AE",
+    "saudi arabia": "SA", "ksa": "SA", "qatar": "QA", "oman": "OM", "kuwait": "KW", "bahrain": "BH",
+    "singapore": "SG", "malaysia": "MY", "indonesia": "ID", "thailand": "TH", "vietnam": "VN",
+    "philippines": "PH", "china": "CN", "japan": "JP", "korea": "KR", "south korea": "KR",
+    "sri lanka": "LK", "bangladesh": "BD", "nepal": "NP", "bhutan": "BT", "maldives": "MV",
+    "germany": "DE", "france": "FR", "italy": "IT", "spain": "ES", "netherlands": "NL", "belgium": "BE",
+    "switzerland": "CH", "sweden": "SE", "poland": "PL", "ireland": "IE", "portugal": "PT",
+    "canada": "CA", "mexico": "MX", "brazil": "BR",
+    "australia": "AU", "new zealand": "NZ",
+    "south africa": "ZA", "kenya": "KE", "nigeria": "NG", "egypt": "EG",
+}
+_WORDS = re.compile(r"[a-z]+")
+
+
+class ContactCheck(NamedTuple):
+    value: Optional[str] # normalized, or None when invalid
+    error: Optional[str] = None
+
+
+def _named_region(text):
+    words = _WORDS.findall(text.lower())
+    # Longest names first, so "south korea" wins over "korea"
+    for n in (3, 2, 1):
+        for i in range(len(words) - n + 1):
+            region = COUNTRY_REGIONS.get(" ".join(words[i:i + n]))
+            if region:
+                return region
+    return None
+
+def region_for(location):
+    """Best-guess phone region for a free-text delivery location."""
+    return (_named_region(location) if location else None) or DEFAULT_PHONE_REGION
+
+
+@lru_cache(maxsize=CONTACT_CACHE_SIZE)
+def check_phone(text, region=DEFAULT_PHONE_REGION):
+    import phonenumbers
+
+    text = (text or "").strip()
+    # The contact form sends "<Country>:<number>"
+    country, sep, rest = text.partition(":")
+    if sep and (named := _named_region(country)):
+        region, text = named, rest
+
+    try:
+        number = phonenumbers.parse(text, region)
+        valid = phonenumbers.is_valid_number(number)
+    except phonenumbers.NumberParseException:
+        valid = False
+    if not valid:
+        # The number may be buried in a sentence ("call me on 98765 43210")
+        match = next(iter(phonenumbers.PhoneNumberMatcher(text, region)), None)
+        if match is None or not phonenumbers.is_valid_number(match.number):
+            return ContactCheck(None, "Not a valid phone number")
+        number = match.number
+    return ContactCheck(phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164))
+
+
+@lru_cache(maxsize=CONTACT_CACHE_SIZE)
+def check_email(text):
+    from email_validator import EmailNotValidError, validate_email
+
+    try:
+        return ContactCheck(validate_email((text or "").strip(), check_deliverability=False).normalized)
+    except EmailNotValidError as e:
+        return ContactCheck(None, str(e))
+
+
+def check_contact(phone=None, email=None, delivery_location=None):
+    """Check one contact; fields that weren't given are left out of the result."""
+    result = {}
+    if phone is not None:
+        result["phone"] = check_phone(phone, region_for(delivery_location))._asdict()
+    if email is not None:
+        result["email"] = check_email(email)._asdict()
+    return result
+
+
+def cache_stats():
+    return {name: fn.cache_info()._asdict() for name, fn in (("phone", check_phone), ("email", check_email))}
@@ -0,0 +1,146 @@
+# backend/digest.py
+#
+# Batched sales-team notifications.
+# By default every lead emails the sales team on its own. With
+# SALES_DIGEST_WINDOW_MINUTES > 0 the client acknowledgement still goes out
+# straight away, but the sales-team notification is parked in a small SQLite
+# buffer. The buffer is flushed when it holds SALES_DIGEST_MAX_LEADS leads or
+# its oldest lead has waited the whole window. The flushed batch goes out as
+# one email with one merged PDF. A lead stays buffered until its batch has
+# been handed on (to the job queue, which retries the send), so a restart
+# loses nothing.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SALES_DIGEST_WINDOW_MINUTES = float(os.getenv("SALES_DIGEST_WINDOW_MINUTES", "0")) # 0: one email per lead
+SALES_DIGEST_MAX_LEADS = int(os.getenv("SALES_DIGEST_MAX_LEADS", "20"))
+SALES_DIGEST_DB = os.getenv("SALES_DIGEST_DB", "sales_digest.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS digest (
+    lead_id TEXT PRIMARY KEY,
+    added_at REAL NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS digest_added ON digest (added_at);
+"""
+
+
+class SalesDigest:
+    def __init__(self, path=SALES_DIGEST_DB, window_seconds=SALES_DIGEST_WINDOW_MINUTES * 60,
+                 max_leads=SALES_DIGEST_MAX_LEADS, clock=time.time):
+        self.path = path
+        self.window_seconds = window_seconds
+        self.max_leads = max_leads
+        self.clock = clock
+        self.digests_sent = 0
+        self.leads_sent = 0
+        self._db = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock() # one flush at a time, so a batch is never sent twice
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.window_seconds > 0
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    # --- BUFFER ---
+    def add(self, lead_id, user_details):
+        """Buffer a lead for the next digest. Adding the same lead twice (a retried job) is a no-op."""
+        with self._lock:
+            db = self._connect()
+            db.execute("INSERT OR IGNORE INTO digest (lead_id, added_at, payload) VALUES (?, ?, ?)",
+                       (lead_id, self.clock(), json.dumps(user_details)))
+            full = db.execute("SELECT COUNT(*) FROM digest").fetchone()[0] >= self.max_leads
+        if full:
+            self._wakeup.set()
+
+    def _due_in(self):
+        """Seconds until the buffer should be flushed: 0 if now, None if it is empty."""
+        db = self._connect()
+        count, oldest = db.execute("SELECT COUNT(*), MIN(added_at) FROM digest").fetchone()
+        if not count:
+            return None
+        if count >= self.max_leads:
+            return 0.0
+        return max(oldest + self.window_seconds - self.clock(), 0.0)
+
+    def flush(self, send, force=False):
+        """Hand the oldest batch to send(leads) if it is due (or force). Returns the number of leads sent."""
+        with self._flush_lock:
+            with self._lock:
+                due_in = self._due_in()
+                if due_in is None or (due_in > 0 and not force):
+                    return 0
+                rows = self._connect().execute(
+                    "SELECT lead_id, payload FROM digest ORDER BY added_at LIMIT ?", (self.max_leads,)
+                ).fetchall()
+            send([json.loads(payload) for _, payload in rows])
+            # Only forget the leads once send() has taken them; if it raised they go out with the next flush
+            with self._lock:
+                self._connect().executemany("DELETE FROM digest WHERE lead_id = ?", [(lead_id,) for lead_id, _ in rows])
+                self.digests_sent += 1
+                self.leads_sent += len(rows)
+            return len(rows)
+
+    # --- FLUSHER ---
+    def start(self, send):
+        """Flush in a daemon thread whenever a batch is due (no-op unless the digest is enabled)."""
+        if not self.enabled:
+            # Digest mode was switched off: send whatever it left buffered, then stay out of the way
+            if os.path.exists(self.path):
+                while self.flush(send, force=True):
+                    pass
+            return
+        if self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                self._wakeup.clear()
+                try:
+                    while self.flush(send):
+                        pass
+                    with self._lock:
+                        due_in = self._due_in()
+                except Exception as e:
+                    print(f"[!] Sales digest flush failed: {e}")
+                    due_in = 60.0
+                self._wakeup.wait(self.window_seconds if due_in is None else due_in)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name="sales-digest", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            pending, oldest = self._connect().execute("SELECT COUNT(*), MIN(added_at) FROM digest").fetchone()
+        return {
+            "enabled": self.enabled,
+            "pending": pending,
+            "oldest_seconds": round(self.clock() - oldest, 1) if oldest else None,
+            "digests_sent": self.digests_sent,
+            "leads_sent": self.leads_sent,
+        }
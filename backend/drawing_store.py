@@ -0,0 +1,159 @@
+# backend/drawing_store.py
+#
+# Content-addressed storage for uploaded drawings.
+# Uploads are streamed to disk in chunks while being hashed, capped at
+# MAX_UPLOAD_MB, and stored as uploads/<sha256><ext>. Two visitors uploading
+# "drawing.pdf" no longer overwrite each other, and re-uploads of the same
+# file are stored once. receive_upload parses the multipart request body as it
+# arrives, so an upload is written to disk once (the framework doesn't spool it
+# first) and cut off as soon as it passes the cap.
+
+import hashlib
+import os
+import re
+import tempfile
+
+from starlette.concurrency import run_in_threadpool
+try:
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError: # python-multipart before 0.0.13
+    from multipart.exceptions import FormParserError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from compaction import archive_index
+
+UPLOAD_DIR = "uploads"
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class InvalidUpload(ValueError):
+    pass
+
+
+def _extension(filename):
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,10}", ext) else ""
+
+class UploadWriter:
+    """Writes one upload into UPLOAD_DIR under its SHA-256, chunk by chunk as it arrives.
+
+    Blocking; call it from a worker thread.
+    """
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+        self.size = 0
+        fd, self.tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+        self.out = os.fdopen(fd, "wb")
+
+    def write(self, chunks):
+        for chunk in chunks:
+            self.size += len(chunk)
+            if self.size > MAX_UPLOAD_BYTES:
+                raise UploadTooLarge(f"Drawing exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit")
+            self.digest.update(chunk)
+            self.out.write(chunk)
+
+    def finish(self, original_name):
+        """Move the upload into place. Returns (stored_name, size)."""
+        self.out.close()
+        stored_name = self.digest.hexdigest() + _extension(original_name)
+        final_path = os.path.join(UPLOAD_DIR, stored_name)
+        if os.path.exists(final_path):
+            os.remove(self.tmp_path) # Same content already stored
+        else:
+            os.replace(self.tmp_path, final_path)
+        return stored_name, self.size
+
+    def abort(self):
+        self.out.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+async def receive_upload(content_type, stream, field):
+    """Stream the file in the multipart/form-data part named field into UPLOAD_DIR.
+
+    The body is parsed as it arrives from stream (request.stream()), so it is
+    written once, and an upload is cut off as soon as it passes MAX_UPLOAD_BYTES.
+    Other parts are skipped. Returns (stored_name, original_name, size).
+    Raises UploadTooLarge, or InvalidUpload for a malformed body.
+    """
+    _, params = parse_options_header(content_type)
+    if b"boundary" not in params:
+        raise InvalidUpload("Expected a multipart/form-data body")
+    writer, original_name = None, None
+    part = {"headers": {}, "name": b"", "value": b"", "file": False}
+    pending, pending_bytes = [], 0
+
+    def on_part_begin():
+        part.update(headers={}, file=False)
+
+    def on_header_field(data, start, end):
+        part["name"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["name"].lower()] = part["value"]
+        part.update(name=b"", value=b"")
+
+    def on_headers_finished():
+        nonlocal writer, original_name
+        _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        if options.get(b"name") == field.encode() and b"filename" in options and writer is None:
+            original_name = options[b"filename"].decode("utf-8", "replace")
+            writer = UploadWriter()
+            part["file"] = True
+
+    def on_part_data(data, start, end):
+        nonlocal pending_bytes
+        if part["file"]:
+            pending.append(data[start:end])
+            pending_bytes += end - start
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin, "on_header_field": on_header_field, "on_header_value": on_header_value,
+        "on_header_end": on_header_end, "on_headers_finished": on_headers_finished, "on_part_data": on_part_data,
+    })
+    try:
+        async for chunk in stream:
+            parser.write(chunk)
+            # Disk writes and hashing go to a worker thread, about UPLOAD_CHUNK_BYTES at a time
+            if pending_bytes >= UPLOAD_CHUNK_BYTES:
+                await run_in_threadpool(writer.write, pending)
+                pending, pending_bytes = [], 0
+        parser.finalize()
+        if writer is None:
+            raise InvalidUpload(f"No file in the '{field}' field")
+        await run_in_threadpool(writer.write, pending)
+        stored_name, size = await run_in_threadpool(writer.finish, original_name)
+        return stored_name, original_name, size
+    except FormParserError as e:
+        if writer is not None:
+            writer.abort()
+        raise InvalidUpload(f"Malformed upload: {e}")
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+
+def drawing_path(stored_name):
+    """Resolve a drawing name sent back by the client to a file in UPLOAD_DIR, or None."""
+    if not stored_name:
+        return None
+    name = os.path.basename(stored_name)
+    path = os.path.join(UPLOAD_DIR, name)
+    if os.path.isfile(path):
+        return path
+    # Older drawings may have been packed into an archive shard
+    return archive_index.restore(UPLOAD_DIR, name)
@@ -0,0 +1,82 @@
+# backend/export_leads.py
+#
+# Command-line lead export for the CRM, streaming from the lead index.
+#
+#   python export_leads.py --format csv --since 2025-01-01 --division "DM Thermoformer" -o leads.csv
+#   python export_leads.py --format csv -o leads.csv --resume   # continue after the last exported row
+
+import argparse
+import os
+import re
+import sys
+from datetime import datetime
+
+from leads import EXPORT_FORMATS, LeadIndex, export_chunks, export_lines
+
+
+def last_cursor(path, fmt):
+    """Cursor of the last complete row in a partial export, or None.
+
+    A trailing partial row (from an interrupted write) is cut off so the resumed
+    rows append cleanly. Only the tail of the file is read.
+    """
+    # csv.writer ends rows with \r\n, JSON lines never contain a raw newline
+    terminator = b"\r\n" if fmt == "csv" else b"\n"
+    pattern = re.compile(rb',([A-Za-z0-9_-]+)\r\n$' if fmt == "csv" else rb'"cursor": "([A-Za-z0-9_-]+)"\}\n$')
+    try:
+        f = open(path, "rb+")
+    except FileNotFoundError:
+        return None
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        tail_size = 64 * 1024
+        while True:
+            start = max(0, size - tail_size)
+            f.seek(start)
+            tail = f.read()
+            end = tail.rfind(terminator)
+            if end != -1 or start == 0:
+                break
+            tail_size *= 2
+        if end == -1:
+            f.truncate(0)
+            return None
+        complete = start + end + len(terminator)
+        f.truncate(complete)
+        match = pattern.search(tail[:end + len(terminator)])
+        return match.group(1).decode() if match else None # None: only the CSV header so far
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export indexed leads as CSV or JSONL.")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--division")
+    parser.add_argument("--since", help="ISO date or datetime, inclusive")
+    parser.add_argument("--until", help="ISO date or datetime, exclusive")
+    parser.add_argument("--cursor", help="resume after the row carrying this cursor")
+    parser.add_argument("--resume", action="store_true", help="append to --output after its last row")
+    parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+
+    cursor = args.cursor
+    if args.resume:
+        if not args.output:
+            parser.error("--resume needs --output")
+        cursor = last_cursor(args.output, args.format) or cursor
+
+    leads = LeadIndex().iter_leads(
+        cursor=cursor, division=args.division,
+        since=datetime.fromisoformat(args.since).timestamp() if args.since else None,
+        until=datetime.fromisoformat(args.until).timestamp() if args.until else None,
+    )
+    out = open(args.output, "a" if cursor else "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for chunk in export_chunks(export_lines(leads, args.format, header=not cursor)):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
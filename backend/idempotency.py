@@ -0,0 +1,83 @@
+# backend/idempotency.py
+#
+# Duplicate-submission guard for the get_email stage.
+# A retried /chat (network blip, double click) must not queue the lead again,
+# or the PDF is rendered twice and both emails go out twice. Each submission
+# is keyed on the client's Idempotency-Key header when it sends one, otherwise
+# on a fingerprint of the submitted user_details. The first response is kept
+# for SUBMISSION_TTL_SECONDS and replayed to duplicates. A key is stored with
+# the fingerprint of the payload it came with, so reusing it for a different
+# inquiry is rejected instead of silently answered with the first response.
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+
+SUBMISSION_TTL_SECONDS = float(os.getenv("SUBMISSION_TTL_SECONDS", "600"))
+SUBMISSION_CACHE_MAX = int(os.getenv("SUBMISSION_CACHE_MAX", "5000"))
+
+# Bookkeeping that can differ between two submissions of the same inquiry
+VOLATILE_KEYS = {"stage_history"}
+
+
+def submission_fingerprint(user_details):
+    stable = {k: v for k, v in user_details.items() if k not in VOLATILE_KEYS}
+    canonical = json.dumps(stable, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class IdempotencyKeyReused(ValueError):
+    def __init__(self):
+        super().__init__("Idempotency-Key was already used for a different submission")
+
+
+class SubmissionCache:
+    def __init__(self, ttl_seconds=SUBMISSION_TTL_SECONDS, max_entries=SUBMISSION_CACHE_MAX, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (stored_at, fingerprint, response), oldest first
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def get(self, key, fingerprint=None):
+        """The response stored for key, counting the hit as a suppressed duplicate; None if unseen or expired.
+
+        Raises IdempotencyKeyReused if key was stored for a payload with another fingerprint.
+        """
+        with self._lock:
+            self._expire(self.clock())
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] != fingerprint:
+                raise IdempotencyKeyReused()
+            self.duplicates += 1
+            return entry[2]
+
+    def put(self, key, response, fingerprint=None):
+        with self._lock:
+            self._entries[key] = (self.clock(), fingerprint, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _expire(self, now):
+        # Fixed TTL and insertion order, so expired entries are always at the front
+        deadline = now - self.ttl_seconds
+        while self._entries:
+            stored_at = next(iter(self._entries.values()))[0]
+            if stored_at > deadline:
+                break
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "duplicates_suppressed": self.duplicates}
@@ -0,0 +1,89 @@
+# backend/intents.py
+#
+# Free-text intent matching for the chat stages.
+# All phrase sets are compiled once into a single word-boundary-aware regex, so
+# short phrases like "no" or "na" only match whole words ("nanotech" is not a
+# "na"). Every stage asks the same INTENTS matcher which intents an answer hits.
+# The phrases are merged into a character trie before compiling, so the regex
+# tries each shared prefix ("no", "not", "nothing") once rather than once per phrase.
+
+import re
+
+INTENT_PHRASES = {
+    # Global commands, matched against the whole input only
+    "reset": ["new proposal", "restart", "reset"],
+
+    # get_drawing: the user has no drawing to upload
+    "no_drawing": [
+        "no drawing", "no", "na", "n/a", "not available", "none", "nope",
+        "don't have", "dont have", "skip", "no draw", "not yet",
+        "i dont have", "i don't have", "without", "later"
+    ],
+
+    # post_engagement
+    "new_inquiry": ["new", "new inquiry", "create new inquiry", "another"],
+    "decline": ["no", "nope", "nothing", "nothing else", "good", "i'm good", "im good", "no thanks", "that's all", "done"],
+}
+
+
+def normalize(text):
+    return text.lower().replace("’", "'").replace(".", "").replace(",", "").strip()
+
+
+def _trie_pattern(phrases):
+    """A regex alternation of phrases with common prefixes factored out, longest match first."""
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {} # end of a phrase
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # A phrase may end here: the rest is optional, and greedy, so longer phrases win
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class IntentMatcher:
+    def __init__(self, phrase_sets):
+        intents_by_phrase = {}
+        for intent, phrases in phrase_sets.items():
+            for phrase in phrases:
+                intents_by_phrase.setdefault(normalize(phrase), set()).add(intent)
+
+        # A match on a long phrase hides the shorter phrases inside it ("no" in
+        # "no drawing"), so each phrase also carries the intents of its sub-phrases.
+        for phrase, intents in intents_by_phrase.items():
+            for other, other_intents in intents_by_phrase.items():
+                if other != phrase and re.search(rf"(?<!\w){re.escape(other)}(?!\w)", phrase):
+                    intents |= other_intents
+
+        self.intents_by_phrase = {p: frozenset(i) for p, i in intents_by_phrase.items()}
+        # The lookahead reports a match at every start position. When every phrase starts and
+        # ends with a word character, (?<!\w) and (?!\w) are just \b, which the engine checks
+        # before trying the trie at a position
+        if all(re.match(r"\w", p) and re.search(r"\w$", p) for p in self.intents_by_phrase):
+            before, after = r"\b", r"\b"
+        else:
+            before, after = r"(?<!\w)", r"(?!\w)"
+        self.pattern = re.compile(rf"{before}(?=({_trie_pattern(self.intents_by_phrase)}){after})")
+
+    def find(self, text):
+        """All intents whose phrases occur in text as whole words."""
+        found = set()
+        for phrase in self.pattern.findall(normalize(text)):
+            found |= self.intents_by_phrase[phrase]
+        return found
+
+    def exact(self, text):
+        """Intents of text when the whole input is one of the phrases."""
+        return self.intents_by_phrase.get(normalize(text), frozenset())
+
+
+INTENTS = IntentMatcher(INTENT_PHRASES)
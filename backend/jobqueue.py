@@ -0,0 +1,249 @@
+# backend/jobqueue.py
+#
+# Durable lead-processing queue.
+# Jobs are rows in a local SQLite file, drained by a small pool of worker
+# threads that never share the request threadpool. Failed jobs are retried with
+# exponential backoff and parked as 'dead' after max_attempts, and jobs that
+# were running when the process stopped are picked up again on the next start.
+# A handler that got part of its work done raises PartialFailure with what is
+# left, so the retry doesn't repeat the part that succeeded.
+# Finished ('done') jobs carry the lead's contact details in their payload, so
+# they are deleted LEAD_JOB_RETENTION_HOURS after finishing. Dead jobs are kept
+# until they are retried.
+
+from collections import deque
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import traceback
+
+from metrics import JOB_SECONDS
+
+LEAD_QUEUE_DB = os.getenv("LEAD_QUEUE_DB", "lead_jobs.db")
+LEAD_WORKERS = int(os.getenv("LEAD_WORKERS", "2"))
+LEAD_MAX_ATTEMPTS = int(os.getenv("LEAD_MAX_ATTEMPTS", "5"))
+LEAD_RETRY_BASE_SECONDS = float(os.getenv("LEAD_RETRY_BASE_SECONDS", "5"))
+LEAD_JOB_RETENTION_HOURS = float(os.getenv("LEAD_JOB_RETENTION_HOURS", "24"))
+PRUNE_INTERVAL_SECONDS = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending | running | done | dead
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_at);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (status, finished_at);
+"""
+
+
+class PartialFailure(Exception):
+    """Raised by a handler that finished part of its job; the retry runs with payload instead."""
+
+    def __init__(self, message, payload):
+        super().__init__(message)
+        self.payload = payload
+
+
+class JobQueue:
+    def __init__(self, path=LEAD_QUEUE_DB, workers=LEAD_WORKERS, max_attempts=LEAD_MAX_ATTEMPTS,
+                 retry_base=LEAD_RETRY_BASE_SECONDS, retry_cap=600.0, retention_hours=LEAD_JOB_RETENTION_HOURS):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self.retention_seconds = retention_hours * 3600
+        self.handlers = {}
+        self.listeners = []  # fn(job_id, kind, payload, status), called from worker threads
+        self.latencies = deque(maxlen=1000)  # enqueue -> done, seconds
+        self.failures = 0
+        self.pruned = 0
+        self._pruned_at = 0.0
+        self._db = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads = []
+        self._running = False
+
+    # --- SETUP ---
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def add_listener(self, listener):
+        """Call listener(job_id, kind, payload, status) after each attempt: 'done', 'retrying' or 'dead'."""
+        self.listeners.append(listener)
+
+    def _notify(self, job_id, kind, payload, status):
+        for listener in self.listeners:
+            try:
+                listener(job_id, kind, payload, status)
+            except Exception as e:
+                print(f"[!] Job listener failed: {e}")
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            db = self._connect()
+            # Restart recovery: anything left 'running' was interrupted mid-flight
+            recovered = db.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'").rowcount
+            self.prune()
+            self._running = True
+        if recovered:
+            print(f"[*] Job queue recovered {recovered} interrupted job(s)")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"lead-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=10):
+        with self._lock:
+            self._running = False
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    # --- PRODUCER ---
+    def enqueue(self, kind, payload):
+        now = time.time()
+        with self._lock:
+            job_id = self._connect().execute(
+                "INSERT INTO jobs (kind, payload, run_at, created_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload), now, now),
+            ).lastrowid
+            self._wakeup.notify()
+        return job_id
+
+    # --- WORKERS ---
+    def _claim(self):
+        """Take the next due job, or return the number of seconds until one is due."""
+        now = time.time()
+        db = self._connect()
+        row = db.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1 "
+            "WHERE id = (SELECT id FROM jobs WHERE status = 'pending' AND run_at <= ? ORDER BY run_at LIMIT 1) "
+            "RETURNING id, kind, payload, attempts, created_at",
+            (now,),
+        ).fetchone()
+        if row:
+            return row
+        next_run = db.execute("SELECT MIN(run_at) FROM jobs WHERE status = 'pending'").fetchone()[0]
+        return None if next_run is None else max(next_run - now, 0.0)
+
+    def _work(self):
+        while True:
+            with self._lock:
+                job = None
+                while self._running:
+                    job = self._claim()
+                    if isinstance(job, tuple):
+                        break
+                    self._wakeup.wait(timeout=job)
+                if not self._running:
+                    return
+            self._run(*job)
+
+    def _run(self, job_id, kind, payload, attempts, created_at):
+        started = time.perf_counter()
+        payload = json.loads(payload)
+        try:
+            self.handlers[kind](payload)
+        except Exception as e:
+            JOB_SECONDS.observe(time.perf_counter() - started, kind, "failed")
+            traceback.print_exc()
+            if isinstance(e, PartialFailure):
+                payload = e.payload
+            dead = self._fail(job_id, attempts, f"{type(e).__name__}: {e}", payload)
+            self._notify(job_id, kind, payload, "dead" if dead else "retrying")
+            return
+        JOB_SECONDS.observe(time.perf_counter() - started, kind, "done")
+        finished = time.time()
+        with self._lock:
+            self._connect().execute(
+                "UPDATE jobs SET status = 'done', finished_at = ?, last_error = NULL WHERE id = ?",
+                (finished, job_id),
+            )
+            self.latencies.append(finished - created_at)
+            if finished - self._pruned_at >= PRUNE_INTERVAL_SECONDS:
+                self.prune(finished)
+        self._notify(job_id, kind, payload, "done")
+
+    def prune(self, now=None):
+        """Delete done jobs finished more than retention_seconds ago. Call with the lock held."""
+        now = time.time() if now is None else now
+        self._pruned_at = now
+        count = self._connect().execute(
+            "DELETE FROM jobs WHERE status = 'done' AND finished_at < ?", (now - self.retention_seconds,)
+        ).rowcount
+        self.pruned += count
+        return count
+
+    def _fail(self, job_id, attempts, error, payload):
+        """Schedule a retry, or dead-letter the job after max_attempts. Returns True if it is dead."""
+        with self._lock:
+            self.failures += 1
+            db = self._connect()
+            db.execute("UPDATE jobs SET payload = ? WHERE id = ?", (json.dumps(payload), job_id))
+            if attempts >= self.max_attempts:
+                print(f"[!] Job {job_id} moved to dead letter after {attempts} attempts: {error}")
+                db.execute(
+                    "UPDATE jobs SET status = 'dead', finished_at = ?, last_error = ? WHERE id = ?",
+                    (time.time(), error, job_id),
+                )
+                return True
+            delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_cap) * random.uniform(0.8, 1.2)
+            print(f"[!] Job {job_id} failed (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+            db.execute(
+                "UPDATE jobs SET status = 'pending', run_at = ?, last_error = ? WHERE id = ?",
+                (time.time() + delay, error, job_id),
+            )
+            self._wakeup.notify()
+            return False
+
+    # --- ADMIN ---
+    def retry_dead(self):
+        """Move dead-lettered jobs back into the queue."""
+        with self._lock:
+            count = self._connect().execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, run_at = ? WHERE status = 'dead'",
+                (time.time(),),
+            ).rowcount
+            self._wakeup.notify_all()
+        return count
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            latencies = sorted(self.latencies)
+
+        def pct(p):
+            return round(latencies[min(int(p * len(latencies)), len(latencies) - 1)], 3) if latencies else None
+
+        return {
+            "pending": counts.get("pending", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "dead": counts.get("dead", 0),
+            "failures": self.failures,
+            "pruned": self.pruned,
+            "workers": len(self._threads),
+            "latency_seconds": {"p50": pct(0.50), "p95": pct(0.95), "max": latencies[-1] if latencies else None},
+        }
@@ -0,0 +1,216 @@
+# backend/leads.py
+#
+# Queryable index of submitted leads.
+# Every submitted user_details is stored once in a local SQLite file under a
+# unique lead id, with indexes on company, email, division and submission time.
+# Lookups and listings are index range scans with keyset pagination, so they
+# don't depend on how many PDFs have piled up in inquiries/.
+
+import base64
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+LEAD_INDEX_DB = os.getenv("LEAD_INDEX_DB", "leads.db")
+MAX_PAGE_SIZE = 200
+EXPORT_BATCH_SIZE = 500 # rows fetched per query while streaming an export
+EXPORT_CHUNK_BYTES = 64 * 1024 # rows are flushed to the client in chunks of about this size
+
+# user_details keys exported as CSV columns, in conversation order
+EXPORT_FIELDS = (
+    "name", "contact_person", "company", "company_address", "email", "phone", "division",
+    "product_type", "properties", "material", "thickness", "drawing_available", "drawing_file", "drawing_filename",
+    "dimensions", "quantity", "timeline", "sample_needed", "delivery_location", "forecast",
+)
+EXPORT_FORMATS = ("csv", "jsonl")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leads (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    company TEXT COLLATE NOCASE,
+    email TEXT COLLATE NOCASE,
+    division TEXT,
+    pdf_filename TEXT,
+    details TEXT NOT NULL  -- user_details as JSON
+);
+CREATE INDEX IF NOT EXISTS leads_created ON leads (created_at, id);
+CREATE INDEX IF NOT EXISTS leads_company ON leads (company, created_at);
+CREATE INDEX IF NOT EXISTS leads_email ON leads (email, created_at);
+CREATE INDEX IF NOT EXISTS leads_division ON leads (division, created_at);
+"""
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, lead_id):
+    return base64.urlsafe_b64encode(f"{created_at!r}|{lead_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, lead_id = raw.split("|", 1)
+        return float(created_at), lead_id
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+
+
+def _row_to_lead(row):
+    lead_id, created_at, company, email, division, pdf_filename, details = row
+    return {
+        "id": lead_id,
+        "created_at": created_at,
+        "company": company,
+        "email": email,
+        "division": division,
+        "pdf_filename": pdf_filename,
+        "user_details": json.loads(details),
+    }
+
+
+class LeadIndex:
+    def __init__(self, path=LEAD_INDEX_DB):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    # --- WRITES ---
+    def add(self, user_details):
+        """Store a submitted lead and return its id."""
+        lead_id = uuid.uuid4().hex
+        with self._lock:
+            self._connect().execute(
+                "INSERT INTO leads (id, created_at, company, email, division, details) VALUES (?, ?, ?, ?, ?, ?)",
+                (lead_id, time.time(), user_details.get("company"), user_details.get("email"),
+                 user_details.get("division"), json.dumps(user_details)),
+            )
+        return lead_id
+
+    def set_pdf(self, lead_id, pdf_filename):
+        with self._lock:
+            self._connect().execute("UPDATE leads SET pdf_filename = ? WHERE id = ?", (pdf_filename, lead_id))
+
+    # --- READS ---
+    def get(self, lead_id):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT id, created_at, company, email, division, pdf_filename, details FROM leads WHERE id = ?",
+                (lead_id,),
+            ).fetchone()
+        return _row_to_lead(row) if row else None
+
+    def _where(self, company=None, email=None, division=None, since=None, until=None):
+        clauses, params = [], []
+        if company:
+            # Prefix match; uses the NOCASE company index
+            escaped = company.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            clauses.append("company LIKE ? ESCAPE '\\'")
+            params.append(escaped + "%")
+        if email:
+            clauses.append("email = ?")
+            params.append(email)
+        if division:
+            clauses.append("division = ?")
+            params.append(division)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        return clauses, params
+
+    def page(self, cursor=None, limit=50, newest_first=True, **filters):
+        """One page of leads matching filters, plus the cursor for the next page (None at the end)."""
+        limit = max(1, limit)
+        clauses, params = self._where(**filters)
+        if cursor:
+            created_at, lead_id = decode_cursor(cursor)
+            clauses.append("(created_at, id) < (?, ?)" if newest_first else "(created_at, id) > (?, ?)")
+            params += [created_at, lead_id]
+        order = "DESC" if newest_first else "ASC"
+        sql = ("SELECT id, created_at, company, email, division, pdf_filename, details FROM leads"
+               + (" WHERE " + " AND ".join(clauses) if clauses else "")
+               + f" ORDER BY created_at {order}, id {order} LIMIT ?")
+        with self._lock:
+            rows = self._connect().execute(sql, params + [limit + 1]).fetchall()
+
+        leads = [_row_to_lead(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(leads[-1]["created_at"], leads[-1]["id"]) if len(rows) > limit else None
+        return leads, next_cursor
+
+    def count(self, **filters):
+        clauses, params = self._where(**filters)
+        sql = "SELECT COUNT(*) FROM leads" + (" WHERE " + " AND ".join(clauses) if clauses else "")
+        with self._lock:
+            return self._connect().execute(sql, params).fetchone()[0]
+
+    def iter_leads(self, cursor=None, batch_size=EXPORT_BATCH_SIZE, **filters):
+        """Yield (lead, cursor) oldest first; resuming from a yielded cursor continues after that lead.
+
+        Only one batch is held in memory at a time.
+        """
+        while True:
+            leads, next_cursor = self.page(cursor=cursor, limit=batch_size, newest_first=False, **filters)
+            for lead in leads:
+                yield lead, encode_cursor(lead["created_at"], lead["id"])
+            if next_cursor is None:
+                return
+            cursor = next_cursor
+
+
+# --- EXPORT ---
+def _csv_rows(leads, header):
+    if header:
+        yield ["lead_id", "created_at", *EXPORT_FIELDS, "pdf_filename", "cursor"]
+    for lead, cursor in leads:
+        details = lead["user_details"]
+        yield [lead["id"], datetime.fromtimestamp(lead["created_at"]).isoformat(timespec="seconds"),
+               *(details.get(field, "") for field in EXPORT_FIELDS), lead["pdf_filename"] or "", cursor]
+
+def export_lines(leads, fmt, header=True):
+    """Render (lead, cursor) pairs as CSV or JSONL lines. Every row carries its resume cursor.
+
+    Pass header=False when resuming, so the output can be appended to the earlier part.
+    """
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in _csv_rows(leads, header):
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    elif fmt == "jsonl":
+        for lead, cursor in leads:
+            created = datetime.fromtimestamp(lead["created_at"]).isoformat(timespec="seconds")
+            yield json.dumps({**lead, "created_at": created, "cursor": cursor}, ensure_ascii=False) + "\n"
+    else:
+        raise ValueError(f"Unknown export format {fmt!r}, expected one of {EXPORT_FORMATS}")
+
+def export_chunks(lines, chunk_bytes=EXPORT_CHUNK_BYTES):
+    """Group lines into chunks of roughly chunk_bytes characters, so a large export is not one write per row."""
+    parts, size = [], 0
+    for line in lines:
+        parts.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield "".join(parts)
+            parts, size = [], 0
+    if parts:
+        yield "".join(parts)
@@ -1,17 +1,17 @@
 # backend/main.py
 
-from fastapi import FastAPI, BackgroundTasks, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Header, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from pydantic import BaseModel, Field
 from typing import Dict, Any, List, Optional
-import shutil
 import os
 from datetime import datetime
-import phonenumbers
-from email_validator import validate_email, EmailNotValidError
-import sys
-import re
-import traceback
+import time
+import json
+import asyncio
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,15 +19,107 @@ load_dotenv()
 # Internal imports
 # from excel_handler import load_service_data
 # from country_data import countries
-from pdf_writer import create_sales_pdf
-from utils import send_email_with_attachment
-
-app = FastAPI(title="DM Thermoformer AI Agent", version="4.0.0")
+# pdf_writer (fpdf, fontTools, numpy) only runs in the attachments pool; requests is imported on first use, see warm_up()
+from utils import FAILED, REJECTED, SENT, attachment_cache, build_message, send_emails
+from intents import INTENTS
+from stages import STAGE_NAMES, STAGES, STATIC_REPLIES, StageResult, run_stage, stage_prompt, welcome
+from state import MAX_INPUT_CHARS, ConversationState
+from contacts import cache_stats as contact_cache_stats, check_contact
+from responses import encode_chat_response, fragments
+from sessions import SessionStore, diff_state
+from jobqueue import JobQueue, PartialFailure
+from idempotency import IdempotencyKeyReused, SubmissionCache, submission_fingerprint
+from ratelimit import ConcurrencyCap, RateLimited, RateLimits, client_key
+from leads import EXPORT_FORMATS, MAX_PAGE_SIZE, InvalidCursor, LeadIndex, decode_cursor, export_chunks, export_lines
+from drawing_store import MAX_UPLOAD_BYTES, InvalidUpload, UploadTooLarge, drawing_path, receive_upload
+from compaction import archive_index, start_compactor, stop_compactor
+from digest import SalesDigest
+from attachments import (as_attachments, fit_budget, linked_drawings_note, prepare_drawings, preview_of, render_pdf,
+                         renamed, shutdown_pool, verify_drawing_link, warm_pool)
+from profiling import profile_requested, profiler
+from metrics import REGISTRY, CHAT_STAGE_SECONDS, PDF_RENDER_SECONDS, UPLOAD_WRITE_SECONDS, UPLOAD_BYTES
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+@asynccontextmanager
+async def lifespan(app):
+    lead_queue.start()
+    sales_digest.start(queue_digest)
+    start_compactor()
+    yield
+    stop_compactor()
+    sales_digest.stop()
+    lead_queue.stop()
+    archive_pool.shutdown(wait=True)
+    shutdown_pool()
+
+app = FastAPI(title="DM Thermoformer AI Agent", version="4.0.0", lifespan=lifespan)
 
 @app.get("/")
 async def health_check():
     return {"status": "awake"}
 
+@app.get("/queue")
+async def queue_stats():
+    return {**lead_queue.stats(), "attachment_cache": attachment_cache.stats(), "submissions": submissions.stats(),
+            "rate_limits": rate_limits.stats(), "response_fragments": fragments.stats(),
+            "sales_digest": sales_digest.stats(), "contact_checks": contact_cache_stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# --- ADMISSION CONTROL ---
+UPLOAD_MAX_CONCURRENCY = int(os.getenv("UPLOAD_MAX_CONCURRENCY", "4"))
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+RATE_LIMITED_PATHS = {"/chat": "chat", "/upload_drawing": "upload"}
+rate_limits = RateLimits()
+upload_slots = ConcurrencyCap(UPLOAD_MAX_CONCURRENCY)
+
+def too_many_requests(detail, retry_after):
+    return JSONResponse({"detail": detail}, status_code=429, headers={"Retry-After": str(max(1, round(retry_after + 0.5)))})
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request, exc: RateLimited):
+    return too_many_requests(str(exc), exc.retry_after)
+
+@app.exception_handler(IdempotencyKeyReused)
+async def key_reused_handler(request, exc: IdempotencyKeyReused):
+    return JSONResponse({"detail": str(exc)}, status_code=422)
+
+def upload_too_large(content_length):
+    # The multipart body is the file plus boundaries and part headers
+    try:
+        return int(content_length) > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+    except (TypeError, ValueError):
+        return False
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    # Runs before the body is read, so a throttled upload never reaches the disk.
+    # Registered before CORSMiddleware, which therefore wraps it and adds CORS headers to 429s.
+    budget = RATE_LIMITED_PATHS.get(request.url.path)
+    if budget is None or request.method == "OPTIONS":
+        return await call_next(request)
+    if budget == "upload" and upload_too_large(request.headers.get("content-length")):
+        # Rejected from the header alone; a chunked body (no Content-Length) is cut off by
+        # receive_upload once MAX_UPLOAD_BYTES of it have been read
+        return JSONResponse({"detail": f"Drawing exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit"},
+                            status_code=413)
+    try:
+        rate_limits.check(budget, client_key(request))
+    except RateLimited as e:
+        return too_many_requests(str(e), e.retry_after)
+    if budget != "upload":
+        return await call_next(request)
+    if not upload_slots.try_enter():
+        return too_many_requests("Too many uploads in progress, retry shortly", upload_slots.retry_after)
+    try:
+        return await call_next(request)
+    finally:
+        upload_slots.leave()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], 
@@ -41,34 +133,106 @@ app.add_middleware(
 # services_data, main_services, sub_categories_others, app_sub_category_definitions = load_service_data()
 
 BACK_COMMAND = "__GO_BACK__"
+BACK_TO_START = ("Welcome to **DM Thermoformer & RA Vacform Industries**! 👋\n\nWhat is your **Name**?",)
 SALES_TEAM_EMAIL = "aadhii0803@gmail.com" # Updated per context, or keep if verified
+INQUIRY_DIR = "inquiries"
+ARCHIVE_INQUIRIES = os.getenv("ARCHIVE_INQUIRIES", "1") != "0" # Keep a PDF copy of every lead on disk
+archive_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inquiry-archive")
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") # Lead data endpoints are disabled until this is set
+MAX_CONTACT_BATCH = 1000
+MAX_HOT_FUNCTIONS = 200
+
+sessions = SessionStore()
+lead_index = LeadIndex()
+submissions = SubmissionCache()
+
+# Pre-encode every static prompt, option list and UI card once
+fragments.add_stages(STAGES)
+for reply in (*STATIC_REPLIES, BACK_TO_START):
+    fragments.add(reply)
+
+# --- COLD START ---
+# The host sleeps when idle, so the first visitor pays for startup. Only what the
+# first chat turns need is imported eagerly; the lead pipeline is loaded by
+# warm_up() in the background once the first /chat response has gone out.
+WARM_UP_AFTER_FIRST_CHAT = os.getenv("WARM_UP_AFTER_FIRST_CHAT", "1") != "0"
+# The PDF / drawing pool otherwise starts with the first lead; warming it costs its RAM even if none comes
+WARM_UP_POOL = os.getenv("WARM_UP_POOL", "0") != "0"
+_warm_up_scheduled = False
+
+def warm_up():
+    started = time.perf_counter()
+    try:
+        import materials, requests, contacts
+        if WARM_UP_POOL:
+            warm_pool() # spawns the PDF / drawing workers, which load the fonts
+        contacts.check_phone("+91 98765 43210") # phonenumbers + the default region's metadata
+        contacts.check_email("warm-up@example.com")
+    except Exception as e:
+        print(f"[!] Warm-up failed: {e}")
+        return
+    print(f"[*] Warm-up finished in {time.perf_counter() - started:.2f}s")
+
+def schedule_warm_up(background_tasks: BackgroundTasks):
+    global _warm_up_scheduled
+    if WARM_UP_AFTER_FIRST_CHAT and not _warm_up_scheduled:
+        _warm_up_scheduled = True
+        background_tasks.add_task(warm_up) # Runs after the response is sent
 
 # --- MODELS ---
 class ChatRequest(BaseModel):
-    stage: str
-    user_details: Dict[str, Any]
-    user_input: str | None = None
+    stage: str | None = None # Not needed in session mode
+    user_details: ConversationState | None = None # Not needed in session mode
+    user_input: str | None = Field(None, max_length=MAX_INPUT_CHARS)
+    session_id: str | None = None # "" starts a new server-side session
+
+class StateDelta(BaseModel):
+    changed: Dict[str, Any] # user_details keys set during this turn
+    reset: bool = False # True when the conversation started over
+    history_depth: int = 0 # len(stage_history), drives the Back button
 
 class ChatResponse(BaseModel):
     next_stage: str
     bot_message: str | None = None # Optional now, prefer bot_messages
     bot_messages: List[str] | None = None # Support for multiple messages
-    user_details: Dict[str, Any]
+    user_details: Dict[str, Any] | None = None # Omitted in session mode, see delta
     ui_elements: Dict[str, Any] | None = None
+    session_id: str | None = None
+    delta: StateDelta | None = None
+
+def chat_json(response: ChatResponse):
+    # Spliced from pre-encoded fragments; skips response_model validation and re-serialization
+    return Response(encode_chat_response(response), media_type="application/json")
 
 class ProposalRequest(BaseModel):
     user_details: Dict[str, Any]
     category: str | None = None
 
 # --- UTILITIES ---
-def extract_email(text: str):
-    match = re.search(r'[\w.+-]+@[\w-]+\.[\w.-]+', text)
-    return match.group(0) if match else None
-
 def sanitize_filename(name):
     return "".join([c if c.isalnum() else "_" for c in name])
 
+def archive_inquiry(pdf_filename, pdf_bytes):
+    try:
+        os.makedirs(INQUIRY_DIR, exist_ok=True)
+        with open(os.path.join(INQUIRY_DIR, pdf_filename), "wb") as f:
+            f.write(pdf_bytes)
+    except Exception as e:
+        print(f"[!] Could not archive {pdf_filename}: {e}")
+
 # --- BACKGROUND TASK ---
+def lead_summary(user_details: Dict[str, Any]):
+    return f"""Client Contact: {user_details.get('contact_person')}
+Company: {user_details.get('company')}
+Division: {user_details.get('division')}
+Material: {user_details.get('material')}
+Quantity: {user_details.get('quantity')}
+Email: {user_details.get('email')}
+Phone: {user_details.get('phone')}"""
+
+LEAD_EMAILS = ("client", "sales")
+
 def process_lead_and_send_email(user_details: Dict[str, Any]):
     print(f"[*] Starting process_lead_and_send_email for {user_details.get('email')}")
     try:
@@ -78,30 +242,40 @@ def process_lead_and_send_email(user_details: Dict[str, Any]):
             print("[!] No email found in user_details")
             return
 
-        # 2. Generate Sales PDF
-        output_dir = "inquiries"
-        os.makedirs(output_dir, exist_ok=True)
+        # What is left to send: a retry after a partial failure only carries the emails that failed
+        pending = user_details.get('pending_emails', LEAD_EMAILS)
+
+        # 2. Generate Sales PDF (in memory, archived to disk off the critical path)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         company_slug = sanitize_filename(user_details.get('company', 'Client'))
         
-        pdf_filename = f"{company_slug}_Sales_Inquiry_{timestamp}.pdf"
-        pdf_path = os.path.join(output_dir, pdf_filename)
-        
-        create_sales_pdf(user_details, pdf_path)
-        
-        # Prepare attachments
-        attachments = [pdf_path]
-        drawing_file = user_details.get('drawing_file')
-        if drawing_file:
-            drawing_path = os.path.join(UPLOAD_DIR, drawing_file)
-            if os.path.exists(drawing_path):
-                attachments.append(drawing_path)
+        lead_id = user_details.get('lead_id')
+        # The lead id keeps two same-second leads from one company apart
+        pdf_filename = f"{company_slug}_Sales_Inquiry_{timestamp}{'_' + lead_id[:8] if lead_id else ''}.pdf"
+        # In digest mode the sales team gets the merged digest PDF, so this one is only rendered for the archive
+        pdf_bytes = None
+        drawings = []
+        if "sales" in pending and (ARCHIVE_INQUIRIES or not sales_digest.enabled):
+            # Drawings are compressed and previewed in the process pool, see attachments.py
+            drawing_file = drawing_path(user_details.get('drawing_file'))
+            drawings = [renamed(drawing, user_details.get('drawing_filename'))
+                        for drawing in prepare_drawings([drawing_file] if drawing_file else [])]
+            # Rendered in the pool too: fpdf is pure Python and would hold the GIL against /chat
+            with PDF_RENDER_SECONDS.time():
+                pdf_bytes = render_pdf("create_sales_pdf", user_details, preview=preview_of(drawings[0]) if drawings else None,
+                                       profile=profiler.forced())
+        if pdf_bytes is not None and ARCHIVE_INQUIRIES:
+            archive_pool.submit(archive_inquiry, pdf_filename, pdf_bytes)
+            if lead_id:
+                lead_index.set_pdf(lead_id, pdf_filename)
         
         # 3. Email Client (Acknowledgement)
-        send_email_with_attachment(
-            receiver_email=user_email,
-            subject=f"Inquiry Received: {user_details.get('division', 'Custom Plastic Solution')} - DM Thermoformer",
-            body=f"""Hi {user_details.get('contact_person', user_details.get('name', 'Client'))},
+        messages = {}
+        if "client" in pending:
+            messages["client"] = build_message(
+                receiver_email=user_email,
+                subject=f"Inquiry Received: {user_details.get('division', 'Custom Plastic Solution')} - DM Thermoformer",
+                body=f"""Hi {user_details.get('contact_person', user_details.get('name', 'Client'))},
 
 Thank you for contacting DM Thermoformer.
 
@@ -109,29 +283,134 @@ We have received your inquiry for a {user_details.get('division', 'custom plasti
 
 Best Regards,
 DM Thermoformer Sales Team"""
-        )
+            )
 
-        # 4. Email Sales Team (Lead)
-        send_email_with_attachment(
-            receiver_email=SALES_TEAM_EMAIL,
-            subject=f"🚀 NEW SALES LEAD: {user_details.get('company', 'Unknown')} - {user_details.get('division', 'Custom Plastic')}",
-            body=f"""New Sales Inquiry Received.
+        # 4. Email Sales Team (Lead), or park it for the next digest
+        if "sales" in pending and sales_digest.enabled:
+            sales_digest.add(lead_id or f"{user_email}:{timestamp}", user_details)
+        elif "sales" in pending:
+            # Drawings that would push the email past the attachment budget are sent as links
+            attach, linked = fit_budget(drawings, reserved=len(pdf_bytes))
+            attachments = [(pdf_filename, pdf_bytes)]
+            attachment_paths = as_attachments(attach)
+            messages["sales"] = build_message(
+                receiver_email=SALES_TEAM_EMAIL,
+                subject=f"🚀 NEW SALES LEAD: {user_details.get('company', 'Unknown')} - {user_details.get('division', 'Custom Plastic')}",
+                body=f"""New Sales Inquiry Received.
+
+{lead_summary(user_details)}
+
+See full technical summary attached in the PDF.""" + (f"\n\n{linked_drawings_note(linked)}" if linked else ""),
+                attachment_paths=attachment_paths,
+                attachments=attachments
+            )
+        if not messages:
+            return
 
-Client Contact: {user_details.get('contact_person')}
-Company: {user_details.get('company')}
-Division: {user_details.get('division')}
-Material: {user_details.get('material')}
-Quantity: {user_details.get('quantity')}
-Email: {user_email}
-Phone: {user_details.get('phone')}
+        # Both emails go out in one Mailjet call, which accepts or refuses each on its own
+        statuses = dict(zip(messages, send_emails(list(messages.values()))))
+        if statuses.get("client") == REJECTED:
+            # Most likely a mistyped address: the sales team still has the lead, so don't retry
+            print(f"[!] Acknowledgement to {user_email} was rejected, not retrying it")
+        failed = [name for name, status in statuses.items() if status == FAILED or (name == "sales" and status == REJECTED)]
+        if failed:
+            # The job queue retries (and eventually dead-letters) only the emails that didn't go out
+            raise PartialFailure(f"Email delivery failed: {', '.join(failed)}", {**user_details, 'pending_emails': failed})
 
-See full technical summary attached in the PDF.""",
-            attachment_paths=attachments
-        )
-        
     except Exception as e:
         print(f"[!] Background Task Error: {e}")
-        traceback.print_exc()
+        raise
+
+def send_sales_digest(payload: Dict[str, Any]):
+    # One email, one merged PDF and every drawing for a batch of buffered leads
+    leads = payload['leads']
+    paths = [drawing_path(lead.get('drawing_file')) for lead in leads]
+    uploads = [(path, lead.get('drawing_filename')) for path, lead in zip(paths, leads) if path]
+    drawings = [renamed(drawing, name) for drawing, (_, name) in zip(prepare_drawings([path for path, _ in uploads]), uploads)]
+    by_path = {drawing.path: drawing for drawing in drawings}
+    with PDF_RENDER_SECONDS.time():
+        pdf_bytes = render_pdf("create_digest_pdf", leads, previews=[preview_of(by_path.get(path)) for path in paths],
+                               profile=profiler.forced())
+    attach, linked = fit_budget(drawings, reserved=len(pdf_bytes))
+    attachment_paths = as_attachments(attach)
+    companies = ", ".join(str(lead.get('company', 'Unknown')) for lead in leads)
+    summaries = "\n\n".join(f"{i}. {lead_summary(lead)}" for i, lead in enumerate(leads, 1))
+    message = build_message(
+        receiver_email=SALES_TEAM_EMAIL,
+        subject=f"🚀 {len(leads)} NEW SALES LEAD{'S' if len(leads) > 1 else ''}: {companies}",
+        body=f"""Sales digest: {len(leads)} new inquir{'ies' if len(leads) > 1 else 'y'} received.
+
+{summaries}
+
+See the full technical summaries attached in the PDF, one page per lead.""" + (f"\n\n{linked_drawings_note(linked)}" if linked else ""),
+        attachment_paths=attachment_paths,
+        attachments=[(f"Sales_Digest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf", pdf_bytes)]
+    )
+    if send_emails([message]) != [SENT]:
+        raise RuntimeError("Digest delivery failed")
+
+lead_queue = JobQueue()
+lead_queue.register("lead", process_lead_and_send_email)
+lead_queue.register("sales_digest", send_sales_digest)
+
+# Batched sales-team emails, off unless SALES_DIGEST_WINDOW_MINUTES is set
+sales_digest = SalesDigest()
+
+def queue_digest(leads):
+    lead_queue.enqueue("sales_digest", {'leads': leads})
+
+def submit_lead(user_details: Dict[str, Any], on_lead=None):
+    # Index the lead, then queue the Sales PDF + emails (persisted, retried by the workers)
+    lead_id = lead_index.add(user_details)
+    if on_lead:
+        on_lead(lead_id) # before the job exists, so nothing it reports can be missed
+    lead_queue.enqueue("lead", {**user_details, 'lead_id': lead_id})
+    return lead_id
+
+async def submit_once(user_details: Dict[str, Any], response, idempotency_key: str | None = None, client: str = "unknown",
+                      on_lead=None):
+    """Submit the lead unless this is a repeat. Returns (response, lead_id); lead_id is None for a repeat.
+
+    on_lead(lead_id) is called from a worker thread once the lead has an id, before its job is queued.
+    """
+    # A retried submission (double click, network retry) replays the first response
+    # instead of rendering the PDF and sending both emails again
+    fingerprint = submission_fingerprint(user_details)
+    key = f"key:{idempotency_key}" if idempotency_key else f"fp:{fingerprint}"
+    # Scoped to the client and session: a replay must come from the same visitor and have the
+    # shape of its own mode, and one visitor's key never answers another's request
+    key = f"{client}:{response.session_id or ''}:{key}"
+    original = submissions.get(key, fingerprint) # IdempotencyKeyReused if the key came with another inquiry
+    if original is not None:
+        print(f"[*] Duplicate submission for {user_details.get('email')} suppressed")
+        return original, None
+    rate_limits.check("lead", client) # Duplicates above are free; new leads spend the client's lead budget
+    # Claimed before the SQLite writes leave the event loop, so a duplicate arriving meanwhile replays this response
+    submissions.put(key, response, fingerprint)
+    try:
+        lead_id = await run_in_threadpool(submit_lead, user_details, on_lead)
+    except BaseException:
+        submissions.discard(key)
+        raise
+    return response, lead_id
+
+@REGISTRY.collector
+def _queue_metrics():
+    stats = lead_queue.stats()
+    cache = attachment_cache.stats()
+    return [
+        ("lead_jobs", "gauge", "Lead jobs in the queue by status.",
+         {(("status", status),): stats[status] for status in ("pending", "running", "done", "dead")}),
+        ("lead_job_failures_total", "counter", "Failed lead job attempts since start.", {(): stats["failures"]}),
+        ("lead_duplicates_suppressed_total", "counter", "Repeated lead submissions answered from the idempotency cache.",
+         {(): submissions.stats()["duplicates_suppressed"]}),
+        ("sales_digest_pending", "gauge", "Leads buffered for the next sales-team digest.",
+         {(): sales_digest.stats().get("pending", 0)}),
+        ("lead_workers", "gauge", "Running lead worker threads.", {(): stats["workers"]}),
+        ("attachment_cache_bytes", "gauge", "Bytes of base64 payloads in the attachment cache.", {(): cache["bytes"]}),
+        ("attachment_cache_lookups_total", "counter", "Attachment cache lookups by result.",
+         {(("result", "hit"),): cache["hits"], (("result", "miss"),): cache["misses"]}),
+    ]
 
 # --- REMOVED PROPOSAL TASK ---
 # generate_and_send_full_proposal removed as per request
@@ -145,453 +424,350 @@ def go_back(current_stage, user_details):
     
     # Map stage to restart message/logic if needed, or just return basic prompt
     # For now, we will rely on validity checks in main loop to re-render the proper prompt for 'prev'
-    return prev
+    return STAGE_NAMES[prev] # History holds stage ids
 
 # --- UPLOAD ENDPOINT ---
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# The multipart body is parsed here rather than by FastAPI (UploadFile), which would spool
+# all of it to a temporary file before the handler runs
+UPLOAD_REQUEST_BODY = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "properties": {"resume": {"type": "string", "format": "binary"}}, "required": ["resume"]}}}}}
 
-@app.post("/upload_drawing")
-async def upload_drawing(resume: UploadFile = File(...), email: Optional[str] = None):
+@app.post("/upload_drawing", openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_drawing(request: Request, email: Optional[str] = None):
     try:
-        file_path = os.path.join(UPLOAD_DIR, resume.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(resume.file, buffer)
-        return {"filename": resume.filename, "message": "File uploaded successfully"}
+        # Hashed and written as it arrives, from a worker thread so large CAD files don't stall the event loop
+        with UPLOAD_WRITE_SECONDS.time():
+            stored_name, original_name, size = await receive_upload(
+                request.headers.get("content-type", ""), request.stream(), "resume")
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ClientDisconnect:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    UPLOAD_BYTES.inc(amount=size)
+    return {
+        "filename": stored_name, # Send this back as "Uploaded: <filename> (<original_filename>)"
+        "original_filename": original_name,
+        "size": size,
+        "message": "File uploaded successfully"
+    }
+
+@app.get("/drawings/{name}")
+async def download_drawing(name: str, expires: int, signature: str):
+    # Linked from sales emails when a drawing is over the attachment budget
+    if not verify_drawing_link(name, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired drawing link")
+    path = await run_in_threadpool(drawing_path, name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Drawing not found")
+    return FileResponse(path, filename=name)
 
 # --- MAIN CHAT HANDLER ---
-@app.post("/chat", response_model=ChatResponse)
-async def handle_chat(request: ChatRequest, background_tasks: BackgroundTasks):
-    stage = request.stage
-    user_details = request.user_details
-    user_input = request.user_input.strip() if request.user_input else ""
-    user_input_lower = user_input.lower()
-    
+@profiler.profiled("chat")
+def chat_turn(stage: str, user_input: str, user_details: Dict[str, Any]) -> StageResult:
+    # Label by known stage names only, so clients can't grow the metric series
+    with CHAT_STAGE_SECONDS.time(stage if stage in STAGES else "unknown"):
+        return _chat_turn(stage, user_input, user_details)
+
+def _chat_turn(stage: str, user_input: str, user_details: Dict[str, Any]) -> StageResult:
     # Initialize history
     if 'stage_history' not in user_details: user_details['stage_history'] = []
 
     # Global Commands
-    if user_input_lower in ["new proposal", "restart", "reset"]:
-        user_details = {'stage_history': []}
-        return ChatResponse(
-            next_stage="get_name",
-            bot_messages=[
-                "Hello 👋 Welcome to **DM Thermoformer & RA Vacform Industries**! We’re glad to assist you with custom plastic solutions.\n\nMay I kindly know your **Name**?"
-            ],
-            user_details=user_details
-        )
-    
+    if "reset" in INTENTS.exact(user_input):
+        return welcome()
+
     # Back Command
     if user_input == BACK_COMMAND:
         prev_stage = go_back(stage, user_details)
-        if prev_stage:
-            stage = prev_stage
-            # We "fall through" to the if/elif blocks below to re-render the prompt for 'prev_stage'
-            # But we need to avoid processing 'user_input' as an answer for that stage.
-            # So we set a flag or just return immediately with the prompt for that stage.
-            # Simpler approach: Recursive call with empty input? No, standard flow is better.
-            # We'll just set the prompt for the reverted stage.
-            pass
-        else:
-             return ChatResponse(next_stage="get_name", bot_messages=["Welcome to **DM Thermoformer & RA Vacform Industries**! 👋\n\nWhat is your **Name**?"], user_details={'stage_history': []})
+        if not prev_stage:
+            return StageResult("get_name", BACK_TO_START, {'stage_history': []})
+        # Re-render the prompt for the reverted stage instead of treating the command as an answer
+        return stage_prompt(prev_stage, user_details)
 
     # --- FLOW LOGIC ---
+    return run_stage(stage, user_input, user_details)
 
-    # --- FLOW LOGIC ---
-
-    # --- FLOW LOGIC ---
-
-    # 1. WELCOME -> GET NAME
-    if stage == "get_name":
-        if not user_input: 
-             return ChatResponse(
-                 next_stage="get_name", 
-                 bot_messages=[
-                     "Hello 👋 Welcome to **DM Thermoformer & RA Vacform Industries**! We’re glad to assist you with custom plastic solutions.\n\nMay I kindly know your **Name**?"
-                 ],
-                 user_details=user_details
-             )
-        
-        user_details['name'] = user_input
-        user_details['stage_history'].append("get_name")
-        
-        division_msg = (
-            "We operate through two specialized divisions. Please choose what matches your requirement:\n\n"
-            "1️⃣ **DM Thermoformer**\n"
-            "Custom thermoformed rigid plastic packaging solutions for product handling, protection, and presentation.\n\n"
-            "2️⃣ **RA Vacform Industries**\n"
-            "Manufacturing of thick vacuum formed plastic parts and housings for industrial and equipment applications."
-        )
-        
-        return ChatResponse(
-            next_stage="get_division",
-            bot_messages=[
-                f"Nice to meet you, **{user_input}**.",
-                division_msg
-            ],
-            user_details=user_details,
-            ui_elements={"type": "buttons", "display_style": "cards", "options": ["DM Thermoformer", "RA Vacform Industries"]}
-        )
-
-    # 2. GET DIVISION -> GET PRODUCT TYPE
-    elif stage == "get_division":
-        user_details['division'] = user_input
-        user_details['stage_history'].append("get_division")
-        
-        intro = ""
-        options = []
-        if "DM" in user_input:
-            intro = "Great! You’re looking for custom thermoformed packaging solutions."
-            options = [
-                "Part Handling Trays", "ESD Trays", 
-                "Toy Packaging", "Medical Packaging", "Food Packaging", 
-                "Cosmetic Packaging", "Electronics Packaging", "Automobile Packaging", 
-                "Other"
-            ]
-        else:
-            intro = "Great! You need vacuum formed plastic parts / housings."
-            options = [
-                "Robot Covers", "Drone Covers", "Medical Covers", 
-                "Automobile Thick Trays", "Hydroponic System Parts", "Other"
-            ]
-
-        return ChatResponse(
-            next_stage="get_product_type",
-            bot_messages=[
-                intro,
-                "What **type of product/packaging** are you looking for?"
-            ],
-            user_details=user_details,
-            ui_elements={"type": "buttons", "display_style": "pills", "options": options}
-        )
-
-    # 3. GET PRODUCT TYPE -> GET PROPERTIES
-    elif stage == "get_product_type":
-        user_details['product_type'] = user_input
-        user_details['stage_history'].append("get_product_type")
-        
-        properties = []
-        if "DM" in user_details.get('division', ''):
-             properties = [
-                 "Clear", "Transparent", "Food Contact Safe", "ESD", "Anti-static", 
-                 "Heat Sealable", "Lightweight", "Glossy", "Premium Look", 
-                 "UV Resistant", "Moisture Resistant", "Colored", "Opaque"
-             ]
-        else:
-             properties = [
-                 "High Strength", "Impact Resistant", "Lightweight", "Heat Resistant", 
-                 "Chemical Resistant", "UV Resistant", "Outdoor Resistant", 
-                 "Electrical Insulation", "Rigid", "Structural", "Matte", "Gloss", 
-                 "Textured Surface", "Colored"
-             ]
-
-        return ChatResponse(
-            next_stage="get_properties",
-            bot_messages=[
-                "Understood.",
-                "What **plastic properties** are required for your requirement?"
-            ],
-            user_details=user_details,
-            ui_elements={
-                "type": "buttons", 
-                "display_style": "pills", 
-                "multi_select": True,
-                "options": properties
-            }
-        )
-
-    # 4. GET PROPERTIES -> CONFIRM MATERIAL
-    elif stage == "get_properties":
-        user_details['properties'] = user_input
-        user_details['stage_history'].append("get_properties")
-        
-        # Simple Logic to suggest material based on properties
-        suggested_material = "Unknown"
-        options = []
-        
-        props_lower = user_input.lower()
-        
-        if "DM" in user_details.get('division', ''):
-            if "clear" in props_lower or "transparent" in props_lower:
-                suggested_material = "PET / PVC"
-            elif "food" in props_lower:
-                suggested_material = "PET / PP"
-            elif "esd" in props_lower or "anti-static" in props_lower:
-                suggested_material = "ESD PET / HIPS"
-            else:
-                suggested_material = "HIPS / PET"
-            
-            options = ["PET", "PVC", "HIPS", "PP", "PC", "Other"]
-        else:
-            if "outdoor" in props_lower or "uv" in props_lower:
-                suggested_material = "ASA / UV ABS"
-            elif "impact" in props_lower or "strength" in props_lower:
-                suggested_material = "ABS / HDPE"
-            elif "fire" in props_lower or "heat" in props_lower:
-                suggested_material = "FR ABS / PC"
-            else:
-                suggested_material = "ABS / HIPS"
-
-            options = ["ABS", "HIPS", "HDPE", "ASA", "PC", "Other"]
-
-        return ChatResponse(
-            next_stage="confirm_material",
-            bot_messages=[
-                f"Based on your requirements, we recommend **{suggested_material}**.",
-                "Please **confirm or select** the material you prefer:"
-            ],
-            user_details=user_details,
-            ui_elements={"type": "buttons", "display_style": "pills", "options": options}
-        )
-
-    # 5. CONFIRM MATERIAL -> GET THICKNESS
-    elif stage == "confirm_material":
-        user_details['material'] = user_input
-        user_details['stage_history'].append("confirm_material")
-        
-        msg = ""
-        options = []
-        if "DM" in user_details.get('division', ''):
-            msg = "What is the required **Material Thickness**?"
-            options = ["0.3mm", "0.5mm", "0.8mm", "1.0mm", "1.5mm", "2.0mm", "Other"]
-        else:
-            msg = "What is the required **Material Thickness**?"
-            options = ["2.0mm", "3.0mm", "4.0mm", "5.0mm", "6.0mm", "8.0mm", "Other"]
-
-        return ChatResponse(
-            next_stage="get_thickness",
-            bot_messages=[msg],
-            user_details=user_details,
-            ui_elements={"type": "buttons", "display_style": "pills", "options": options}
-        )
-
-    # 6. GET THICKNESS -> GET DRAWING
-    elif stage == "get_thickness":
-        user_details['thickness'] = user_input
-        user_details['stage_history'].append("get_thickness")
-        return ChatResponse(
-            next_stage="get_drawing",
-            bot_messages=["Do you have a **technical drawing** available for this?"],
-            user_details=user_details,
-            ui_elements={"type": "buttons", "display_style": "pills", "options": ["2D Drawing", "3D Model", "No drawing"]}
-        )
-
-    # 7. GET DRAWING -> UPLOAD OR DIMENSIONS
-    # 7. GET DRAWING -> UPLOAD OR DIMENSIONS
-    elif stage == "get_drawing":
-        user_details['drawing_available'] = user_input
-        user_details['stage_history'].append("get_drawing")
-        
-        print(f"DEBUG: Processing stage '{stage}' with input: '{user_input}'")
-        input_cleaned = user_input.lower().strip().replace(".", "").replace(",", "")
-        
-        negative_responses = [
-            "no drawing", "no", "na", "n/a", "not available", "none", "nope",
-            "don't have", "dont have", "skip", "no draw", "not yet", 
-            "i dont have", "i don't have", "without", "later"
-        ]
-        
-        # Check against list or if input contains key phrases
-        is_negative = False
-        
-        # 1. Exact match check
-        if input_cleaned in negative_responses:
-            is_negative = True
-        
-        # 2. Phrase check (if not exact match)
-        if not is_negative:
-            for phrase in negative_responses:
-                # Use word boundaries for short words like "no" or "na" to avoid false positives
-                # But for now, simple substring check is likely fine for this specific domain context
-                if phrase in input_cleaned:
-                    is_negative = True
-                    break
-        
-        print(f"DEBUG: Is negative response? {is_negative} (Input: '{input_cleaned}')")
-
-        if is_negative:
-            print("DEBUG: User indicated no drawing. Moving to dimensions.")
-            return ChatResponse(
-                next_stage="get_dimensions",
-                bot_messages=["No problem. Please provide the **Dimensions** (Length × Width × Height in mm) — measured at maximum value."],
-                user_details=user_details
-            )
-        else:
-            # Transition to upload stage
-            print("DEBUG: User might have drawing. Requesting upload.")
-            return ChatResponse(
-                 next_stage="upload_drawing_stage",
-                 bot_messages=["Great! Please **upload** your technical drawing file."],
-                 user_details=user_details,
-                 ui_elements={"type": "file_upload", "upload_to": "/upload_drawing"}
-            )
-
-    # 7.5. UPLOAD DRAWING -> GET QUANTITY
-    elif stage == "upload_drawing_stage":
-        # Check if the input indicates a successful upload
-        if user_input.startswith("Uploaded:"):
-             user_details['drawing_file'] = user_input.replace("Uploaded: ", "").strip()
-             user_details['stage_history'].append("upload_drawing_stage")
-             return ChatResponse(
-                next_stage="get_quantity",
-                bot_messages=["File received. How many **units** do you require?"],
-                user_details=user_details
-             )
-        else:
-             # If user types something else, remind them or allow skip?
-             # For now, let's assume they might be chatting, but we want the file.
-             return ChatResponse(
-                 next_stage="upload_drawing_stage",
-                 bot_messages=["Please **upload** the drawing file using the button above."],
-                 user_details=user_details,
-                 ui_elements={"type": "file_upload", "upload_to": "/upload_drawing"}
-             )
-
-    # 8. GET DIMENSIONS -> GET QUANTITY
-
-    # 8. GET DIMENSIONS -> GET QUANTITY
-    elif stage == "get_dimensions":
-        user_details['dimensions'] = user_input
-        user_details['stage_history'].append("get_dimensions")
-        return ChatResponse(
-            next_stage="get_quantity",
-            bot_messages=["Got it. How many **units** do you require?"],
-            user_details=user_details
-        )
-
-    # 9. GET QUANTITY -> GET URGENCY
-    elif stage == "get_quantity":
-        user_details['quantity'] = user_input
-        user_details['stage_history'].append("get_quantity")
-        return ChatResponse(
-            next_stage="get_urgency",
-            bot_messages=["When do you **need these parts/packaging** ready?"],
-            user_details=user_details,
-            ui_elements={"type": "buttons", "display_style": "pills", "options": ["Urgent (within 2 weeks)", "Within 1 month", "2-3 months", "Planning stage"]}
-        )
-
-    # 10. GET URGENCY -> GET SAMPLE
-    elif stage == "get_urgency":
-        user_details['timeline'] = user_input
-        user_details['stage_history'].append("get_urgency")
-        return ChatResponse(
-            next_stage="get_sample",
-            bot_messages=["Would you like us to develop a **sample** before bulk production?"],
-            user_details=user_details,
-            ui_elements={"type": "buttons", "display_style": "pills", "options": ["Yes", "No"]}
-        )
-
-    # 11. GET SAMPLE -> GET DELIVERY
-    elif stage == "get_sample":
-        user_details['sample_needed'] = user_input
-        user_details['stage_history'].append("get_sample")
-        return ChatResponse(
-            next_stage="get_delivery",
-            bot_messages=["Where should the products be **delivered**? (Please mention City or Country)"],
-            user_details=user_details
-        )
-
-    # 12. GET DELIVERY -> GET FORECAST
-    elif stage == "get_delivery":
-        user_details['delivery_location'] = user_input
-        user_details['stage_history'].append("get_delivery")
-        return ChatResponse(
-            next_stage="get_forecast",
-            bot_messages=["Last technical detail: What is your **forecast demand**? (Please mention typical Monthly or Yearly quantity)"],
-            user_details=user_details
-        )
-
-    # 13. GET FORECAST -> GET COMPANY NAME
-    elif stage == "get_forecast":
-        user_details['forecast'] = user_input
-        user_details['stage_history'].append("get_forecast")
-        # Use initial name as contact person
-        user_details['contact_person'] = user_details.get('name', 'N/A') 
-        return ChatResponse(
-            next_stage="get_company_name",
-            bot_messages=["Thank you. Now, let's collect your contact details for the formal quote.", "What is your **Company Name**?"],
-            user_details=user_details
-        )
-
-    # 14. COMPANY NAME -> COMPANY ADDRESS
-    elif stage == "get_company_name":
-        user_details['company'] = user_input
-        user_details['stage_history'].append("get_company_name")
-        return ChatResponse(
-            next_stage="get_company_address",
-            bot_messages=["What is the **Company Address**?"],
-            user_details=user_details
-        )
-
-    # 15. COMPANY ADDRESS -> PHONE
-    elif stage == "get_company_address":
-        user_details['company_address'] = user_input
-        user_details['stage_history'].append("get_company_address")
-        return ChatResponse(
-            next_stage="get_phone",
-            bot_messages=["Please provide your **Phone Number**:"],
-            user_details=user_details
-        )
-
-    # 17. PHONE -> EMAIL
-    elif stage == "get_phone":
-        user_details['phone'] = user_input
-        user_details['stage_history'].append("get_phone")
-        return ChatResponse(
-            next_stage="get_email",
-            bot_messages=["Finally, please share your **Official Email ID**:"],
-            user_details=user_details
-        )
-
-    # 18. GET EMAIL -> CLOSE
-    elif stage == "get_email":
-        email = extract_email(user_input)
-        user_details['email'] = email if email else user_input
-        user_details['stage_history'].append("get_email")
-        
-        # Trigger Background Task for Sales PDF
-        background_tasks.add_task(process_lead_and_send_email, user_details)
-
-        return ChatResponse(
-            next_stage="post_engagement",
-            bot_messages=[
-                "✅ **Inquiry Submitted!**",
-                "Our team will contact you shortly to provide a formal quote.",
-                "Is there anything else I can help you with?"
-            ],
-            user_details=user_details,
-            ui_elements={"type": "buttons", "options": ["Create New Inquiry", "No, I’m good"]}
-        )
-
-    # 19. POST ENGAGEMENT
-    elif stage == "post_engagement":
-        if "New" in user_input or "Inquiry" in user_input:
-             user_details = {'stage_history': []}
-             return ChatResponse(next_stage="get_name", bot_messages=["Hello! Welcome back.", "May I kindly know your **Name**?"], user_details=user_details)
-        
-        if "No" in user_input or "Good" in user_input:
-            return ChatResponse(
-                next_stage="closing",
-                bot_messages=["Thank you for reaching out to **RA & D**! 😊", "We look forward to working with you. Have a fantastic day!"],
-                user_details=user_details
-            )
-
-        return ChatResponse(
-            next_stage="post_engagement", 
-            bot_messages=["Is there anything else I can help you with?"], 
-            user_details=user_details, 
-            ui_elements={"type": "buttons", "options": ["Create New Inquiry", "No, I’m good"]}
-        )
-
-    # 20. CLOSING
-    elif stage == "closing":
-        return ChatResponse(
-            next_stage="get_name", 
-            bot_messages=["If you need anything else, just say **Hi**!", "May I kindly know your **Name**?"], 
-            user_details={'stage_history': []}
+@app.post("/chat", response_model=ChatResponse, response_model_exclude_none=True)
+async def handle_chat(request: ChatRequest, background_tasks: BackgroundTasks, http_request: Request,
+                      idempotency_key: str | None = Header(None)):
+    user_input = request.user_input.strip() if request.user_input else ""
+    schedule_warm_up(background_tasks)
+    if "x-profile" in http_request.headers:
+        request_profile(http_request.headers)
+
+    # Session mode: state lives on the server, only the changes go back to the client
+    if request.session_id is not None:
+        session = sessions.get_or_create(request.session_id)
+        response, _ = await session_turn(session, user_input, idempotency_key, client_key(http_request))
+        return chat_json(response)
+
+    if request.stage is None or request.user_details is None:
+        raise HTTPException(status_code=422, detail="stage and user_details are required without a session_id")
+
+    result = chat_turn(request.stage, user_input, request.user_details)
+    # model_construct: the stage table's own values need no validation, and the
+    # static message tuples keep their identity for the fragment cache
+    response = ChatResponse.model_construct(
+        next_stage=result.next_stage,
+        bot_messages=result.bot_messages,
+        user_details=result.user_details,
+        ui_elements=result.ui_elements
+    )
+    if result.submitted:
+        response, _ = await submit_once(result.user_details, response, idempotency_key, client_key(http_request))
+    return chat_json(response)
+
+async def session_turn(session, user_input: str, idempotency_key: str | None = None, client: str = "unknown", on_lead=None):
+    """Run one turn against server-side session state. Returns (ChatResponse, lead_id or None)."""
+    # stage_history is appended in place, so copy it too: a throttled submission rolls back to this
+    before = {**session.user_details, 'stage_history': list(session.user_details.get('stage_history', []))}
+    result = chat_turn(session.stage, user_input, session.user_details)
+    replaced = result.user_details is not session.user_details
+    response = ChatResponse.model_construct(
+        next_stage=result.next_stage,
+        bot_messages=result.bot_messages,
+        ui_elements=result.ui_elements,
+        session_id=session.id,
+        delta=StateDelta.model_construct(**diff_state(before, result.user_details, replaced))
+    )
+    lead_id = None
+    if result.submitted:
+        try:
+            response, lead_id = await submit_once(result.user_details, response, idempotency_key, client, on_lead)
+        except (RateLimited, IdempotencyKeyReused):
+            # Stay at the submission stage so the visitor can send it again later
+            session.user_details = before
+            raise
+    session.stage = result.next_stage
+    session.user_details = result.user_details
+    return response, lead_id
+
+# --- STREAMING CHAT ---
+# One WebSocket per visitor, running the same session_turn as /chat in session mode.
+# Client sends {"user_input": "...", "idempotency_key": optional}. Server sends
+#   {"type": "session", "session_id", "next_stage"}      on connect (pass ?session_id= to resume)
+#   {"type": "message", "text"}                           one frame per bot message
+#   {"type": "turn", "next_stage", "ui_elements", "delta"} after the messages of a turn
+#   {"type": "lead_status", "lead_id", "status"}          queued, then done / retrying / dead from the job queue
+#   {"type": "error", "detail", "retry_after"?}
+lead_watchers = {} # lead_id -> (event loop, asyncio.Queue of the connection that submitted it)
+
+def push_lead_status(job_id, kind, payload, status):
+    # Called from lead worker threads
+    watcher = lead_watchers.get(payload.get('lead_id'))
+    if watcher is None:
+        return
+    loop, events = watcher
+    if status != "retrying":
+        lead_watchers.pop(payload['lead_id'], None)
+    loop.call_soon_threadsafe(events.put_nowait, {"type": "lead_status", "lead_id": payload['lead_id'], "status": status})
+
+lead_queue.add_listener(push_lead_status)
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket, session_id: str | None = None):
+    await websocket.accept()
+    client = client_key(websocket)
+    if "x-profile" in websocket.headers:
+        request_profile(websocket.headers) # every turn on this connection
+    session = sessions.get_or_create(session_id)
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    watched = set()
+    turn_lock = asyncio.Lock() # A lead's status goes out after the turn that submitted it
+
+    def watch(lead_id):
+        # From the submitting worker thread, before the job is queued, so no status push can miss us
+        lead_watchers[lead_id] = (loop, events)
+        watched.add(lead_id)
+        loop.call_soon_threadsafe(events.put_nowait, {"type": "lead_status", "lead_id": lead_id, "status": "queued"})
+
+    async def forward_events():
+        while True:
+            event = await events.get()
+            async with turn_lock:
+                await websocket.send_json(event)
+
+    forwarder = asyncio.create_task(forward_events())
+    try:
+        await websocket.send_json({"type": "session", "session_id": session.id, "next_stage": session.stage})
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                user_input = str(message.get("user_input") or "").strip()
+            except (ValueError, AttributeError):
+                await websocket.send_json({"type": "error", "detail": "Expected a JSON object with user_input"})
+                continue
+            if len(user_input) > MAX_INPUT_CHARS:
+                await websocket.send_json({"type": "error", "detail": f"Messages are limited to {MAX_INPUT_CHARS} characters"})
+                continue
+
+            async with turn_lock:
+                try:
+                    rate_limits.check("chat", client)
+                    session = sessions.get_or_create(session.id) # Keeps the session alive, or starts over if it expired
+                    response, _ = await session_turn(session, user_input, message.get("idempotency_key"), client, watch)
+                except RateLimited as e:
+                    await websocket.send_json({"type": "error", "detail": str(e), "retry_after": round(e.retry_after, 1)})
+                    continue
+                except IdempotencyKeyReused as e:
+                    await websocket.send_json({"type": "error", "detail": str(e)})
+                    continue
+
+                for text in response.bot_messages or []:
+                    await websocket.send_json({"type": "message", "text": text})
+                await websocket.send_json({"type": "turn", **response.model_dump(
+                    exclude_none=True, include={"next_stage", "ui_elements", "session_id", "delta"})})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        forwarder.cancel()
+        for lead_id in watched:
+            lead_watchers.pop(lead_id, None)
+
+# --- LEAD INDEX ---
+def require_admin(x_admin_token: str | None = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Set ADMIN_TOKEN to enable lead endpoints")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+def request_profile(headers):
+    # X-Profile: 1 profiles this request's chat turn; admin only, as captures are written to disk.
+    # The context variable is set in this request's own context, so it never leaks into others
+    if headers.get("x-profile") == "1" and ADMIN_TOKEN and headers.get("x-admin-token") == ADMIN_TOKEN:
+        profile_requested.set(True)
+
+def parse_timestamp(value, name):
+    # ISO date or datetime, as in ?since=2025-01-31
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"{name} must be an ISO date or datetime")
+
+@app.post("/queue/retry_dead", dependencies=[Depends(require_admin)])
+async def retry_dead_jobs():
+    # Back into the queue after the cause is fixed (Mailjet keys, sales address); GET /queue shows how many are dead
+    return {"retried": await run_in_threadpool(lead_queue.retry_dead)}
+
+@app.get("/leads", dependencies=[Depends(require_admin)])
+async def list_leads(company: str | None = None, email: str | None = None, division: str | None = None,
+                     since: str | None = None, until: str | None = None,
+                     cursor: str | None = None, limit: int = 50):
+    try:
+        leads, next_cursor = lead_index.page(
+            cursor=cursor, limit=min(limit, MAX_PAGE_SIZE), company=company, email=email, division=division,
+            since=parse_timestamp(since, "since"), until=parse_timestamp(until, "until")
         )
-
-    # FALLBACK
-    return ChatResponse(next_stage="get_name", bot_messages=["Hello 👋 Welcome to **DM Thermoformer & RA Vacform Industries**! We’re glad to assist you with custom plastic solutions.\n\nMay I kindly know your **Name**?"], user_details={'stage_history': []})
+    except InvalidCursor as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"leads": leads, "next_cursor": next_cursor}
+
+@app.get("/leads/export", dependencies=[Depends(require_admin)])
+async def export_leads(format: str = "csv", division: str | None = None,
+                       since: str | None = None, until: str | None = None, cursor: str | None = None):
+    # Streams oldest first; pass the last row's cursor to resume an interrupted export
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    leads = lead_index.iter_leads(
+        cursor=cursor, division=division,
+        since=parse_timestamp(since, "since"), until=parse_timestamp(until, "until")
+    )
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_chunks(export_lines(leads, format, header=not cursor)), # sync generator, iterated in the threadpool
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="leads.{format}"'}
+    )
+
+class ContactItem(BaseModel):
+    phone: str | None = Field(None, max_length=MAX_INPUT_CHARS)
+    email: str | None = Field(None, max_length=MAX_INPUT_CHARS)
+    delivery_location: str | None = Field(None, max_length=MAX_INPUT_CHARS) # country for numbers without a code
+
+class ContactBatch(BaseModel):
+    contacts: List[ContactItem] = Field(max_length=MAX_CONTACT_BATCH)
+
+@app.post("/contacts/validate", dependencies=[Depends(require_admin)])
+async def validate_contacts(batch: ContactBatch):
+    # Normalized value (E.164 / canonical email) or error per contact, in request order
+    results = await run_in_threadpool(lambda: [check_contact(c.phone, c.email, c.delivery_location) for c in batch.contacts])
+    return {"results": results}
+
+def check_lead_contacts(leads):
+    checked, invalid = 0, []
+    for lead, _ in leads:
+        details = lead["user_details"]
+        result = check_contact(details.get('phone', ''), details.get('email', ''), details.get('delivery_location'))
+        checked += 1
+        if any(r["value"] is None for r in result.values()):
+            invalid.append({"lead_id": lead["id"], "company": lead["company"], **result})
+    return {"checked": checked, "invalid": invalid}
+
+@app.get("/leads/contacts", dependencies=[Depends(require_admin)])
+async def lead_contacts(division: str | None = None, since: str | None = None, until: str | None = None):
+    # Re-checks stored leads, e.g. those captured before the contact stages validated anything
+    leads = lead_index.iter_leads(
+        division=division, since=parse_timestamp(since, "since"), until=parse_timestamp(until, "until")
+    )
+    return await run_in_threadpool(check_lead_contacts, leads)
+
+@app.get("/leads/{lead_id}", dependencies=[Depends(require_admin)])
+async def get_lead(lead_id: str):
+    lead = lead_index.get(lead_id)
+    if lead is None:
+        raise HTTPException(status_code=404, detail="Lead not found")
+    return lead
+
+def read_inquiry_pdf(pdf_filename):
+    path = os.path.join(INQUIRY_DIR, pdf_filename)
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            return f.read()
+    return archive_index.read(INQUIRY_DIR, pdf_filename) # Compacted into a shard
+
+@app.get("/leads/{lead_id}/pdf", dependencies=[Depends(require_admin)])
+async def get_lead_pdf(lead_id: str):
+    lead = lead_index.get(lead_id)
+    if lead is None or not lead["pdf_filename"]:
+        raise HTTPException(status_code=404, detail="No archived PDF for this lead")
+    pdf_bytes = await run_in_threadpool(read_inquiry_pdf, lead["pdf_filename"])
+    if pdf_bytes is None:
+        raise HTTPException(status_code=404, detail="Archived PDF not found")
+    return Response(pdf_bytes, media_type="application/pdf",
+                    headers={"Content-Disposition": f'attachment; filename="{lead["pdf_filename"]}"'})
+
+# --- PROFILING ---
+class ProfilingSettings(BaseModel):
+    enabled: bool | None = None # profile every chat turn, PDF render and email send
+    sample_rate: float | None = Field(None, ge=0, le=1)
+    min_ms: float | None = Field(None, ge=0) # drop captures faster than this
+
+@app.get("/profiling", dependencies=[Depends(require_admin)])
+async def profiling_status():
+    return await run_in_threadpool(profiler.stats)
+
+@app.put("/profiling", dependencies=[Depends(require_admin)])
+async def update_profiling(settings: ProfilingSettings):
+    # Applies to this process only, until the next restart resets it to the PROFILE_* env vars
+    for name, value in settings.model_dump(exclude_none=True).items():
+        setattr(profiler, name, value)
+    return await run_in_threadpool(profiler.stats)
+
+@app.get("/profiling/hot", dependencies=[Depends(require_admin)])
+async def hot_functions(section: str | None = None, last: int = 50, limit: int = 25, sort: str = "tottime"):
+    # Top functions across the newest captures; section is chat, sales_pdf, digest_pdf or email
+    if sort not in ("tottime", "cumtime"):
+        raise HTTPException(status_code=422, detail="sort must be tottime or cumtime")
+    return await run_in_threadpool(profiler.hot, section, max(last, 1), min(max(limit, 1), MAX_HOT_FUNCTIONS), sort)
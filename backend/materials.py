@@ -0,0 +1,81 @@
+# backend/materials.py
+#
+# Material recommendation for the get_properties stage.
+# data/materials.json maps every property of the DM and RA property lists to
+# weighted material scores. Each division's table is loaded once into a
+# property x material weight matrix, so scoring a selection (or a whole batch
+# of inquiries) is one matrix product over a 0/1 property mask.
+
+import json
+import os
+
+import numpy as np
+
+from intents import IntentMatcher
+
+MATERIALS_FILE = os.path.join(os.path.dirname(__file__), "data", "materials.json")
+
+
+class MaterialRecommender:
+    def __init__(self, table):
+        self.materials = list(table["materials"])
+        self.properties = list(table["properties"])
+        material_index = {m: i for i, m in enumerate(self.materials)}
+
+        self.prior = np.zeros(len(self.materials))
+        for material, weight in table.get("prior", {}).items():
+            self.prior[material_index[material]] = weight
+
+        self.weights = np.zeros((len(self.properties), len(self.materials)))
+        for row, scores in enumerate(table["properties"].values()):
+            for material, weight in scores.items():
+                self.weights[row, material_index[material]] = weight
+
+        # Button labels and free-text aliases both resolve to a property row
+        aliases = table.get("aliases", {})
+        self.property_index = {p: i for i, p in enumerate(self.properties)}
+        self.matcher = IntentMatcher({p: [p, *aliases.get(p, [])] for p in self.properties})
+
+    def selection(self, properties_text):
+        """0/1 mask over self.properties for a comma-joined or free-text answer."""
+        mask = np.zeros(len(self.properties))
+        for prop in self.matcher.find(properties_text):
+            mask[self.property_index[prop]] = 1.0
+        return mask
+
+    def recommend(self, properties_text, top_n=2):
+        return self.recommend_batch([properties_text], top_n)[0]
+
+    def recommend_batch(self, properties_texts, top_n=2):
+        """Ranked top_n materials for each answer, scored in one pass."""
+        if not properties_texts:
+            return []
+        masks = np.stack([self.selection(text) for text in properties_texts])
+        scores = masks @ self.weights + self.prior
+        # Stable sort keeps the data file's material order on ties
+        ranked = np.argsort(-scores, axis=1, kind="stable")[:, :top_n]
+        return [[self.materials[i] for i in row] for row in ranked]
+
+
+def load_recommenders(path=MATERIALS_FILE):
+    with open(path, encoding="utf-8") as f:
+        tables = json.load(f)
+    return {division: MaterialRecommender(table) for division, table in tables.items()}
+
+RECOMMENDERS = load_recommenders()
+
+
+def recommend_materials(properties_text, division, top_n=2):
+    return RECOMMENDERS[division].recommend(properties_text, top_n)
+
+def recommend_for_inquiries(inquiries, top_n=2):
+    """Batch API: ranked materials for many (properties_text, division) pairs, in input order."""
+    results = [None] * len(inquiries)
+    by_division = {}
+    for i, (_, division) in enumerate(inquiries):
+        by_division.setdefault(division, []).append(i)
+    for division, indexes in by_division.items():
+        ranked = RECOMMENDERS[division].recommend_batch([inquiries[i][0] for i in indexes], top_n)
+        for i, materials in zip(indexes, ranked):
+            results[i] = materials
+    return results
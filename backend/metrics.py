@@ -0,0 +1,156 @@
+# backend/metrics.py
+#
+# In-process metrics with a Prometheus text exposition for GET /metrics.
+# Histograms keep plain per-bucket counts for each label set (made cumulative
+# only when scraped), so an observation is one bisect and two adds under a
+# per-metric lock.
+# Values that already live elsewhere (job backlog, cache sizes) are read at
+# scrape time through collectors instead of being mirrored on every change.
+
+from bisect import bisect_left
+import threading
+import time
+
+# Seconds; covers sub-millisecond stage handlers up to slow Mailjet calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labelvalues):
+        return _Timer(self, labelvalues)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for labelvalues, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    # A plain class rather than @contextmanager: it times every chat turn, and a
+    # generator-based context manager costs several times more than the observation
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labelvalues, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Register fn, called at scrape time, returning [(name, type, help, samples)].
+
+        samples maps a tuple of (label, value) pairs to the sample value.
+        """
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for fn in self._collectors:
+            try:
+                families = fn()
+            except Exception as e:
+                print(f"[!] Metrics collector {fn.__name__} failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples.items():
+                    label_text = _labels([k for k, _ in labels], [v for _, v in labels])
+                    lines.append(f"{name}{label_text} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CHAT_STAGE_SECONDS = REGISTRY.histogram(
+    "chat_stage_seconds", "Time to handle one /chat turn, by the stage it was answered at.", ["stage"])
+PDF_RENDER_SECONDS = REGISTRY.histogram(
+    "pdf_render_seconds", "Time to render a sales inquiry PDF.")
+EMAIL_SEND_SECONDS = REGISTRY.histogram(
+    "email_send_seconds", "Duration of each Mailjet API call, by outcome.", ["outcome"])
+UPLOAD_WRITE_SECONDS = REGISTRY.histogram(
+    "upload_write_seconds", "Time to hash and store an uploaded drawing.")
+UPLOAD_BYTES = REGISTRY.counter(
+    "upload_bytes_total", "Bytes of drawings stored.")
+JOB_SECONDS = REGISTRY.histogram(
+    "job_run_seconds", "Time spent in a background job handler, by kind and outcome.", ["kind", "outcome"])
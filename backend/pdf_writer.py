@@ -1,12 +1,48 @@
 # pdf_writer.py
 
 from fpdf import FPDF
+from fpdf.fonts import SubsetMap
+from fontTools import ttLib
+from copy import copy
+from io import BytesIO
 import os
+import threading
 from datetime import datetime
 
+from profiling import profiler
+
 COMPANY_EMAIL = "partha@infinitetechai.com"
 COMPANY_PHONE = "+91 98847 77171"
 
+FONT_DIR = os.path.join(os.path.dirname(__file__), "fonts")
+DEJAVU_FONTS = {"": "DejaVuSans.ttf", "B": "DejaVuSans-Bold.ttf", "I": "DejaVuSans-Oblique.ttf"}
+PREVIEW_MAX_MM = (120, 90) # width, height of the drawing preview on the page
+
+# Static layout of the inquiry summary: (section title, ((label, user_details key), ...))
+SECTIONS = (
+    ("Client Contact Information", (
+        ("Contact Person:", "contact_person"),
+        ("Company Name:", "company"),
+        ("Company Address:", "company_address"),
+        ("Email Address:", "email"),
+        ("Phone Number:", "phone"),
+    )),
+    ("Technical Inquiry Details", (
+        ("Division:", "division"),
+        ("Project Type:", "product_type"),
+        ("Plastic Properties:", "properties"),
+        ("Preferred Material:", "material"),
+        ("Material Thickness:", "thickness"),
+        ("Drawing Available:", "drawing_available"),
+        ("Dimensions:", "dimensions"),
+        ("Quantity Required:", "quantity"),
+        ("Timeline/Urgency:", "timeline"),
+        ("Delivery Location:", "delivery_location"),
+        ("Sample Required:", "sample_needed"),
+        ("Forecast Demand:", "forecast"),
+    )),
+)
+
 class PDF(FPDF):
     def header(self):
         self.set_fill_color(0, 51, 102) # Dark blue
@@ -35,64 +71,120 @@ class PDF(FPDF):
         self.multi_cell(0, 8, str(value), 0, 'L')
         self.ln(1)
 
+# --- FONT CACHE ---
+_font_cache = {}  # style -> (parsed TTFFont, raw font file bytes)
+_font_lock = threading.Lock()
+# fpdf2 internals setup_fonts resets on each copy; checked against the pinned fpdf2 in requirements.txt
+PER_DOCUMENT_FONT_ATTRS = ("i", "fontkey", "ttfont", "subset", "missing_glyphs", "biggest_size_pt", "_hbfont")
+_fonts_shareable = None
+
+def load_fonts():
+    """Parse the DejaVu fonts once per process; every render reuses the parsed metrics."""
+    global _fonts_shareable
+    with _font_lock:
+        if not _font_cache:
+            loader = FPDF()
+            for style, filename in DEJAVU_FONTS.items():
+                path = os.path.join(FONT_DIR, filename)
+                loader.add_font("DejaVu", style, path)
+                with open(path, "rb") as f:
+                    _font_cache[style] = (loader.fonts[f"dejavu{style}"], f.read())
+            _fonts_shareable = all(hasattr(parsed, attr) for parsed, _ in _font_cache.values()
+                                   for attr in PER_DOCUMENT_FONT_ATTRS)
+            if not _fonts_shareable:
+                print("[!] This fpdf2 release changed its font internals; parsing fonts per document instead")
+    return _font_cache
+
 def setup_fonts(pdf_instance):
-    font_path = os.path.join(os.path.dirname(__file__), "fonts") 
-    if not os.path.exists(os.path.join(font_path, "DejaVuSans.ttf")):
+    if not os.path.exists(os.path.join(FONT_DIR, "DejaVuSans.ttf")):
         print("WARNING: DejaVu fonts not found. Using Arial.")
         pdf_instance.add_font("Arial", "", "Arial.ttf", uni=True) 
         pdf_instance.add_font("Arial", "B", "Arialbd.ttf", uni=True)
         pdf_instance.add_font("Arial", "I", "Arial.ttf", uni=True) 
         pdf_instance.set_font("Arial", "B", 12)
+    elif not (load_fonts() and _fonts_shareable):
+        for style, filename in DEJAVU_FONTS.items():
+            pdf_instance.add_font("DejaVu", style, os.path.join(FONT_DIR, filename))
     else:
-        pdf_instance.add_font("DejaVu", "", os.path.join(font_path, "DejaVuSans.ttf"), uni=True)
-        pdf_instance.add_font("DejaVu", "B", os.path.join(font_path, "DejaVuSans-Bold.ttf"), uni=True)
-        pdf_instance.add_font("DejaVu", "I", os.path.join(font_path, "DejaVuSans-Oblique.ttf"), uni=True)
+        for parsed, data in load_fonts().values():
+            # Share the parsed metrics, but give each document its own glyph subset and
+            # TTFont: output() subsets and closes the TTFont in place.
+            font = copy(parsed)
+            font.i = len(pdf_instance.fonts) + 1
+            font.ttfont = ttLib.TTFont(BytesIO(data), recalcTimestamp=False, lazy=True)
+            font.subset = SubsetMap(font)
+            font.missing_glyphs = []
+            font.biggest_size_pt = 0
+            font._hbfont = None
+            pdf_instance.fonts[parsed.fontkey] = font
 
-def create_sales_pdf(user_details, output_path):
-    print(f"[*] Starting create_sales_pdf for {output_path}")
+def new_pdf():
     pdf = PDF()
     setup_fonts(pdf)
     pdf.set_auto_page_break(auto=True, margin=15)
+    return pdf
+
+def add_inquiry(pdf, user_details, heading=None, preview=None):
+    """Lay one inquiry out on a new page of pdf (the single-lead report and each digest section).
+
+    preview is an optional (image file or bytes, (width, height) in pixels) of the uploaded drawing.
+    """
     pdf.add_page()
     pdf.set_text_color(0, 0, 0)
 
     # --- Header Information ---
+    if heading:
+        pdf.set_font("DejaVu", "B", 13)
+        pdf.cell(0, 8, heading, ln=True, align='L')
     pdf.set_font("DejaVu", "", 10)
     pdf.cell(0, 6, f"Ref: DM-INQ-{datetime.now().strftime('%Y%m%d')}", ln=0, align='L')
     pdf.cell(0, 6, f"Date: {datetime.now().strftime('%B %d, %Y')}", ln=True, align='R')
     pdf.ln(5)
 
-    # --- Client Details ---
-    pdf.section_title("Client Contact Information")
-    pdf.add_detail_row("Contact Person:", user_details.get('contact_person', 'N/A'))
-    pdf.add_detail_row("Company Name:", user_details.get('company', 'N/A'))
-    pdf.add_detail_row("Company Address:", user_details.get('company_address', 'N/A'))
-    pdf.add_detail_row("Email Address:", user_details.get('email', 'N/A'))
-    pdf.add_detail_row("Phone Number:", user_details.get('phone', 'N/A'))
-    pdf.ln(5)
+    # --- Client Details / Project Requirements ---
+    for i, (title, rows) in enumerate(SECTIONS):
+        pdf.section_title(title)
+        for label, key in rows:
+            pdf.add_detail_row(label, user_details.get(key, 'N/A'))
+        pdf.ln(10 if i == len(SECTIONS) - 1 else 5)
 
-    # --- Project Requirements ---
-    pdf.section_title("Technical Inquiry Details")
-    pdf.add_detail_row("Division:", user_details.get('division', 'N/A'))
-    pdf.add_detail_row("Project Type:", user_details.get('product_type', 'N/A'))
-    pdf.add_detail_row("Plastic Properties:", user_details.get('properties', 'N/A'))
-    pdf.add_detail_row("Preferred Material:", user_details.get('material', 'N/A'))
-    pdf.add_detail_row("Material Thickness:", user_details.get('thickness', 'N/A'))
-    pdf.add_detail_row("Drawing Available:", user_details.get('drawing_available', 'N/A'))
-    pdf.add_detail_row("Dimensions:", user_details.get('dimensions', 'N/A'))
-    pdf.add_detail_row("Quantity Required:", user_details.get('quantity', 'N/A'))
-    pdf.add_detail_row("Timeline/Urgency:", user_details.get('timeline', 'N/A'))
-    pdf.add_detail_row("Delivery Location:", user_details.get('delivery_location', 'N/A'))
-    pdf.add_detail_row("Sample Required:", user_details.get('sample_needed', 'N/A'))
-    pdf.add_detail_row("Forecast Demand:", user_details.get('forecast', 'N/A'))
-    pdf.ln(10)
+    # --- Drawing Preview ---
+    if preview:
+        image, (width, height) = preview
+        scale = min(PREVIEW_MAX_MM[0] / width, PREVIEW_MAX_MM[1] / height)
+        pdf.section_title("Drawing Preview")
+        pdf.image(BytesIO(image) if isinstance(image, bytes) else image, w=width * scale, h=height * scale)
+        pdf.ln(5)
 
     # --- Footer Note (Internal) ---
     pdf.set_font("DejaVu", "I", 10)
     pdf.multi_cell(0, 6, "Report generated by AI Assistant. Priority: Standard. Please follow up within 24 hours.")
 
+@profiler.profiled("sales_pdf")
+def create_sales_pdf(user_details, output_path=None, preview=None):
+    """Render the inquiry summary to output_path, or return it as bytes when no path is given."""
+    print(f"[*] Starting create_sales_pdf for {output_path or 'in-memory output'}")
+    pdf = new_pdf()
+    add_inquiry(pdf, user_details, preview=preview)
+
+    if output_path is None:
+        return pdf.output()
+
     try:
         pdf.output(output_path)
         print(f"Sales PDF saved successfully at: {output_path}")
     except Exception as e:
-        print(f"Error while saving Sales PDF: {e}")
\ No newline at end of file
+        print(f"Error while saving Sales PDF: {e}")
+
+@profiler.profiled("digest_pdf")
+def create_digest_pdf(leads, previews=None):
+    """Render several inquiries into one document, a section (page) per lead, and return it as bytes.
+
+    previews, when given, holds one drawing preview (or None) per lead.
+    """
+    print(f"[*] Starting create_digest_pdf for {len(leads)} lead(s)")
+    pdf = new_pdf()
+    for i, user_details in enumerate(leads, 1):
+        add_inquiry(pdf, user_details, heading=f"Lead {i} of {len(leads)}: {user_details.get('company', 'N/A')}",
+                    preview=previews[i - 1] if previews else None)
+    return pdf.output()
@@ -0,0 +1,146 @@
+# backend/profiling.py
+#
+# Opt-in cProfile captures for chat turns, PDF renders and Mailjet sends.
+# Off by default. A profiled section is captured when:
+#   - PROFILE_SAMPLE_RATE picks it (0..1, a fraction of calls),
+#   - profiling was switched on through PUT /profiling, or
+#   - the request asked for it (X-Profile: 1 with a valid X-Admin-Token).
+# Each capture is dumped as a pstats file into PROFILE_DIR, which keeps only the
+# newest PROFILE_KEEP files. GET /profiling/hot merges recent captures into a
+# table of the hottest functions. Captures faster than PROFILE_MIN_MS are
+# dropped, so a sample rate can be left on to catch only the slow ones.
+# Only one capture runs at a time (the profiler hooks are interpreter-wide from
+# Python 3.12); a section that comes up meanwhile simply runs unprofiled. When
+# nothing asks for a profile, a section costs a flag check and a random().
+
+from collections import Counter
+from contextvars import ContextVar
+from functools import wraps
+import cProfile
+import os
+import pstats
+import random
+import threading
+import time
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+PROFILE_MIN_MS = float(os.getenv("PROFILE_MIN_MS", "0"))
+
+# Set for the current request by the chat handlers, see main.py
+profile_requested = ContextVar("profile_requested", default=False)
+
+
+class Profiler:
+    def __init__(self, directory=PROFILE_DIR, sample_rate=PROFILE_SAMPLE_RATE, keep=PROFILE_KEEP, min_ms=PROFILE_MIN_MS):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.min_ms = min_ms
+        self.enabled = False # admin switch: capture every section
+        self.captured = 0
+        self.skipped_busy = 0
+        self._busy = threading.Lock()
+        self._files_lock = threading.Lock()
+
+    def forced(self):
+        """True when the admin switch or the current request asks for captures, sampling aside."""
+        return self.enabled or profile_requested.get()
+
+    def profiled(self, section):
+        """Decorator: capture calls of the function under section when profiling is asked for."""
+        def decorate(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not (self.forced() or (self.sample_rate and random.random() < self.sample_rate)):
+                    return fn(*args, **kwargs)
+                return self._capture(section, fn, args, kwargs)
+            return wrapper
+        return decorate
+
+    def _capture(self, section, fn, args, kwargs):
+        if not self._busy.acquire(blocking=False):
+            self.skipped_busy += 1
+            return fn(*args, **kwargs)
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profile.runcall(fn, *args, **kwargs)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._busy.release()
+            if elapsed_ms >= self.min_ms:
+                self._save(section, profile, elapsed_ms)
+
+    # --- STORAGE ---
+    def _save(self, section, profile, elapsed_ms):
+        # Never let a full disk or a bad PROFILE_DIR fail the request being profiled
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # time_ns first, so the names sort oldest to newest
+            profile.dump_stats(os.path.join(self.directory, f"{time.time_ns()}-{section}-{round(elapsed_ms)}ms.prof"))
+            self.captured += 1
+            with self._files_lock:
+                for name in self._files()[:-self.keep]:
+                    os.remove(os.path.join(self.directory, name))
+        except OSError as e:
+            print(f"[!] Could not save profile for {section}: {e}")
+
+    def _files(self):
+        try:
+            return sorted(name for name in os.listdir(self.directory) if name.endswith(".prof"))
+        except FileNotFoundError:
+            return []
+
+    def recent(self, section=None, last=50):
+        """The newest captures (file names), optionally for one section only."""
+        names = [name for name in self._files() if section is None or name.split("-")[1] == section]
+        return names[-last:] if last else []
+
+    # --- REPORTS ---
+    def hot(self, section=None, last=50, limit=25, sort="tottime"):
+        """Merge the last captures and return the top functions by own time (tottime) or cumulative time."""
+        names = self.recent(section, last)
+        merged = None
+        for name in names:
+            try:
+                if merged is None:
+                    merged = pstats.Stats(os.path.join(self.directory, name))
+                else:
+                    merged.add(os.path.join(self.directory, name))
+            except (OSError, EOFError, TypeError, ValueError): # rotated away or half written
+                continue
+        sections = dict(Counter(name.split("-")[1] for name in names))
+        if merged is None:
+            return {"profiles": 0, "sections": sections, "functions": []}
+
+        column = 3 if sort == "cumtime" else 2
+        rows = sorted(merged.stats.items(), key=lambda item: item[1][column], reverse=True)[:limit]
+        return {
+            "profiles": len(names),
+            "sections": sections,
+            "total_ms": round(merged.total_tt * 1000, 2),
+            "functions": [{
+                "function": f"{func} ({os.path.basename(filename)}:{line})" if line else func,
+                "calls": calls,
+                "primitive_calls": primitive_calls,
+                "tottime_ms": round(tottime * 1000, 3),
+                "cumtime_ms": round(cumtime * 1000, 3),
+            } for (filename, line, func), (primitive_calls, calls, tottime, cumtime, _) in rows],
+        }
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "min_ms": self.min_ms,
+            "captured": self.captured,
+            "skipped_busy": self.skipped_busy,
+            "stored": len(self._files()),
+            "keep": self.keep,
+            "directory": self.directory,
+        }
+
+
+profiler = Profiler()
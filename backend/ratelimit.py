@@ -0,0 +1,142 @@
+# backend/ratelimit.py
+#
+# Per-client admission control.
+# Each budget (chat turns, drawing uploads, lead submissions) is a token bucket
+# per client key: a client may burst up to `capacity` requests, refilled evenly
+# over `period` seconds. Buckets live in an LRU map capped at RATE_LIMIT_MAX_KEYS,
+# so a flood of distinct clients cannot grow memory; an evicted client simply
+# starts again with a full bucket.
+# Limiters only expose acquire(key) -> seconds to wait, so a shared store
+# (e.g. Redis) can replace the in-process buckets without touching callers.
+
+from collections import OrderedDict
+import os
+import threading
+import time
+
+RATE_LIMITS_ENABLED = os.getenv("RATE_LIMITS_ENABLED", "1") != "0"
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "50000"))
+# Behind a reverse proxy every request comes from the proxy's address, so all
+# visitors would share one bucket. TRUSTED_PROXY_HOPS is the number of proxies in
+# front of the app that append to X-Forwarded-For; the client is the entry that
+# many places from the right (entries further left are client-supplied).
+# Defaults to 1 on Render (its load balancer, detected by the RENDER variable it
+# sets) and 0 elsewhere. TRUST_PROXY_HEADERS=1 is the older spelling of 1.
+def _trusted_proxy_hops():
+    if os.getenv("TRUSTED_PROXY_HOPS"):
+        return int(os.getenv("TRUSTED_PROXY_HOPS"))
+    if os.getenv("TRUST_PROXY_HEADERS"):
+        return 1 if os.getenv("TRUST_PROXY_HEADERS") == "1" else 0
+    return 1 if os.getenv("RENDER") else 0
+
+TRUSTED_PROXY_HOPS = _trusted_proxy_hops()
+
+# "<capacity>/<period seconds>" per client
+DEFAULT_BUDGETS = {
+    "chat": os.getenv("RATE_LIMIT_CHAT", "60/60"),
+    "upload": os.getenv("RATE_LIMIT_UPLOAD", "10/600"),
+    "lead": os.getenv("RATE_LIMIT_LEAD", "5/3600"),
+}
+
+
+class RateLimited(Exception):
+    def __init__(self, budget, retry_after):
+        super().__init__(f"Too many {budget} requests, retry in {retry_after:.0f}s")
+        self.budget = budget
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    def __init__(self, capacity, period, max_keys=RATE_LIMIT_MAX_KEYS, clock=time.monotonic):
+        self.capacity = float(capacity)
+        self.rate = capacity / period # tokens per second
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at], least recently used first
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    @classmethod
+    def parse(cls, spec, **kwargs):
+        capacity, period = spec.split("/")
+        return cls(int(capacity), float(period), **kwargs)
+
+    def acquire(self, key, cost=1):
+        """Take cost tokens for key. Returns 0 if allowed, else the seconds until it would be."""
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.capacity, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            self.rejected += 1
+            return (cost - bucket[0]) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class ConcurrencyCap:
+    """At most `limit` requests in flight at once; callers past that are turned away, not queued."""
+
+    def __init__(self, limit, retry_after=1.0):
+        self.limit = limit
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_enter(self):
+        with self._lock:
+            if self.in_flight >= self.limit:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+class RateLimits:
+    def __init__(self, budgets=DEFAULT_BUDGETS, enabled=RATE_LIMITS_ENABLED):
+        self.enabled = enabled
+        self.limiters = {name: TokenBucketLimiter.parse(spec) for name, spec in budgets.items()}
+
+    def check(self, budget, key, cost=1):
+        """Raise RateLimited when key has used up its budget."""
+        if not self.enabled:
+            return
+        wait = self.limiters[budget].acquire(key, cost)
+        if wait:
+            raise RateLimited(budget, wait)
+
+    def stats(self):
+        return {name: {"clients": len(limiter), "rejected": limiter.rejected} for name, limiter in self.limiters.items()}
+
+
+_warned_untrusted_proxy = False
+
+def client_key(request, hops=None):
+    """Identify the client behind a Starlette request."""
+    global _warned_untrusted_proxy
+    hops = TRUSTED_PROXY_HOPS if hops is None else hops
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and hops > 0:
+        # The last `hops` entries were added by our proxies; earlier ones are client-supplied
+        entries = forwarded.split(",")
+        return entries[max(len(entries) - hops, 0)].strip()
+    if forwarded and not _warned_untrusted_proxy:
+        _warned_untrusted_proxy = True
+        print("[!] Requests arrive through a proxy (X-Forwarded-For) but TRUSTED_PROXY_HOPS is 0: "
+              "every visitor behind it shares one rate-limit bucket")
+    return request.client.host if request.client else "unknown"
@@ -0,0 +1,78 @@
+# backend/responses.py
+#
+# Fast JSON encoding for /chat responses.
+# Most of a reply is static: stage prompts, option lists and UI cards come from
+# the compiled stage table and are the same objects on every turn. Those are
+# encoded once at startup and looked up by identity; only the dynamic parts
+# (user_details, delta, templated acks) are encoded per request, and the body
+# is spliced together without building or validating a pydantic model.
+# orjson is used when installed, otherwise the standard json module.
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class StaticFragments:
+    """Pre-encoded JSON for long-lived objects, keyed by identity.
+
+    Only objects registered up front are cached, so per-request objects never
+    grow it; each entry keeps its object alive, so an id is never reused.
+    """
+
+    def __init__(self):
+        self._fragments = {}  # id(obj) -> (obj, encoded)
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, obj):
+        if obj is not None and id(obj) not in self._fragments:
+            self._fragments[id(obj)] = (obj, dumps(obj))
+
+    def add_stages(self, stages):
+        """Register every prompt, reply and UI element of a compiled stage table."""
+        for compiled in stages.values():
+            for messages, ui in (*compiled.entry.values(), *compiled.retry.values(),
+                                 *(reply for replies in compiled.replies.values() for reply in replies.values())):
+                self.add(messages)
+                self.add(ui)
+
+    def encode(self, obj):
+        entry = self._fragments.get(id(obj))
+        if entry is not None and entry[0] is obj:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return dumps(obj)
+
+    def stats(self):
+        return {"fragments": len(self._fragments), "hits": self.hits, "misses": self.misses}
+
+
+fragments = StaticFragments()
+
+# ChatResponse fields in declaration order; None values are left out like response_model_exclude_none
+RESPONSE_FIELDS = ("next_stage", "bot_message", "bot_messages", "user_details", "ui_elements", "session_id", "delta")
+STATIC_FIELDS = {"bot_message", "bot_messages", "ui_elements"} # the rest is per-turn state, never cached
+_KEYS = {field: b'"' + field.encode() + b'":' for field in RESPONSE_FIELDS}
+
+
+def encode_chat_response(response):
+    parts = []
+    for field in RESPONSE_FIELDS:
+        value = getattr(response, field)
+        if value is None:
+            continue
+        if field == "delta" and not isinstance(value, dict):
+            value = value.model_dump()
+        parts.append(_KEYS[field] + (fragments.encode(value) if field in STATIC_FIELDS else dumps(value)))
+    return b"{" + b",".join(parts) + b"}"
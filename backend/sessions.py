@@ -0,0 +1,85 @@
+# backend/sessions.py
+#
+# Bounded in-memory conversation store for the optional session mode of /chat.
+# The server keeps stage + user_details per visitor, so the client only sends
+# a session id and its new input. Entries expire after SESSION_TTL_SECONDS of
+# inactivity and the least recently used ones are dropped past SESSION_MAX.
+
+from collections import OrderedDict
+from typing import Any, Dict
+import os
+import secrets
+import threading
+import time
+
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+
+
+class Session:
+    __slots__ = ("id", "stage", "user_details", "touched")
+
+    def __init__(self, session_id):
+        self.id = session_id
+        self.stage = "get_name"
+        self.user_details = {'stage_history': []}
+        self.touched = time.monotonic()
+
+
+class SessionStore:
+    def __init__(self, max_sessions=SESSION_MAX, ttl_seconds=SESSION_TTL_SECONDS, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._sessions = OrderedDict()  # least recently used first
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get_or_create(self, session_id=None):
+        """Return the live session for session_id, or a fresh one if it is unknown or expired."""
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(secrets.token_urlsafe(16))
+                self._sessions[session.id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            session.touched = now
+            return session
+
+    def drop(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _expire(self, now):
+        # Sessions are kept in access order, so expired ones are always at the front
+        deadline = now - self.ttl_seconds
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.touched > deadline:
+                break
+            self._sessions.popitem(last=False)
+            self.expired += 1
+
+
+def diff_state(before: Dict[str, Any], after: Dict[str, Any], replaced: bool):
+    """Describe how user_details changed during one turn.
+
+    `before` is a shallow copy taken before the turn; `replaced` is True when the
+    stage logic started over with a fresh dict (restart / new inquiry).
+    stage_history is summarised by its depth instead of being sent back.
+    """
+    changed = {
+        k: v for k, v in after.items()
+        if k != 'stage_history' and (replaced or k not in before or before[k] != v)
+    }
+    return {"changed": changed, "reset": replaced, "history_depth": len(after.get('stage_history') or ())}
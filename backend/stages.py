@@ -0,0 +1,363 @@
+# backend/stages.py
+#
+# Declarative stage graph for the /chat flow.
+# Every stage is declared once in STAGE_GRAPH and compiled at import time into
+# ready-made prompts / option sets per division, so a chat turn is a single
+# dictionary lookup plus a store into user_details.
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, NamedTuple, Optional, Sequence, Tuple, Union
+import os
+import re
+
+from intents import INTENTS
+from contacts import check_email, check_phone, region_for
+
+DIVISIONS = ("DM", "RA")
+MAX_HISTORY = int(os.getenv("MAX_STAGE_HISTORY", "64")) # Back-button depth; older steps are forgotten
+
+WELCOME_MESSAGE = (
+    "Hello 👋 Welcome to **DM Thermoformer & RA Vacform Industries**! We’re glad to assist you with custom plastic solutions.\n\n"
+    "May I kindly know your **Name**?"
+)
+
+# --- TYPES ---
+class ByDivision(NamedTuple):
+    """A value that differs between the DM and RA divisions."""
+    dm: Any
+    ra: Any
+
+    def pick(self, division):
+        return self.dm if division == "DM" else self.ra
+
+Messages = Union[Tuple[str, ...], ByDivision]
+UI = Union[Dict[str, Any], ByDivision, None]
+
+
+class StageResult(NamedTuple):
+    next_stage: str
+    bot_messages: Sequence[str] # the compiled tuples themselves when static, so they can be pre-encoded
+    user_details: Dict[str, Any]
+    ui_elements: Optional[Dict[str, Any]] = None
+    submitted: bool = False
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    key: Optional[str] = None                # user_details key the answer is stored under
+    next_stage: Optional[str] = None
+    prompt: Messages = ()                    # asked when entering this stage
+    ui: UI = None                            # ui_elements shown with the prompt
+    ack: Union[Messages, Callable] = ()      # sent before the next stage's prompt
+    reply: Optional[Messages] = None         # replaces ack + next prompt entirely
+    validate: Optional[Callable] = None      # (value, user_details) -> value, or None to re-ask
+    retry: Optional[Messages] = None         # sent when validate rejects (defaults to prompt)
+    route: Optional[Callable] = None         # (value, user_details) -> next stage name
+    effect: Optional[Callable] = None        # (user_details) -> None, after the answer is stored
+    handler: Optional[Callable] = None       # (value, user_details) -> StageResult, bypasses the above
+    submit: bool = False                     # answering this stage submits the lead
+
+
+def division_of(user_details):
+    return "DM" if "DM" in (user_details.get('division') or '') else "RA"
+
+def _resolve(value, division):
+    return value.pick(division) if isinstance(value, ByDivision) else value
+
+
+# --- OPTION SETS ---
+DIVISION_CARDS = {"type": "buttons", "display_style": "cards", "options": ["DM Thermoformer", "RA Vacform Industries"]}
+
+PRODUCT_TYPES = ByDivision(
+    dm=["Part Handling Trays", "ESD Trays",
+        "Toy Packaging", "Medical Packaging", "Food Packaging",
+        "Cosmetic Packaging", "Electronics Packaging", "Automobile Packaging",
+        "Other"],
+    ra=["Robot Covers", "Drone Covers", "Medical Covers",
+        "Automobile Thick Trays", "Hydroponic System Parts", "Other"],
+)
+
+PROPERTIES = ByDivision(
+    dm=["Clear", "Transparent", "Food Contact Safe", "ESD", "Anti-static",
+        "Heat Sealable", "Lightweight", "Glossy", "Premium Look",
+        "UV Resistant", "Moisture Resistant", "Colored", "Opaque"],
+    ra=["High Strength", "Impact Resistant", "Lightweight", "Heat Resistant",
+        "Chemical Resistant", "UV Resistant", "Outdoor Resistant",
+        "Electrical Insulation", "Rigid", "Structural", "Matte", "Gloss",
+        "Textured Surface", "Colored"],
+)
+
+MATERIALS = ByDivision(
+    dm=["PET", "PVC", "HIPS", "PP", "PC", "Other"],
+    ra=["ABS", "HIPS", "HDPE", "ASA", "PC", "Other"],
+)
+
+THICKNESSES = ByDivision(
+    dm=["0.3mm", "0.5mm", "0.8mm", "1.0mm", "1.5mm", "2.0mm", "Other"],
+    ra=["2.0mm", "3.0mm", "4.0mm", "5.0mm", "6.0mm", "8.0mm", "Other"],
+)
+
+def _pills(options, **extra):
+    if isinstance(options, ByDivision):
+        return ByDivision(_pills(options.dm, **extra), _pills(options.ra, **extra))
+    return {"type": "buttons", "display_style": "pills", **extra, "options": options}
+
+UPLOAD_UI = {"type": "file_upload", "upload_to": "/upload_drawing"}
+POST_ENGAGEMENT_UI = {"type": "buttons", "options": ["Create New Inquiry", "No, I’m good"]}
+
+
+# --- STAGE LOGIC ---
+def _non_empty(value, user_details):
+    return value or None
+
+# "Uploaded: <stored name> (<original filename>)", as the widget sends it after /upload_drawing;
+# older clients leave out the original filename
+UPLOADED = re.compile(r"Uploaded:\s*(\S+)(?:\s+\((.+)\))?\s*$")
+
+def _uploaded_file(value, user_details):
+    match = UPLOADED.match(value)
+    if match is None:
+        return None
+    # Drawings are stored under their content hash; keep the customer's name for the sales email
+    user_details['drawing_filename'] = match.group(2) or match.group(1)
+    return match.group(1)
+
+def extract_email(text: str):
+    match = re.search(r'[\w.+-]+@[\w-]+\.[\w.-]+', text)
+    return match.group(0) if match else None
+
+def _email(value, user_details):
+    return check_email(extract_email(value) or value).value
+
+def _phone(value, user_details):
+    # Numbers without a country code are read in the delivery country
+    return check_phone(value, region_for(user_details.get('delivery_location'))).value
+
+def _suggest_material(value, user_details):
+    # Imported on first use: materials pulls in numpy, which the first turns never need
+    from materials import recommend_materials
+    suggested_material = " / ".join(recommend_materials(value, division_of(user_details)))
+    return (f"Based on your requirements, we recommend **{suggested_material}**.",)
+
+def _drawing_route(value, user_details):
+    return "get_dimensions" if "no_drawing" in INTENTS.find(value) else "upload_drawing_stage"
+
+def _set_contact_person(user_details):
+    # Use initial name as contact person
+    user_details['contact_person'] = user_details.get('name', 'N/A')
+
+WELCOME_BACK = ("Hello! Welcome back.", "May I kindly know your **Name**?")
+GOODBYE = ("Thank you for reaching out to **RA & D**! 😊", "We look forward to working with you. Have a fantastic day!")
+ANYTHING_ELSE = ("Is there anything else I can help you with?",)
+RESTART_AFTER_CLOSING = ("If you need anything else, just say **Hi**!", "May I kindly know your **Name**?")
+
+def _post_engagement(value, user_details):
+    intents = INTENTS.find(value)
+    # Decline wins: "no new inquiry" or "nothing new" must not wipe the conversation
+    if "decline" in intents:
+        return StageResult("closing", GOODBYE, user_details)
+    if "new_inquiry" in intents:
+        return StageResult("get_name", WELCOME_BACK, {'stage_history': []})
+    return StageResult("post_engagement", ANYTHING_ELSE, user_details, POST_ENGAGEMENT_UI)
+
+def _closing(value, user_details):
+    return StageResult("get_name", RESTART_AFTER_CLOSING, {'stage_history': []})
+
+
+# --- STAGE GRAPH ---
+# A stage's position here is its id in stage_history: append new stages, don't reorder
+STAGE_GRAPH = [
+    Stage("get_name", key="name", next_stage="get_division",
+          prompt=(WELCOME_MESSAGE,),
+          ack=("Nice to meet you, **{value}**.",),
+          validate=_non_empty),
+    Stage("get_division", key="division", next_stage="get_product_type",
+          prompt=(
+              "We operate through two specialized divisions. Please choose what matches your requirement:\n\n"
+              "1️⃣ **DM Thermoformer**\n"
+              "Custom thermoformed rigid plastic packaging solutions for product handling, protection, and presentation.\n\n"
+              "2️⃣ **RA Vacform Industries**\n"
+              "Manufacturing of thick vacuum formed plastic parts and housings for industrial and equipment applications.",
+          ),
+          ui=DIVISION_CARDS,
+          ack=ByDivision(
+              dm=("Great! You’re looking for custom thermoformed packaging solutions.",),
+              ra=("Great! You need vacuum formed plastic parts / housings.",),
+          )),
+    Stage("get_product_type", key="product_type", next_stage="get_properties",
+          prompt=("What **type of product/packaging** are you looking for?",),
+          ui=_pills(PRODUCT_TYPES),
+          ack=("Understood.",)),
+    Stage("get_properties", key="properties", next_stage="confirm_material",
+          prompt=("What **plastic properties** are required for your requirement?",),
+          ui=_pills(PROPERTIES, multi_select=True),
+          ack=_suggest_material),
+    Stage("confirm_material", key="material", next_stage="get_thickness",
+          prompt=("Please **confirm or select** the material you prefer:",),
+          ui=_pills(MATERIALS)),
+    Stage("get_thickness", key="thickness", next_stage="get_drawing",
+          prompt=("What is the required **Material Thickness**?",),
+          ui=_pills(THICKNESSES)),
+    Stage("get_drawing", key="drawing_available",
+          prompt=("Do you have a **technical drawing** available for this?",),
+          ui=_pills(["2D Drawing", "3D Model", "No drawing"]),
+          route=_drawing_route),
+    Stage("upload_drawing_stage", key="drawing_file", next_stage="get_quantity",
+          prompt=("Great! Please **upload** your technical drawing file.",),
+          ui=UPLOAD_UI,
+          reply=("File received. How many **units** do you require?",),
+          validate=_uploaded_file,
+          retry=("Please **upload** the drawing file using the button above.",)),
+    Stage("get_dimensions", key="dimensions", next_stage="get_quantity",
+          prompt=("No problem. Please provide the **Dimensions** (Length × Width × Height in mm) — measured at maximum value.",),
+          reply=("Got it. How many **units** do you require?",)),
+    Stage("get_quantity", key="quantity", next_stage="get_urgency",
+          prompt=("How many **units** do you require?",)),
+    Stage("get_urgency", key="timeline", next_stage="get_sample",
+          prompt=("When do you **need these parts/packaging** ready?",),
+          ui=_pills(["Urgent (within 2 weeks)", "Within 1 month", "2-3 months", "Planning stage"])),
+    Stage("get_sample", key="sample_needed", next_stage="get_delivery",
+          prompt=("Would you like us to develop a **sample** before bulk production?",),
+          ui=_pills(["Yes", "No"])),
+    Stage("get_delivery", key="delivery_location", next_stage="get_forecast",
+          prompt=("Where should the products be **delivered**? (Please mention City or Country)",)),
+    Stage("get_forecast", key="forecast", next_stage="get_company_name",
+          prompt=("Last technical detail: What is your **forecast demand**? (Please mention typical Monthly or Yearly quantity)",),
+          ack=("Thank you. Now, let's collect your contact details for the formal quote.",),
+          effect=_set_contact_person),
+    Stage("get_company_name", key="company", next_stage="get_company_address",
+          prompt=("What is your **Company Name**?",)),
+    Stage("get_company_address", key="company_address", next_stage="get_phone",
+          prompt=("What is the **Company Address**?",)),
+    Stage("get_phone", key="phone", next_stage="get_email",
+          prompt=("Please provide your **Phone Number**:",),
+          validate=_phone,
+          retry=("That doesn't look like a valid phone number. Please include the country code, e.g. **+91 98765 43210**.",)),
+    Stage("get_email", key="email", next_stage="post_engagement",
+          prompt=("Finally, please share your **Official Email ID**:",),
+          ack=("✅ **Inquiry Submitted!**", "Our team will contact you shortly to provide a formal quote."),
+          validate=_email,
+          retry=("That doesn't look like a valid email address. Please share it as e.g. **name@company.com**.",),
+          submit=True),
+    Stage("post_engagement",
+          prompt=("Is there anything else I can help you with?",),
+          ui=POST_ENGAGEMENT_UI,
+          handler=_post_engagement),
+    Stage("closing",
+          prompt=GOODBYE,
+          handler=_closing),
+]
+
+
+# --- COMPILER ---
+class CompiledStage:
+    """A Stage with its prompts and replies resolved per division up front."""
+    __slots__ = ("name", "id", "key", "next_stage", "validate", "route", "effect", "handler", "submit",
+                 "ack_fn", "acks", "entry", "retry", "replies")
+
+    def __init__(self, stage, graph, stage_id):
+        self.name = stage.name
+        self.id = stage_id # what stage_history stores, see STAGE_IDS
+        self.key = stage.key
+        self.next_stage = stage.next_stage
+        self.validate = stage.validate
+        self.route = stage.route
+        self.effect = stage.effect
+        self.handler = stage.handler
+        self.submit = stage.submit
+
+        # division -> (messages, ui) shown when entering this stage / re-asking it
+        self.entry = {d: _entry(stage.prompt, stage.ui, d) for d in DIVISIONS}
+        retry = stage.retry if stage.retry is not None else stage.prompt
+        self.retry = {d: _entry(retry, stage.ui, d) for d in DIVISIONS}
+
+        # Static acks are baked into the replies; callable or templated ones are built per turn
+        self.ack_fn = stage.ack if callable(stage.ack) else None
+        self.acks = None
+        static_acks = {d: () for d in DIVISIONS}
+        if not self.ack_fn:
+            acks = {d: tuple(_resolve(stage.ack, d)) for d in DIVISIONS}
+            if any("{value}" in m for d in DIVISIONS for m in acks[d]):
+                self.acks = acks
+            else:
+                static_acks = acks
+
+        # division -> next stage -> (messages, ui) sent after a valid answer
+        targets = list(graph) if stage.route else [stage.next_stage] if stage.next_stage else []
+        self.replies = {d: {} for d in DIVISIONS}
+        for d in DIVISIONS:
+            for target in targets:
+                messages, ui = _entry(graph[target].prompt, graph[target].ui, d)
+                if stage.reply is not None:
+                    messages = tuple(_resolve(stage.reply, d))
+                self.replies[d][target] = (static_acks[d] + messages, ui)
+
+    def run(self, value, user_details):
+        if self.handler:
+            return self.handler(value, user_details)
+
+        if self.validate:
+            value = self.validate(value, user_details)
+            if value is None:
+                messages, ui = self.retry[division_of(user_details)]
+                return StageResult(self.name, messages, user_details, ui)
+
+        user_details[self.key] = value
+        history = user_details['stage_history']
+        history.append(self.id)
+        if len(history) > MAX_HISTORY:
+            del history[0]
+        if self.effect:
+            self.effect(user_details)
+
+        division = division_of(user_details)
+        next_stage = self.route(value, user_details) if self.route else self.next_stage
+        messages, ui = self.replies[division][next_stage]
+        if self.ack_fn:
+            messages = [*self.ack_fn(value, user_details), *messages]
+        elif self.acks:
+            messages = [m.format(value=value) for m in self.acks[division]] + list(messages)
+        return StageResult(next_stage, messages, user_details, ui, self.submit)
+
+    def prompt(self, user_details):
+        messages, ui = self.entry[division_of(user_details)]
+        return StageResult(self.name, messages, user_details, ui)
+
+
+def _entry(prompt, ui, division):
+    return tuple(_resolve(prompt, division)), _resolve(ui, division)
+
+def compile_stages(graph):
+    by_name = {stage.name: stage for stage in graph}
+    return {stage.name: CompiledStage(stage, by_name, i) for i, stage in enumerate(graph)}
+
+STAGES = compile_stages(STAGE_GRAPH)
+
+# stage_history holds small integer ids instead of stage names. Ids follow
+# STAGE_GRAPH order, so add new stages at the end to keep in-flight histories valid.
+STAGE_NAMES = tuple(STAGES)
+STAGE_IDS = {name: compiled.id for name, compiled in STAGES.items()}
+
+
+# --- DISPATCH ---
+WELCOME = (WELCOME_MESSAGE,)
+
+# Replies sent by handlers rather than compiled from STAGE_GRAPH
+STATIC_REPLIES = (WELCOME, WELCOME_BACK, GOODBYE, ANYTHING_ELSE, RESTART_AFTER_CLOSING, POST_ENGAGEMENT_UI)
+
+def welcome():
+    return StageResult("get_name", WELCOME, {'stage_history': []})
+
+def run_stage(stage_name, user_input, user_details):
+    compiled = STAGES.get(stage_name)
+    if compiled is None:
+        return welcome()
+    return compiled.run(user_input, user_details)
+
+def stage_prompt(stage_name, user_details):
+    """Re-render the prompt for a stage, e.g. after the user goes back to it."""
+    compiled = STAGES.get(stage_name)
+    if compiled is None:
+        return welcome()
+    return compiled.prompt(user_details)
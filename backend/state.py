@@ -0,0 +1,59 @@
+# backend/state.py
+#
+# Typed conversation state sent back and forth as user_details.
+# The client echoes user_details on every legacy-mode turn, so the server only
+# accepts the fields the stage graph actually stores. Each field is capped at
+# MAX_INPUT_CHARS, unknown keys are rejected with a 422, and stage_history is a
+# list of small integer stage ids (see stages.STAGE_IDS), at most MAX_HISTORY
+# long. Histories from older clients that still hold stage names are mapped to
+# ids on the way in.
+
+import os
+from typing import Annotated, List
+
+from pydantic import BeforeValidator, ConfigDict, Field, StringConstraints, with_config
+from typing_extensions import TypedDict
+
+from stages import MAX_HISTORY, STAGE_GRAPH, STAGE_IDS
+
+MAX_INPUT_CHARS = int(os.getenv("MAX_INPUT_CHARS", "1000")) # per message, and so per stored field
+
+def _names_to_ids(history):
+    # Once per list rather than a validator call per entry; a history is all names or all ids
+    if isinstance(history, list) and history and isinstance(history[0], str):
+        return [STAGE_IDS.get(v, v) for v in history]
+    return history
+
+Text = Annotated[str, StringConstraints(max_length=MAX_INPUT_CHARS)]
+StageId = Annotated[int, Field(ge=0, lt=len(STAGE_IDS))]
+
+
+# A TypedDict rather than a model: validation yields the plain dict the stage logic
+# mutates, with no model instance to build and convert back on every turn
+@with_config(ConfigDict(extra="forbid"))
+class ConversationState(TypedDict, total=False):
+    stage_history: Annotated[List[StageId], Field(max_length=MAX_HISTORY), BeforeValidator(_names_to_ids)]
+    name: Text
+    contact_person: Text
+    division: Text
+    product_type: Text
+    properties: Text
+    material: Text
+    thickness: Text
+    drawing_available: Text
+    drawing_file: Text
+    drawing_filename: Text # as uploaded; drawing_file is the stored (content hash) name
+    dimensions: Text
+    quantity: Text
+    timeline: Text
+    sample_needed: Text
+    delivery_location: Text
+    forecast: Text
+    company: Text
+    company_address: Text
+    phone: Text
+    email: Text
+
+
+# Every answer the stage graph stores must have a field, or its next turn would be rejected
+assert {stage.key for stage in STAGE_GRAPH if stage.key} <= ConversationState.__annotations__.keys()
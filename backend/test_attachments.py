@@ -0,0 +1,103 @@
+import hashlib
+import os
+
+import pytest
+
+import attachments
+from attachments import PreparedDrawing, as_attachments, encoded_size, fit_budget, renamed
+
+
+def drawing(name, size):
+    return PreparedDrawing(f"uploads/{name}", name, None, size)
+
+
+def test_encoded_size_is_base64():
+    assert [encoded_size(n) for n in (0, 1, 2, 3, 4)] == [0, 4, 4, 4, 8]
+
+
+def test_everything_fits():
+    drawings = [drawing("a.png", 300), drawing("b.png", 300)]
+    assert fit_budget(drawings, budget=800) == (drawings, [])
+
+
+def test_drawings_are_taken_in_order_and_overflow_is_linked():
+    a, b, c = drawing("a.png", 600), drawing("b.png", 600), drawing("c.png", 150)
+    # 800 encoded bytes each for a and b, 200 for c
+    attach, link = fit_budget([a, b, c], budget=1000)
+    assert attach == [a, c] # c still fits after b was skipped
+    assert link == [b]
+
+
+def test_reserved_counts_against_the_budget():
+    a = drawing("a.png", 600)
+    assert fit_budget([a], reserved=0, budget=1000) == ([a], [])
+    assert fit_budget([a], reserved=300, budget=1000) == ([], [a]) # 400 + 800 > 1000
+
+
+def test_drawing_exactly_at_the_budget_is_attached():
+    a = drawing("a.png", 750)
+    assert fit_budget([a], budget=1000) == ([a], [])
+
+
+# --- prepared drawing cache ---
+@pytest.fixture
+def upload(tmp_path, monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("uploads")
+    Image.new("RGB", (3000, 1500), "white").save("uploads/scan.png")
+    with open("uploads/scan.png", "rb") as f:
+        path = f"uploads/{hashlib.sha256(f.read()).hexdigest()}.png"
+    os.rename("uploads/scan.png", path)
+    yield path
+    attachments.shutdown_pool()
+
+
+def test_prepared_drawing_is_reused_without_the_pool(upload, monkeypatch):
+    [first] = attachments.prepare_drawings([upload])
+    assert first.file and first.size < os.path.getsize(upload)
+    assert first.preview_size == (600, 300)
+
+    def no_pool():
+        raise AssertionError("prepared again")
+
+    monkeypatch.setattr(attachments, "_get_pool", no_pool)
+    assert attachments.prepare_drawings([upload]) == [first]
+
+
+def test_partly_deleted_cache_is_prepared_again(upload):
+    [first] = attachments.prepare_drawings([upload])
+    os.remove(first.preview)
+    assert attachments.prepare_drawings([upload]) == [first]
+    assert os.path.isfile(first.preview)
+
+
+def test_multi_page_scan_is_attached_as_uploaded(tmp_path, monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    monkeypatch.chdir(tmp_path)
+    pages = [Image.new("RGB", (3000, 2000), color) for color in ("white", "red", "blue", "green")]
+    pages[0].save("scan.tiff", save_all=True, append_images=pages[1:])
+    meta = attachments._prepare(str(tmp_path / "scan.tiff"), str(tmp_path / "prepared"), "key")
+    assert meta["file"] is None and meta["filename"] == "scan.tiff"
+    assert meta["size"] == os.path.getsize("scan.tiff")
+    assert meta["preview_size"] == (600, 400)
+    assert sorted(os.listdir("prepared")) == ["key-preview.png", "key.json"]
+
+
+def test_renamed_keeps_the_attached_extension():
+    prepared = PreparedDrawing("uploads/ab12.tif", "ab12.png", "uploads/prepared/ab12.png", 100)
+    assert renamed(prepared, "Part 7 Rev B.tif").filename == "Part 7 Rev B.png"
+    assert renamed(prepared, "C:\\Users\\sales\\bracket.TIF").filename == "bracket.png"
+    assert renamed(prepared, None) == prepared
+    assert renamed(prepared, "..") == prepared
+    assert as_attachments([renamed(prepared, "scan.tif")]) == [("scan.png", "uploads/prepared/ab12.png")]
+
+
+def test_zero_workers_runs_in_the_calling_process(upload, monkeypatch):
+    attachments.shutdown_pool()
+    monkeypatch.setattr(attachments, "DRAWING_PREP_WORKERS", 0)
+    [drawing] = attachments.prepare_drawings([upload])
+    assert drawing.file and os.path.isfile(drawing.file)
+    pdf = attachments.render_pdf("create_sales_pdf", {"company": "Acme"}, preview=attachments.preview_of(drawing))
+    assert pdf[:5] == b"%PDF-"
+    assert isinstance(attachments._pool, attachments._InlinePool)
@@ -0,0 +1,50 @@
+import os
+import time
+
+from compaction import ArchiveIndex, drop_derived
+
+DAY = 86400
+
+
+def write(path, data=b"data", age_days=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    mtime = time.time() - age_days * DAY
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_old_derived_files_are_dropped(tmp_path):
+    prepared = tmp_path / "uploads" / "prepared"
+    write(str(prepared / "old-preview.png"), age_days=40)
+    write(str(prepared / "old.json"), age_days=40)
+    write(str(prepared / "new.json"), age_days=1)
+    assert drop_derived(str(prepared), older_than_days=30) == 2
+    assert os.listdir(prepared) == ["new.json"]
+    assert drop_derived(str(tmp_path / "missing")) == 0
+
+
+def test_compaction_packs_uploads_but_not_prepared_files(tmp_path):
+    uploads = tmp_path / "uploads"
+    write(str(uploads / "drawing.pdf"), b"%PDF", age_days=40)
+    write(str(uploads / "prepared" / "drawing.json"), age_days=40)
+    index = ArchiveIndex(str(tmp_path / "archive"))
+    assert index.compact(str(uploads), older_than_days=30) == 1
+    assert sorted(os.listdir(uploads)) == ["prepared"]
+    assert index.read(str(uploads), "drawing.pdf") == b"%PDF"
+
+
+def test_restored_file_is_not_packed_again(tmp_path):
+    uploads = tmp_path / "uploads"
+    write(str(uploads / "drawing.pdf"), b"%PDF", age_days=40)
+    index = ArchiveIndex(str(tmp_path / "archive"))
+    index.compact(str(uploads), older_than_days=30)
+
+    path = index.restore(str(uploads), "drawing.pdf")
+    assert open(path, "rb").read() == b"%PDF"
+    assert os.listdir(uploads) == ["drawing.pdf"] # no temp file left behind
+    assert index.compact(str(uploads), older_than_days=30) == 0
+    assert os.listdir(uploads) == [] # already archived, so the copy just goes
+    assert index.stats()["shards"] == 1
+    assert index.restore(str(uploads), "missing.pdf") is None
@@ -0,0 +1,50 @@
+import pytest
+
+from contacts import check_contact, check_email, check_phone, region_for
+
+
+@pytest.mark.parametrize("text, region, expected", [
+    ("98765 43210", "IN", "+919876543210"),
+    ("+91 98765-43210", "GB", "+919876543210"), # a country code beats the region
+    ("020 7946 0958", "GB", "+442079460958"),
+    ("India:9876543210", "GB", "+919876543210"), # the contact form's "<Country>:<number>"
+    ("call me on 98765 43210 after 5", "IN", "+919876543210"),
+])
+def test_phone_is_normalized_to_e164(text, region, expected):
+    assert check_phone(text, region) == (expected, None)
+
+
+@pytest.mark.parametrize("text", ["12", "", "not a number", "98765"])
+def test_invalid_phone_is_reported(text):
+    result = check_phone(text, "IN")
+    assert result.value is None and result.error == "Not a valid phone number"
+
+
+@pytest.mark.parametrize("location, region", [
+    ("Pune, India", "IN"),
+    ("Manchester, United Kingdom", "GB"),
+    ("Seoul, South Korea", "KR"),
+    ("deliver to us in Pune", "IN"), # "us" is not the United States
+    ("", "IN"),
+    (None, "IN"),
+])
+def test_region_for_delivery_location(location, region):
+    assert region_for(location) == region
+
+
+def test_email_domain_is_normalized():
+    assert check_email("  A@Example.COM ") == ("A@example.com", None)
+
+
+@pytest.mark.parametrize("text", ["", "asha", "asha@", "asha@example", "a b@example.com"])
+def test_invalid_email_is_reported(text):
+    result = check_email(text)
+    assert result.value is None and result.error
+
+
+def test_check_contact_reads_the_phone_in_the_delivery_country():
+    assert check_contact(phone="020 7946 0958", email="a@example.com", delivery_location="London, UK") == {
+        "phone": {"value": "+442079460958", "error": None},
+        "email": {"value": "a@example.com", "error": None},
+    }
+    assert check_contact(email="a@example.com") == {"email": {"value": "a@example.com", "error": None}}
@@ -0,0 +1,100 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+import drawing_store
+from drawing_store import InvalidUpload, UploadTooLarge, receive_upload
+
+BOUNDARY = "----drawing"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def multipart(*parts):
+    """A multipart/form-data body from (field, filename or None, data) parts."""
+    body = b""
+    for field, filename, data in parts:
+        disposition = f'form-data; name="{field}"' + (f'; filename="{filename}"' if filename else "")
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+async def chunks(body, size=1000):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+def chunks_sync(body, size=1000):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+def receive(body, field="resume", content_type=CONTENT_TYPE):
+    return asyncio.run(receive_upload(content_type, chunks(body), field))
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(drawing_store, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(drawing_store, "UPLOAD_CHUNK_BYTES", 4096)
+    monkeypatch.setattr(drawing_store, "MAX_UPLOAD_BYTES", 50_000)
+    return tmp_path
+
+
+def test_upload_is_stored_under_its_sha256(upload_dir):
+    data = os.urandom(20_000)
+    body = multipart(("note", None, b"ignored"), ("resume", "Part 7 Rev B.PDF", data))
+    stored_name, original_name, size = receive(body)
+    assert stored_name == hashlib.sha256(data).hexdigest() + ".pdf"
+    assert (original_name, size) == ("Part 7 Rev B.PDF", 20_000)
+    assert os.listdir(upload_dir) == [stored_name]
+    with open(upload_dir / stored_name, "rb") as f:
+        assert f.read() == data
+
+
+def test_same_content_is_stored_once(upload_dir):
+    body = multipart(("resume", "a.png", b"same bytes"))
+    assert receive(body)[0] == receive(multipart(("resume", "b.png", b"same bytes")))[0]
+    assert len(os.listdir(upload_dir)) == 1
+
+
+def test_oversized_upload_is_cut_off_while_streaming(upload_dir):
+    read = []
+
+    async def stream():
+        async for chunk in chunks(multipart(("resume", "big.tif", b"x" * 200_000))):
+            read.append(len(chunk))
+            yield chunk
+
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(receive_upload(CONTENT_TYPE, stream(), "resume"))
+    assert sum(read) < 100_000 # stopped well before the end of the body
+    assert os.listdir(upload_dir) == [] # no partial file left behind
+
+
+@pytest.mark.parametrize("body, content_type", [
+    (multipart(("other", "a.pdf", b"data")), CONTENT_TYPE), # no file in the field
+    (multipart(("resume", None, b"not a file")), CONTENT_TYPE),
+    (b"plain body", "text/plain"),
+])
+def test_invalid_uploads_are_rejected(upload_dir, body, content_type):
+    with pytest.raises(InvalidUpload):
+        receive(body, content_type=content_type)
+    assert os.listdir(upload_dir) == []
+
+
+def test_upload_endpoint(upload_dir, monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    response = client.post("/upload_drawing", files={"resume": ("Bracket.dwg", b"dwg data")})
+    assert response.status_code == 200
+    assert response.json()["original_filename"] == "Bracket.dwg"
+    assert response.json()["filename"] == hashlib.sha256(b"dwg data").hexdigest() + ".dwg"
+
+    # No Content-Length to reject up front: cut off as it streams
+    body = multipart(("resume", "big.tif", b"x" * 200_000))
+    response = client.post("/upload_drawing", content=chunks_sync(body), headers={"Content-Type": CONTENT_TYPE})
+    assert response.status_code == 413
+    assert client.post("/upload_drawing", files={"other": ("a.pdf", b"data")}).status_code == 422
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from idempotency import IdempotencyKeyReused, SubmissionCache, submission_fingerprint
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+LEAD = {"contact_person": "Asha", "email": "asha@example.com", "quantity": "500", "stage_history": ["get_name"]}
+
+
+def test_fingerprint_ignores_stage_history():
+    assert submission_fingerprint(LEAD) == submission_fingerprint({**LEAD, "stage_history": []})
+    assert submission_fingerprint(LEAD) != submission_fingerprint({**LEAD, "quantity": "5000"})
+
+
+def test_replays_the_stored_response():
+    cache = SubmissionCache()
+    fingerprint = submission_fingerprint(LEAD)
+    assert cache.get("k", fingerprint) is None
+    cache.put("k", "first response", fingerprint)
+    assert cache.get("k", fingerprint) == "first response"
+    assert cache.stats() == {"entries": 1, "duplicates_suppressed": 1}
+
+
+def test_key_reused_for_another_payload_is_rejected():
+    cache = SubmissionCache()
+    cache.put("k", "first response", submission_fingerprint(LEAD))
+    with pytest.raises(IdempotencyKeyReused):
+        cache.get("k", submission_fingerprint({**LEAD, "quantity": "5000"}))
+    assert cache.stats()["duplicates_suppressed"] == 0
+
+
+def test_entries_expire_after_the_ttl():
+    clock = FakeClock()
+    cache = SubmissionCache(ttl_seconds=60, clock=clock)
+    cache.put("old", "a")
+    clock.now = 30
+    cache.put("new", "b")
+    clock.now = 61
+    assert cache.get("old") is None
+    assert cache.get("new") == "b"
+    clock.now = 91
+    assert cache.get("new") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_oldest_entries_are_evicted_past_max_entries():
+    cache = SubmissionCache(max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, key.upper())
+    assert cache.get("a") is None
+    assert (cache.get("b"), cache.get("c")) == ("B", "C")
+
+
+def test_discard_forgets_the_key():
+    cache = SubmissionCache()
+    cache.put("k", "response")
+    cache.discard("k")
+    cache.discard("k") # already gone
+    assert cache.get("k") is None
+
+
+# --- submit_once ---
+@pytest.fixture
+def submitted(monkeypatch):
+    import main
+    leads = []
+    monkeypatch.setattr(main, "submissions", SubmissionCache())
+    monkeypatch.setattr(main, "submit_lead", lambda user_details, on_lead=None: leads.append(user_details) or len(leads))
+    return main, leads
+
+
+def submit(main, user_details, key=None, client="1.2.3.4"):
+    response = main.ChatResponse.model_construct(next_stage="post_engagement", bot_messages=[], ui_elements=None,
+                                                 session_id=None)
+    return asyncio.run(main.submit_once(user_details, response, key, client))
+
+
+def test_submit_once_replays_a_retry(submitted):
+    main, leads = submitted
+    response, lead_id = submit(main, LEAD, key="abc")
+    assert lead_id == 1
+    assert submit(main, LEAD, key="abc") == (response, None)
+    assert len(leads) == 1
+
+
+def test_submit_once_rejects_a_key_reused_for_another_inquiry(submitted):
+    main, leads = submitted
+    submit(main, LEAD, key="abc")
+    with pytest.raises(IdempotencyKeyReused):
+        submit(main, {**LEAD, "quantity": "5000"}, key="abc")
+    assert len(leads) == 1
+
+
+def test_submit_once_keys_are_per_client(submitted):
+    main, leads = submitted
+    submit(main, LEAD, key="abc", client="1.2.3.4")
+    _, lead_id = submit(main, LEAD, key="abc", client="5.6.7.8")
+    assert lead_id == 2
+
+
+def test_submit_once_forgets_a_failed_submission(submitted, monkeypatch):
+    main, leads = submitted
+
+    def fail(user_details, on_lead=None):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(main, "submit_lead", fail)
+    with pytest.raises(OSError):
+        submit(main, LEAD, key="abc")
+    assert main.submissions.stats()["entries"] == 0
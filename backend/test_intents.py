@@ -0,0 +1,89 @@
+import pytest
+
+from intents import INTENTS, IntentMatcher
+from stages import run_stage
+
+# Labelled answers, run through the real stages. benchmarks/bench_intents.py
+# measures the matcher on the same corpus.
+# (answer, expected intent or None)
+DRAWING_CORPUS = [
+    ("No drawing", "no_drawing"),
+    ("no", "no_drawing"),
+    ("NA", "no_drawing"),
+    ("n/a", "no_drawing"),
+    ("Nope.", "no_drawing"),
+    ("I don't have one yet", "no_drawing"),
+    ("I don’t have it right now", "no_drawing"),
+    ("dont have", "no_drawing"),
+    ("not yet", "no_drawing"),
+    ("Not available at the moment", "no_drawing"),
+    ("will share later", "no_drawing"),
+    ("skip", "no_drawing"),
+    ("none", "no_drawing"),
+    ("2D Drawing", None),
+    ("3D Model", None),
+    ("yes", None),
+    ("Yes, I have a STEP file", None),
+    ("We are a nanotech company", None),
+    ("national standard drawing", None),
+    ("I have a DWG from our naval division", None),
+    ("Known dimensions, have a drawing", None),
+    ("Banana tray layout ready", None),
+    ("Available, uploading now", None),
+]
+
+ENGAGEMENT_CORPUS = [
+    ("Create New Inquiry", "new_inquiry"),
+    ("new inquiry please", "new_inquiry"),
+    ("a new one", "new_inquiry"),
+    ("I want another quote", "new_inquiry"),
+    ("No, I’m good", "decline"),
+    ("Nothing else", "decline"),
+    ("no thanks", "decline"),
+    ("I'm good", "decline"),
+    ("that's all", "decline"),
+    ("Nothing new, thanks", "decline"),
+    ("No new inquiry", "decline"),
+    ("no, nothing new", "decline"),
+    ("I know what I need", None),
+    ("Goodyear tyres packaging question", None),
+    ("about my inquiry", None),
+]
+
+DRAWING_ROUTES = {"get_dimensions": "no_drawing", "upload_drawing_stage": None}
+ENGAGEMENT_ROUTES = {"get_name": "new_inquiry", "closing": "decline", "post_engagement": None}
+
+
+def drawing_intent(text):
+    return DRAWING_ROUTES[run_stage("get_drawing", text, {'stage_history': []}).next_stage]
+
+def engagement_intent(text):
+    return ENGAGEMENT_ROUTES[run_stage("post_engagement", text, {'stage_history': []}).next_stage]
+
+
+@pytest.mark.parametrize("text, expected", DRAWING_CORPUS)
+def test_get_drawing_answers(text, expected):
+    assert drawing_intent(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", ENGAGEMENT_CORPUS)
+def test_post_engagement_answers(text, expected):
+    assert engagement_intent(text) == expected
+
+
+def test_phrases_match_whole_words_only():
+    assert INTENTS.find("na") == {"no_drawing"}
+    assert INTENTS.find("nanotech") == set()
+    assert INTENTS.find("no drawing") == {"no_drawing", "decline"} # "no" inside "no drawing" still counts
+
+
+def test_exact_matches_the_whole_input():
+    assert INTENTS.exact(" Restart. ") == {"reset"}
+    assert INTENTS.exact("please restart") == frozenset()
+
+
+def test_phrases_that_do_not_start_with_a_word_character():
+    matcher = IntentMatcher({"plus": ["+1", "c++"]})
+    assert matcher.find("call +1 now") == {"plus"}
+    assert matcher.find("written in c++") == {"plus"}
+    assert matcher.find("abc++") == set()
@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from jobqueue import JobQueue, PartialFailure
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(**kwargs):
+        queue = JobQueue(str(tmp_path / "jobs.db"), **{"workers": 1, "retry_base": 0.01, **kwargs})
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.stop()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def statuses(queue):
+    return {status: count for status, count in queue.stats().items() if status in ("pending", "running", "done", "dead")}
+
+
+def test_failed_job_is_retried_until_it_succeeds(make_queue):
+    queue = make_queue()
+    calls = []
+
+    def flaky(payload):
+        calls.append(payload)
+        if len(calls) < 3:
+            raise RuntimeError("mailjet down")
+
+    events = []
+    queue.register("lead", flaky)
+    queue.add_listener(lambda job_id, kind, payload, status: events.append(status))
+    queue.start()
+    queue.enqueue("lead", {"email": "a@example.com"})
+    wait_for(lambda: "done" in events)
+    assert events == ["retrying", "retrying", "done"]
+    assert calls == [{"email": "a@example.com"}] * 3
+    assert statuses(queue) == {"pending": 0, "running": 0, "done": 1, "dead": 0}
+    assert queue.stats()["failures"] == 2
+
+
+def test_job_is_dead_lettered_after_max_attempts_and_can_be_retried(make_queue):
+    queue = make_queue(max_attempts=2)
+    fail = threading.Event()
+    fail.set()
+
+    def handler(payload):
+        if fail.is_set():
+            raise RuntimeError("bad payload")
+
+    queue.register("lead", handler)
+    queue.start()
+    job_id = queue.enqueue("lead", {})
+    wait_for(lambda: queue.stats()["dead"] == 1)
+    row = sqlite3.connect(queue.path).execute("SELECT attempts, last_error FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    assert row == (2, "RuntimeError: bad payload")
+
+    fail.clear()
+    assert queue.retry_dead() == 1
+    wait_for(lambda: queue.stats()["done"] == 1)
+
+
+def test_interrupted_jobs_run_again_after_a_restart(make_queue):
+    crashed = make_queue()
+    job_id = crashed.enqueue("lead", {"email": "a@example.com"})
+    with crashed._lock:
+        assert crashed._claim()[0] == job_id # claimed, then the process died mid-job
+    assert statuses(crashed)["running"] == 1
+
+    restarted = make_queue()
+    done = []
+    restarted.register("lead", done.append)
+    restarted.start()
+    wait_for(lambda: done)
+    assert done == [{"email": "a@example.com"}]
+    assert statuses(restarted) == {"pending": 0, "running": 0, "done": 1, "dead": 0}
+
+
+def test_prune_deletes_old_done_jobs_only(make_queue):
+    queue = make_queue(retention_hours=1)
+    old_done, new_done, old_dead, pending = (queue.enqueue("lead", {}) for _ in range(4))
+    db = queue._connect()
+    now = time.time()
+    db.execute("UPDATE jobs SET status = 'done', finished_at = ? WHERE id = ?", (now - 7200, old_done))
+    db.execute("UPDATE jobs SET status = 'done', finished_at = ? WHERE id = ?", (now - 60, new_done))
+    db.execute("UPDATE jobs SET status = 'dead', finished_at = ? WHERE id = ?", (now - 7200, old_dead))
+    with queue._lock:
+        assert queue.prune(now) == 1
+    remaining = [row[0] for row in db.execute("SELECT id FROM jobs ORDER BY id")]
+    assert remaining == [new_done, old_dead, pending]
+    assert queue.stats()["pruned"] == 1
+
+
+def test_partial_failure_narrows_the_retry(make_queue):
+    queue = make_queue()
+    payloads = []
+
+    def send(payload):
+        payloads.append(payload)
+        if len(payloads) == 1:
+            raise PartialFailure("sales email failed", {**payload, "pending": ["sales"]})
+
+    queue.register("lead", send)
+    queue.start()
+    queue.enqueue("lead", {"email": "a@example.com"})
+    wait_for(lambda: queue.stats()["done"] == 1)
+    assert payloads == [{"email": "a@example.com"}, {"email": "a@example.com", "pending": ["sales"]}]
@@ -0,0 +1,125 @@
+import pytest
+
+import main
+from jobqueue import PartialFailure
+from utils import FAILED, REJECTED, SENT
+
+LEAD = {"contact_person": "Asha", "company": "Acme", "email": "asha@example.com", "division": "Packaging",
+        "lead_id": "0123456789abcdef"}
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    """Sent messages by receiver; set outbox.refuse[receiver] to a status to have Mailjet answer with it."""
+    class Outbox(list):
+        pass
+
+    sent = Outbox()
+    sent.refuse = {}
+
+    def send_emails(messages):
+        statuses = []
+        for message in messages:
+            receiver = message["To"][0]["Email"]
+            status = sent.refuse.get(receiver, SENT)
+            if status == SENT:
+                sent.append(receiver)
+            statuses.append(status)
+        return statuses
+
+    monkeypatch.setattr(main, "send_emails", send_emails)
+    monkeypatch.setattr(main, "render_pdf", lambda name, *args, **kwargs: b"%PDF-1.4")
+    monkeypatch.setattr(main, "ARCHIVE_INQUIRIES", False)
+    return sent
+
+
+def test_lead_sends_the_acknowledgement_and_the_sales_alert(outbox):
+    main.process_lead_and_send_email(dict(LEAD))
+    assert outbox == ["asha@example.com", main.SALES_TEAM_EMAIL]
+
+
+def test_rejected_acknowledgement_does_not_hold_up_the_sales_alert(outbox):
+    outbox.refuse["asha@example.com"] = REJECTED
+    main.process_lead_and_send_email(dict(LEAD)) # not retried: the address is bad
+    assert outbox == [main.SALES_TEAM_EMAIL]
+
+
+def test_retry_only_resends_what_failed(outbox):
+    outbox.refuse[main.SALES_TEAM_EMAIL] = FAILED
+    with pytest.raises(PartialFailure) as e:
+        main.process_lead_and_send_email(dict(LEAD))
+    assert e.value.payload == {**LEAD, "pending_emails": ["sales"]}
+    assert outbox == ["asha@example.com"]
+
+    outbox.refuse.clear()
+    main.process_lead_and_send_email(e.value.payload)
+    assert outbox == ["asha@example.com", main.SALES_TEAM_EMAIL]
+
+
+def test_sales_email_attaches_the_drawing_under_its_original_name(outbox, tmp_path, monkeypatch):
+    stored = tmp_path / "9f86d0.dwg"
+    stored.write_bytes(b"dwg data")
+    attached = []
+    monkeypatch.setattr(main, "drawing_path", lambda name: str(stored) if name == "9f86d0.dwg" else None)
+    real_build_message = main.build_message
+
+    def build_message(receiver_email, subject, body, attachment_paths=None, attachments=None):
+        message = real_build_message(receiver_email, subject, body, attachment_paths, attachments)
+        attached.extend(a["Filename"] for a in message["Attachments"])
+        return message
+
+    monkeypatch.setattr(main, "build_message", build_message)
+    main.process_lead_and_send_email({**LEAD, "drawing_file": "9f86d0.dwg", "drawing_filename": "Bracket Rev C.dwg"})
+    assert "Bracket Rev C.dwg" in attached
+
+
+def test_warm_up_leaves_the_pool_to_the_first_lead(monkeypatch):
+    import attachments
+    attachments.shutdown_pool()
+    main.warm_up()
+    assert attachments._pool is None
+
+
+def test_dead_jobs_are_retried_through_the_admin_endpoint(monkeypatch):
+    from fastapi.testclient import TestClient
+    from jobqueue import JobQueue
+
+    queue = JobQueue(":memory:")
+    monkeypatch.setattr(main, "lead_queue", queue)
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    job_id = queue.enqueue("lead", dict(LEAD))
+    queue._connect().execute("UPDATE jobs SET status = 'dead', attempts = 5 WHERE id = ?", (job_id,))
+
+    client = TestClient(main.app)
+    assert client.post("/queue/retry_dead").status_code == 401
+    assert client.post("/queue/retry_dead", headers={"X-Admin-Token": "wrong"}).status_code == 401
+    response = client.post("/queue/retry_dead", headers={"X-Admin-Token": "secret"})
+    assert response.json() == {"retried": 1}
+    assert queue.stats()["pending"] == 1 and queue.stats()["dead"] == 0
+
+
+def test_socket_hears_a_lead_that_is_done_before_the_turn_returns(monkeypatch):
+    from fastapi.testclient import TestClient
+    from starlette.concurrency import run_in_threadpool
+
+    class InstantQueue:
+        # The worker finishes the job before enqueue even returns
+        def enqueue(self, kind, payload):
+            main.push_lead_status(1, kind, payload, "done")
+            return 1
+
+    async def session_turn(session, user_input, idempotency_key=None, client="unknown", on_lead=None):
+        lead_id = await run_in_threadpool(main.submit_lead, dict(LEAD), on_lead)
+        return main.ChatResponse(next_stage="post_engagement", bot_messages=["Thanks!"]), lead_id
+
+    monkeypatch.setattr(main, "lead_queue", InstantQueue())
+    monkeypatch.setattr(main, "lead_index", type("Index", (), {"add": lambda self, user_details: 7})())
+    monkeypatch.setattr(main, "session_turn", session_turn)
+
+    with TestClient(main.app).websocket_connect("/ws/chat") as socket:
+        assert socket.receive_json()["type"] == "session"
+        socket.send_json({"user_input": "Submit"})
+        frames = [socket.receive_json() for _ in range(4)]
+    assert [frame["type"] for frame in frames] == ["message", "turn", "lead_status", "lead_status"]
+    assert [frame["status"] for frame in frames[2:]] == ["queued", "done"]
+    assert main.lead_watchers == {}
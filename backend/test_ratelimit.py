@@ -0,0 +1,126 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import ratelimit
+from ratelimit import RateLimited, RateLimits, TokenBucketLimiter, client_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_a_burst_then_says_how_long_to_wait():
+    limiter = TokenBucketLimiter(3, 60, clock=FakeClock()) # one token every 20s
+    assert [limiter.acquire("a") for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("a") == pytest.approx(20)
+    assert limiter.rejected == 1
+
+
+def test_bucket_refills_over_the_period_up_to_capacity():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(3, 60, clock=clock)
+    for _ in range(3):
+        limiter.acquire("a")
+    clock.now = 10
+    assert limiter.acquire("a") == pytest.approx(10) # half a token so far
+    clock.now = 20
+    assert limiter.acquire("a") == 0
+    clock.now = 1000 # long idle: back to a full bucket, not more
+    assert [limiter.acquire("a") for _ in range(4)][-1] == pytest.approx(20)
+
+
+def test_rejected_request_spends_nothing():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(2, 60, clock=clock)
+    limiter.acquire("a", cost=2)
+    assert limiter.acquire("a", cost=2) == pytest.approx(60)
+    clock.now = 30
+    assert limiter.acquire("a") == 0 # the rejected attempt didn't take the refilled token
+
+
+def test_buckets_are_per_key_and_capped_lru():
+    limiter = TokenBucketLimiter(1, 60, max_keys=2, clock=FakeClock())
+    limiter.acquire("a")
+    limiter.acquire("b")
+    assert limiter.acquire("b") > 0
+    limiter.acquire("c") # evicts "a", the least recently used
+    assert len(limiter) == 2
+    assert limiter.acquire("a") == 0 # a fresh bucket
+
+
+def test_rate_limits_raise_with_retry_after():
+    limits = RateLimits({"lead": "1/3600"}, enabled=True)
+    limits.check("lead", "a")
+    with pytest.raises(RateLimited) as e:
+        limits.check("lead", "a")
+    assert e.value.budget == "lead" and e.value.retry_after > 3500
+    RateLimits({"lead": "1/3600"}, enabled=False).check("lead", "a") # disabled: never raises
+
+
+# --- client_key ---
+def request(forwarded=None, host="10.0.0.1"):
+    headers = {"x-forwarded-for": forwarded} if forwarded else {}
+    return SimpleNamespace(headers=headers, client=SimpleNamespace(host=host))
+
+
+def test_client_key_without_a_proxy_is_the_peer():
+    assert client_key(request(), hops=1) == "10.0.0.1"
+    assert client_key(request("6.6.6.6"), hops=0) == "10.0.0.1"
+
+
+def test_client_key_ignores_entries_the_client_supplied():
+    # The visitor sent "X-Forwarded-For: 6.6.6.6"; the load balancer appended their real address
+    assert client_key(request("6.6.6.6, 203.0.113.7"), hops=1) == "203.0.113.7"
+    assert client_key(request("6.6.6.6, 203.0.113.7, 10.0.0.2"), hops=2) == "203.0.113.7"
+    assert client_key(request("203.0.113.7"), hops=3) == "203.0.113.7"
+
+
+@pytest.mark.parametrize("env, hops", [
+    ({}, 0),
+    ({"RENDER": "true"}, 1),
+    ({"RENDER": "true", "TRUSTED_PROXY_HOPS": "2"}, 2),
+    ({"RENDER": "true", "TRUST_PROXY_HEADERS": "0"}, 0),
+    ({"TRUST_PROXY_HEADERS": "1"}, 1),
+])
+def test_trusted_proxy_hops_from_the_environment(monkeypatch, env, hops):
+    for name in ("RENDER", "TRUSTED_PROXY_HOPS", "TRUST_PROXY_HEADERS"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    assert ratelimit._trusted_proxy_hops() == hops
+
+
+# --- session rollback ---
+def test_throttled_submission_keeps_the_session_at_get_email(monkeypatch):
+    import main
+    from idempotency import SubmissionCache
+    from sessions import Session
+
+    leads = []
+    monkeypatch.setattr(main, "rate_limits", RateLimits({"lead": "1/3600"}, enabled=True))
+    monkeypatch.setattr(main, "submissions", SubmissionCache())
+    monkeypatch.setattr(main, "submit_lead", lambda user_details, on_lead=None: leads.append(user_details) or len(leads))
+
+    def at_get_email(contact_person):
+        session = Session(contact_person)
+        session.stage = "get_email"
+        session.user_details = {"contact_person": contact_person, "stage_history": ["get_name", "get_phone"]}
+        return session
+
+    first = at_get_email("Asha")
+    asyncio.run(main.session_turn(first, "asha@example.com", client="1.2.3.4"))
+    assert first.stage == "post_engagement" and len(leads) == 1
+
+    second = at_get_email("Ravi")
+    before = {**second.user_details, "stage_history": list(second.user_details["stage_history"])}
+    with pytest.raises(RateLimited):
+        asyncio.run(main.session_turn(second, "ravi@example.com", client="1.2.3.4"))
+    assert second.stage == "get_email"
+    assert second.user_details == before
+    assert len(leads) == 1
@@ -0,0 +1,20 @@
+import pytest
+
+from stages import run_stage
+
+
+@pytest.mark.parametrize("text, stored, original", [
+    ("Uploaded: 9f86d0.pdf (Part 7 (rev B).pdf)", "9f86d0.pdf", "Part 7 (rev B).pdf"),
+    ("Uploaded: 9f86d0.pdf", "9f86d0.pdf", "9f86d0.pdf"), # older clients only send the stored name
+])
+def test_upload_stage_keeps_the_original_filename(text, stored, original):
+    result = run_stage("upload_drawing_stage", text, {'stage_history': []})
+    assert result.next_stage == "get_quantity"
+    assert (result.user_details["drawing_file"], result.user_details["drawing_filename"]) == (stored, original)
+
+
+@pytest.mark.parametrize("text", ["Uploaded:", "here is my drawing"])
+def test_upload_stage_asks_again_without_an_upload(text):
+    result = run_stage("upload_drawing_stage", text, {'stage_history': []})
+    assert result.next_stage == "upload_drawing_stage"
+    assert "drawing_file" not in result.user_details
@@ -0,0 +1,92 @@
+import pytest
+
+import utils
+from utils import FAILED, REJECTED, SENT, build_message, send_emails
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+        self.text = str(body)
+
+    def json(self):
+        if self.body is None:
+            raise ValueError("no JSON")
+        return self.body
+
+
+class FakeMailjet:
+    """Answers each post with the next response, recording who each call was addressed to."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def post(self, url, auth, json, timeout):
+        self.calls.append([m["To"][0]["Email"] for m in json["Messages"]])
+        return self.responses.pop(0)
+
+
+def success():
+    return {"Status": "success"}
+
+def error(status_code):
+    return {"Status": "error", "Errors": [{"ErrorCode": "mj-0013", "StatusCode": status_code, "ErrorMessage": "nope"}]}
+
+
+@pytest.fixture
+def mailjet(monkeypatch):
+    monkeypatch.setenv("MAILJET_API_KEY", "key")
+    monkeypatch.setenv("MAILJET_SECRET_KEY", "secret")
+    monkeypatch.setattr(utils.time, "sleep", lambda seconds: None)
+
+    def serve(*responses):
+        session = FakeMailjet(*responses)
+        monkeypatch.setattr(utils, "_mailjet_session", lambda: session)
+        return session
+
+    return serve
+
+
+MESSAGES = [build_message("client@example.com", "Ack", "Hi"), build_message("sales@example.com", "Lead", "New lead")]
+
+
+def test_all_messages_sent(mailjet):
+    session = mailjet(FakeResponse(200, {"Messages": [success(), success()]}))
+    assert send_emails(MESSAGES) == [SENT, SENT]
+    assert len(session.calls) == 1
+
+
+def test_rejected_message_does_not_fail_or_resend_the_others(mailjet):
+    session = mailjet(FakeResponse(400, {"Messages": [error(400), success()]}))
+    assert send_emails(MESSAGES) == [REJECTED, SENT]
+    assert len(session.calls) == 1
+
+
+def test_only_failed_messages_are_retried(mailjet):
+    session = mailjet(
+        FakeResponse(400, {"Messages": [success(), error(503)]}),
+        FakeResponse(200, {"Messages": [success()]}),
+    )
+    assert send_emails(MESSAGES) == [SENT, SENT]
+    assert session.calls == [["client@example.com", "sales@example.com"], ["sales@example.com"]]
+
+
+def test_whole_call_failures_are_retried_then_reported(mailjet, monkeypatch):
+    monkeypatch.setattr(utils, "MAILJET_RETRIES", 1)
+    session = mailjet(FakeResponse(503), FakeResponse(503))
+    assert send_emails(MESSAGES) == [FAILED, FAILED]
+    assert len(session.calls) == 2
+
+
+def test_bad_credentials_are_not_retried(mailjet):
+    session = mailjet(FakeResponse(401, {"ErrorMessage": "API key authentication/authorization failure"}))
+    assert send_emails(MESSAGES) == [FAILED, FAILED]
+    assert len(session.calls) == 1
+
+
+def test_missing_keys_send_nothing(monkeypatch):
+    monkeypatch.delenv("MAILJET_API_KEY", raising=False)
+    assert send_emails(MESSAGES) == [FAILED, FAILED]
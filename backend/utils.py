@@ -1,23 +1,135 @@
 import os
-import requests
+import random
+import re
+import threading
+import time
+import hashlib
+from collections import OrderedDict
 import base64
 
-def send_email_with_attachment(receiver_email, subject, body, attachment_paths=None):
-    # Load keys
-    api_key = os.getenv("MAILJET_API_KEY")
-    api_secret = os.getenv("MAILJET_SECRET_KEY")
-    sender_email = os.getenv("EMAIL_ADDRESS") # Your verified Mailjet email
+from metrics import EMAIL_SEND_SECONDS
+from profiling import profiler
 
-    if not api_key or not api_secret:
-        print("[X] Error: Mailjet Keys are missing.")
-        return False
+MAILJET_URL = "https://api.mailjet.com/v3.1/send"
+MAILJET_TIMEOUT = float(os.getenv("MAILJET_TIMEOUT", "20")) # seconds, per attempt
+MAILJET_MAX_CONCURRENCY = int(os.getenv("MAILJET_MAX_CONCURRENCY", "4"))
+MAILJET_RETRIES = int(os.getenv("MAILJET_RETRIES", "3"))
+MAILJET_RETRY_BASE = 1.0 # seconds
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# One keep-alive session shared by every sender thread; the semaphore caps
+# in-flight calls so a burst of leads cannot open unbounded connections.
+_session = None
+_session_lock = threading.Lock()
+_send_slots = threading.BoundedSemaphore(MAILJET_MAX_CONCURRENCY)
+
+def _mailjet_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            # requests is imported here so a cold start doesn't pay for it until the first lead
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAILJET_MAX_CONCURRENCY))
+            _session = session
+    return _session
+
+# --- ATTACHMENT ENCODING CACHE ---
+ATTACHMENT_CACHE_BYTES = int(float(os.getenv("ATTACHMENT_CACHE_MB", "64")) * 1024 * 1024)
+ENCODE_CHUNK_BYTES = 3 * 256 * 1024 # multiple of 3, so chunk encodings concatenate cleanly
+
+class EncodedAttachmentCache:
+    """Base64 payloads of attachment files, keyed by content hash, evicted LRU by total size."""
+
+    def __init__(self, max_bytes=ATTACHMENT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
 
-    url = "https://api.mailjet.com/v3.1/send"
-    auth = (api_key, api_secret)
+    def encoded(self, path):
+        key = content_hash(path)
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return payload
+            self.misses += 1
 
+        payload = encode_file(path)
+        if len(payload) <= self.max_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = payload
+                    self.current_bytes += len(payload)
+                while self.current_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.current_bytes -= len(evicted)
+                    self.evictions += 1
+        return payload
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+def content_hash(path):
+    # Uploaded drawings are already stored under their SHA-256, and prepared drawings
+    # under that of their upload plus the settings that produced them (see attachments.py)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if re.fullmatch(r"[0-9a-f]{64}(-[0-9a-z]+)?", stem):
+        return stem
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(ENCODE_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def encode_file(path):
+    # Encode chunk by chunk so the raw file is never held in memory next to its encoding
+    parts = []
+    with open(path, "rb") as f:
+        while chunk := f.read(ENCODE_CHUNK_BYTES):
+            parts.append(base64.b64encode(chunk).decode('ascii'))
+    return "".join(parts)
+
+attachment_cache = EncodedAttachmentCache()
+
+def guess_mime_type(filename):
+    # Simple mime type guess
+    name = filename.lower()
+    if name.endswith(".pdf"): return "application/pdf"
+    if name.endswith(".png"): return "image/png"
+    if name.endswith(".jpg") or name.endswith(".jpeg"): return "image/jpeg"
+    return "application/octet-stream"
+
+def build_message(receiver_email, subject, body, attachment_paths=None, attachments=None):
+    """Build one Mailjet v3.1 message.
+
+    attachment_paths are files read from disk, given as a path or a (filename, path)
+    pair; attachments are in-memory (filename, bytes) pairs, e.g. a PDF rendered
+    straight from create_sales_pdf.
+    """
     # Base64 encode the attachments
-    attachments = []
-    
+    encoded_attachments = []
+    for filename, content in attachments or []:
+        encoded_attachments.append({
+            "ContentType": guess_mime_type(filename),
+            "Filename": filename,
+            "Base64Content": base64.b64encode(content).decode('ascii')
+        })
+
     # helper to handle single path or list
     paths = []
     if attachment_paths:
@@ -25,59 +137,127 @@ def send_email_with_attachment(receiver_email, subject, body, attachment_paths=N
             paths = [attachment_paths]
         elif isinstance(attachment_paths, list):
             paths = attachment_paths
-            
+
     for path in paths:
+        filename, path = path if isinstance(path, tuple) else (path and os.path.basename(path), path)
         if path and os.path.exists(path):
             try:
-                with open(path, "rb") as f:
-                    encoded_file = base64.b64encode(f.read()).decode('utf-8')
-                
-                # Simple mime type guess
-                mime = "application/octet-stream"
-                if path.lower().endswith(".pdf"): mime = "application/pdf"
-                elif path.lower().endswith(".png"): mime = "image/png"
-                elif path.lower().endswith(".jpg") or path.lower().endswith(".jpeg"): mime = "image/jpeg"
-                
-                attachments.append({
-                    "ContentType": mime,
-                    "Filename": os.path.basename(path),
+                encoded_file = attachment_cache.encoded(path)
+
+                encoded_attachments.append({
+                    "ContentType": guess_mime_type(filename),
+                    "Filename": filename,
                     "Base64Content": encoded_file
                 })
             except Exception as e:
                 print(f"[!] Error preparing attachment {path}: {e}")
 
-    # Mailjet JSON Payload
-    data = {
-        "Messages": [
+    return {
+        "From": {
+            "Email": os.getenv("EMAIL_ADDRESS"), # Your verified Mailjet email
+            "Name": "DM Thermoformer AI"
+        },
+        "To": [
             {
-                "From": {
-                    "Email": sender_email,
-                    "Name": "DM Thermoformer AI"
-                },
-                "To": [
-                    {
-                        "Email": receiver_email
-                    }
-                ],
-                "Subject": subject,
-                "HTMLPart": f"<p>{body.replace(chr(10), '<br>')}</p>",
-                "Attachments": attachments
+                "Email": receiver_email
             }
-        ]
+        ],
+        "Subject": subject,
+        "HTMLPart": f"<p>{body.replace(chr(10), '<br>')}</p>",
+        "Attachments": encoded_attachments
     }
 
+# Outcome of each message in a send_emails call
+SENT = "sent"
+REJECTED = "rejected" # Mailjet refused this message (e.g. an invalid address); resending won't help
+FAILED = "failed" # not accepted, but worth retrying later (outage, throttling, bad credentials)
+
+def _message_statuses(response, count):
+    """Per-message outcome from a Mailjet v3.1 response, or None if it doesn't report one per message."""
     try:
-        print(f"[*] Sending email via Mailjet API to {receiver_email}...")
-        response = requests.post(url, auth=auth, json=data)
-        
-        if response.status_code == 200:
-            print(f"[+] Email sent successfully! Response: {response.json()['Messages'][0]['Status']}")
-            return True
-        else:
-            print(f"[-] Failed to send email. Status: {response.status_code}")
-            print(f"Error Response: {response.text}")
-            return False
-            
-    except Exception as e:
-        print(f"[-] API Request Failed: {e}")
-        return False
\ No newline at end of file
+        results = response.json().get('Messages')
+    except ValueError:
+        return None
+    if not isinstance(results, list) or len(results) != count:
+        return None
+    statuses = []
+    for result in results:
+        if result.get('Status') == "success":
+            statuses.append(SENT)
+            continue
+        codes = [error.get('StatusCode') for error in result.get('Errors', [])]
+        statuses.append(FAILED if not codes or any(code in RETRYABLE_STATUS for code in codes) else REJECTED)
+        print(f"[-] Mailjet did not accept the email to {result.get('To', '?')}: {result.get('Errors')}")
+    return statuses
+
+@profiler.profiled("email")
+def send_emails(messages):
+    """Send several messages in a single Mailjet API call.
+
+    Returns one of SENT, REJECTED or FAILED per message. Mailjet accepts or
+    refuses each message on its own, so retries only resend the ones that failed.
+    """
+    statuses = [FAILED] * len(messages)
+    # Load keys
+    api_key = os.getenv("MAILJET_API_KEY")
+    api_secret = os.getenv("MAILJET_SECRET_KEY")
+
+    if not api_key or not api_secret:
+        print("[X] Error: Mailjet Keys are missing.")
+        return statuses
+
+    session = _mailjet_session()
+    import requests
+
+    pending = list(range(len(messages)))
+    for attempt in range(MAILJET_RETRIES + 1):
+        retry_after = None
+        outcome = "network_error"
+        started = time.perf_counter()
+        batch = [messages[i] for i in pending]
+        receivers = ", ".join(m["To"][0]["Email"] for m in batch)
+        try:
+            print(f"[*] Sending {len(batch)} email(s) via Mailjet API to {receivers}...")
+            with _send_slots:
+                response = session.post(
+                    MAILJET_URL,
+                    auth=(api_key, api_secret),
+                    json={"Messages": batch},
+                    timeout=MAILJET_TIMEOUT
+                )
+
+            outcome = "sent" if response.status_code == 200 else f"http_{response.status_code}"
+            # A call with a refused message comes back as 400, but the other messages in it were still sent
+            results = _message_statuses(response, len(batch))
+            if results is None and response.status_code == 200:
+                results = [SENT] * len(batch)
+            if results is None:
+                print(f"[-] Failed to send email. Status: {response.status_code}")
+                print(f"Error Response: {response.text}")
+                if response.status_code not in RETRYABLE_STATUS:
+                    return statuses
+                retry_after = response.headers.get("Retry-After")
+            else:
+                for i, status in zip(pending, results):
+                    statuses[i] = status
+                pending = [i for i in pending if statuses[i] == FAILED]
+                if not pending:
+                    print(f"[+] Email sent! Statuses: {statuses}")
+                    return statuses
+                retry_after = response.headers.get("Retry-After")
+
+        except requests.RequestException as e:
+            print(f"[-] API Request Failed: {e}")
+        finally:
+            EMAIL_SEND_SECONDS.observe(time.perf_counter() - started, outcome)
+
+        if attempt < MAILJET_RETRIES:
+            # Exponential backoff with full jitter, unless Mailjet told us how long to wait
+            delay = MAILJET_RETRY_BASE * 2 ** attempt
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else random.uniform(0, delay)
+            time.sleep(delay)
+
+    return statuses
+
+def send_email_with_attachment(receiver_email, subject, body, attachment_paths=None, attachments=None):
+    return send_emails([build_message(receiver_email, subject, body, attachment_paths, attachments)]) == [SENT]
@@ -269,6 +269,15 @@ export default function ChatWidget() {
 
     } catch (error) {
       console.error(error);
+      if (error.response?.status === 429) {
+        const wait = error.response.headers['retry-after'];
+        setMessages(prev => [...prev, {
+          role: 'assistant',
+          content: `⏳ You're sending messages a little too quickly. Please try again${wait ? ` in ${wait} seconds` : ' shortly'}.`
+        }]);
+        setIsLoading(false);
+        return;
+      }
       setMessages(prev => [...prev, {
         role: 'assistant',
         content: `⚠️ **Connection Error**\n\nI couldn't reach the server at: \`${API_URL}\`\n\n**Please check:**\n1. Is your Render backend active?\n2. Did you set the \`VITE_API_URL\` correctly in Render settings?`
@@ -354,9 +363,10 @@ export default function ChatWidget() {
     setMessages(prev => [...prev, { role: 'assistant', content: `Uploading **${file.name}**...` }]);
     setIsLoading(true);
     try {
-      await axios.post(`${API_URL}${uiElements.upload_to}`, formData);
+      const { data } = await axios.post(`${API_URL}${uiElements.upload_to}`, formData);
       setTimeout(() => {
-        handleSendMessage(`Uploaded: ${file.name}`, 'file');
+        // The server stores drawings under their content hash; send that name back, with the original for the sales email
+        handleSendMessage(`Uploaded: ${data.filename} (${data.original_filename || file.name})`, 'file', `Uploaded: ${file.name}`);
         setIsLoading(false);
       }, 2000);
     } catch (e) {